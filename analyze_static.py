@@ -1,88 +1,104 @@
-import pandas as pd
-
-from topk.static import diverse_top_k
+from topk.dataset import load_dataset
+from topk.experiments import run_experiments
 from topk.online import online_diverse_selection
+from topk.simulation import estimate_online
+from topk.static import diverse_top_k, diverse_top_k_many, diverse_top_k_sweep
+from topk.stats import SelectionStats
 import topk.diversity_metrics
 import numpy as np
 import matplotlib.pyplot as plt
 import math
 import random
 
-random.seed(0)
-
 
-def prepare_data(K, constraint_algorithm=topk.diversity_metrics.assign_average_diversity, relaxed=False):
-    # Load the dataset
-    file_path = "astronauts.csv"  # Update this if needed
-    df = pd.read_csv(file_path)
+def dataset_items(dataset):
+    """
+    Items of a Dataset binned on one sensitive column, labelled by the column value instead of a 1-tuple.
 
-    # Step 1: Process the Data
-    # Count the frequency of each undergraduate major
-    major_counts = df['Undergraduate Major'].value_counts()
+    :return: Tuple (list of (score, category, id) tuples, dict {category: number of items})
+    """
+    categories = [category for category, in dataset.categories]
+    items = list(zip(dataset.scores.tolist(), [categories[code] for code in dataset.codes.tolist()],
+                     dataset.ids.tolist()))
+    return items, dict(zip(categories, dataset.counts.tolist()))
 
-    # Select the top 9 most frequent majors
-    top_majors = major_counts.nlargest(9).index.tolist()
 
-    # Create a new category column where less frequent majors are grouped into "Other"
-    df['Major Category'] = df['Undergraduate Major'].apply(lambda x: x if x in top_majors else "Other")
+def prepare_data(K, constraint_algorithm=topk.diversity_metrics.assign_average_diversity, relaxed=False):
+    # Load the dataset, bin all but the top 9 most frequent majors into "Other"
+    dataset = load_dataset("astronauts.csv", "Space Flight (hr)", ["Undergraduate Major"], {"Undergraduate Major": 9})
 
-    # Extract relevant columns (Score, Category, ID)
-    df_filtered = df[['Name', 'Space Flight (hr)', 'Major Category']]
+    # Convert data into tuple format (score, category, id)
+    items, counts = dataset_items(dataset)
 
     # Step 2: Define Diversity Constraints (floor = 1, ceil = min(count, 5))
-    counts = {category: len(category_df) for category, category_df in df.groupby('Major Category')}
     if relaxed:
         diversity_constraints = constraint_algorithm(K, counts, K // math.floor(K * .3))
     else:
         diversity_constraints = constraint_algorithm(K, counts)
-
-    # Convert data into tuple format (score, category, id)
-    items = list(zip(df_filtered['Space Flight (hr)'], df_filtered['Major Category'], df_filtered.index))
     return items, K, diversity_constraints
 
 
-def calc_accuracy(min_val, optimal_sol, sub_optimal):
-    sum1 = 0
-    sum2 = 0
-    for i in range(len(optimal_sol)):
-        sum2 += (optimal_sol[i] - min_val)
-        sum1 += (sub_optimal[i] - min_val)
-    return sum1 / sum2
+# Define warm-up factors
+WARMUP_FACTORS = [1, 0.25, 1 / 16]  # Full (N/e), 1/4 (N/4e), 1/16 (N/16e)
+WARMUP_LABELS = ["Full (N/e)", "1/4 (N/4e)", "1/16 (N/16e)"]
+
+
+def warmup_results(items, K, diversity_constraints, warmup_factors=WARMUP_FACTORS):
+    results = run_experiments(items, K, {"main": diversity_constraints}, warmup_factors, runs=100)
+    accuracy_results = [results["main", factor][0] for factor in warmup_factors]
+    walking_distance_results = [results["main", factor][1] for factor in warmup_factors]
+    return accuracy_results, walking_distance_results
+
+
+def selection_stats(items, K, diversity_constraints, warmup_ratio=1.0, runs=100, seed=0):
+    """
+    Where the selections spend their work: branch, heap and per-category counters and phase timings of the static
+    selection and of `runs` online selections over shuffled arrivals.
+
+    :return: Tuple (static stats, online stats) as dicts, see topk.stats.SelectionStats.as_dict.
+    """
+    static_stats = SelectionStats()
+    diverse_top_k(sorted(items, key=lambda x: x[0], reverse=True), K, diversity_constraints, static_stats)
+
+    online_stats = SelectionStats()
+    rng = random.Random(seed)
+    for _ in range(runs):
+        online_diverse_selection(rng.sample(items, len(items)), K, diversity_constraints, warmup_ratio, online_stats)
+    return static_stats.as_dict(), online_stats.as_dict()
 
 
-def main(items, K, diversity_constraints):
+def warmup_estimates(items, K, diversity_constraints, tolerance=0.01):
+    """
+    Expected accuracy and walking distance of every warm-up factor, see topk.simulation.estimate_online.
+
+    :return: Dict {warm-up factor: estimate}
+    """
+    code_of = {category: code for code, category in enumerate(diversity_constraints)}
+    scores = np.array([score for score, _, _ in items], dtype=float)
+    codes = np.array([code_of[category] for _, category, _ in items])
+    constraints = {code_of[category]: bounds for category, bounds in diversity_constraints.items()}
+    return {factor: estimate_online(scores, codes, K, constraints, factor, tolerance) for factor in WARMUP_FACTORS}
+
+
+def main(items, K, diversity_constraints, report=False):
+    """
+    :param report: Also print the selection stats and the expected accuracy and walking distance of every warm-up
+    factor.
+    """
     print(diversity_constraints)
-    items.sort(reverse=True, key=lambda x: x[0])
-    items_dict = {id_: (score, category) for score, category, id_ in items}
     print(len(items))
+    if report:
+        for name, stats in zip(("static", "online"), selection_stats(items, K, diversity_constraints)):
+            print(name, stats)
+        for label, estimate in zip(WARMUP_LABELS, warmup_estimates(items, K, diversity_constraints).values()):
+            print(label, estimate)
 
-    # Define warm-up factors
-    warmup_factors = [1, 0.25, 1 / 16]  # Full (N/e), 1/4 (N/4e), 1/16 (N/16e)
-    warmup_labels = ["Full (N/e)", "1/4 (N/4e)", "1/16 (N/16e)"]
-    optimal_solution = diverse_top_k(items, K, diversity_constraints)
-    optimal_scores = [items_dict[i][0] for i in optimal_solution]
-    optimal_solution.sort()
-    min_val = min([score for score, _, _ in items])
     # Store results
-    accuracy_results = []
-    walking_distance_results = []
-
-    for factor in warmup_factors:
-        walking_distance_factor = []
-        accuracy_factor = []
-        for run in range(100):
-            random.shuffle(items)
-            selected, walking_distance = online_diverse_selection(items, K, diversity_constraints, factor)
-            if len(selected) < K:
-                continue
-            scores = [items_dict[i][0] for i in selected]
-            accuracy_factor.append(calc_accuracy(min_val, optimal_scores, scores))
-            if accuracy_factor[-1] > 1.0:
-                print(run)
-            walking_distance_factor.append(walking_distance)
-        accuracy_results.append(accuracy_factor)
-        walking_distance_results.append(walking_distance_factor)
+    accuracy_results, walking_distance_results = warmup_results(items, K, diversity_constraints)
+    return plot_warmup_results(accuracy_results, walking_distance_results)
 
+
+def plot_warmup_results(accuracy_results, walking_distance_results):
     # Step 7: Generate three separate graphs for each warm-up strategy
     # Assuming walking_distance_results and accuracy_results are available from previous computations
 
@@ -115,7 +131,7 @@ def main(items, K, diversity_constraints):
         axs[i].set_ylim(bottom=0, top=1.1)  # Ensures y-axis starts from 0
         axs[i].set_xlabel("Walking Distance (Number of Items Examined)")
         axs[i].set_ylabel("Accuracy (Selected Score / Best Possible Score)")
-        axs[i].set_title(f"Warm-Up Strategy: {warmup_labels[i]}")
+        axs[i].set_title(f"Warm-Up Strategy: {WARMUP_LABELS[i]}")
         axs[i].grid(True)
         axs[i].legend()  # Show legend
 
@@ -125,24 +141,39 @@ def main(items, K, diversity_constraints):
 
 
 def main2(inputs: dict[str, tuple[any, any, any]]):
-    constaint_results={}
-    for constraint_name, (items, K, diversity_constraints) in inputs.items():
-        items.sort(reverse=True)
-        items_dict = {id_: (score, category) for score, category, id_ in items}
-        optimal_solution = diverse_top_k(items, K, diversity_constraints)
-        optimal_scores = [items_dict[i][0] for i in optimal_solution]
-        min_val = min([score for score, _, _ in items])
-        accuracies = []
-        walking_distances = []
-        for i in range(100):
-            random.shuffle(items)
-            selected, walking_distance = online_diverse_selection(items, K, diversity_constraints)
-            scores = [items_dict[i][0] for i in selected]
-            accuracies.append(calc_accuracy(min_val, optimal_scores, scores))
-            walking_distances.append(walking_distance)
-        constaint_results[constraint_name]=(accuracies,walking_distances)
-    import matplotlib.pyplot as plt
-
+    """
+    :param inputs: Dict {constraint name: (items, K, diversity_constraints)}, all sharing the same items and K.
+    """
+    for name, (selected, utility) in optimal_results(inputs).items():
+        print(name, utility, selected)
+    return plot_constraint_results(constraint_results(inputs))
+
+
+def constraint_results(inputs: dict[str, tuple[any, any, any]]):
+    items, K, _ = next(iter(inputs.values()))
+    # One experiment grid runs every constraint set on the same arrival orders
+    if any(other_K != K or (other_items is not items and other_items != items)
+           for other_items, other_K, _ in inputs.values()):
+        raise ValueError("all the constraint sets must share the same items and K")
+    results = run_experiments(items, K, {name: dc for name, (_, _, dc) in inputs.items()}, runs=100)
+    return {constraint_name: results[constraint_name, 1.0] for constraint_name in inputs}
+
+
+def optimal_results(inputs: dict[str, tuple[any, any, any]]):
+    """
+    Optimal diverse selection of every constraint set, all answered in one sweep over the sorted items.
+
+    :param inputs: Dict {constraint name: (items, K, diversity_constraints)}
+    :return: Dict {constraint name: (list of selected item IDs, total selected score)}
+    """
+    items = sorted(next(iter(inputs.values()))[0], key=lambda x: x[0], reverse=True)
+    scores = {item_id: score for score, _, item_id in items}
+    selections = diverse_top_k_many(items, [(K, dc) for _, K, dc in inputs.values()])
+    return {name: (selected, sum(scores[item_id] for item_id in selected))
+            for name, selected in zip(inputs, selections)}
+
+
+def plot_constraint_results(constaint_results):
     # Assuming `constaint_results` is already populated with accuracies and walking distances for each constraint
     fig, ax = plt.subplots(figsize=(10, 6))
 
@@ -169,6 +200,35 @@ def main2(inputs: dict[str, tuple[any, any, any]]):
     return fig
 
 
+def k_sweep_results(items, K_max, families=("minimum", "average", "proportion"), t=None, seed=0):
+    """
+    :return: Tuple (Ks, {family: ratios}), ratios the optimal diverse utility over the unconstrained top-K utility
+    for every K from 1 to K_max, NaN for the K a family cannot plan.
+    """
+    top_utilities = np.cumsum(sorted((score for score, _, _ in items), reverse=True)[:K_max])
+    results = {}
+    Ks = None
+    for family in families:
+        Ks, utilities, _ = diverse_top_k_sweep(items, K_max, family, t, seed, selections=False)
+        results[family] = utilities / top_utilities[:len(Ks)]
+    return Ks, results
+
+
+def plot_k_sweep(Ks, results):
+    fig, ax = plt.subplots(figsize=(10, 6))
+    for family, ratios in results.items():
+        # Infeasible K are NaN, leave them out rather than breaking the line at every one
+        feasible = ~np.isnan(ratios)
+        ax.plot(np.asarray(Ks)[feasible], np.asarray(ratios)[feasible], label=family)
+    ax.set_xlabel("K")
+    ax.set_ylabel("Diverse Utility / Top-K Utility")
+    ax.set_title("Price of Diversity by K")
+    ax.set_ylim(bottom=0, top=1.1)
+    ax.legend()
+    ax.grid(True)
+    return fig
+
+
 if __name__ == '__main__':
     main(*prepare_data(K=40))
     plt.show()
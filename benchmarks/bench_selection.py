@@ -0,0 +1,184 @@
+"""
+Scale benchmarks of the static and online selection algorithms and of the constraint assignment functions.
+
+Every case runs in a fresh process so its peak RSS is its own. Results are printed as a table and can be saved as
+JSON and compared against an earlier run:
+
+    python benchmarks/bench_selection.py --n 1000 100000 --d 2 100 --output new.json --compare baseline.json
+"""
+import argparse
+import itertools
+import json
+import math
+import multiprocessing
+import random
+import statistics
+import sys
+import time
+import tracemalloc
+
+try:
+    import resource
+except ImportError:  # Not available on Windows
+    resource = None
+
+import numpy as np
+
+import topk.diversity_metrics as diversity_metrics
+import topk.synthetic as synthetic
+from topk.online import online_diverse_selection
+from topk.static import diverse_top_k
+
+SELECTION_TARGETS = ["diverse_top_k", "online_diverse_selection"]
+
+CONSTRAINT_TARGETS = {
+    "assign_minimum_diversity": (diversity_metrics.assign_minimum_diversity, False),
+    "assign_average_diversity": (diversity_metrics.assign_average_diversity, False),
+    "assign_proportion_diversity": (diversity_metrics.assign_proportion_diversity, False),
+    "assign_relaxed_average_diversity": (diversity_metrics.assign_relaxed_average_diversity, True),
+    "assign_relaxed_proportion_diversity": (diversity_metrics.assign_relaxed_proportion_diversity, True),
+}
+
+
+def make_items(n, d, skew, seed, scores="uniform", order="random"):
+    """
+    :return: Tuple (items in arrival order, counts), see topk.synthetic.generate_chunks.
+    """
+    scores, codes, ids = synthetic.generate(n, d=d, skew=skew, scores=scores, seed=seed)
+    arrival = synthetic.arrival_order(scores, codes, order, seed)
+    items = list(zip(scores[arrival].tolist(), codes[arrival].tolist(), ids[arrival].tolist()))
+    counts = {category: count for category, count in enumerate(np.bincount(codes, minlength=d).tolist())
+              if count > 0}
+    return items, counts
+
+
+def _percentile(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, math.ceil(q / 100 * len(values)) - 1)]
+
+
+def run_case(case):
+    """
+    Times one (target, n, d, k, skew) case, in the calling process.
+    """
+    target, n, d, k, skew, score_distribution, order, repeat, seed, trace_allocations = case
+    record = dict(target=target, n=n, d=d, k=k, skew=skew, scores=score_distribution, order=order)
+    random.seed(seed)
+    items, counts = make_items(n, d, skew, seed, score_distribution, order)
+
+    try:
+        if target in CONSTRAINT_TARGETS:
+            constraint_algorithm, relaxed = CONSTRAINT_TARGETS[target]
+            args = (k, counts, math.floor(k * .3)) if relaxed else (k, counts)
+            function = lambda: constraint_algorithm(*args)
+            # Throughput of the constraint functions is in categories per second
+            units = len(counts)
+        else:
+            diversity_constraints = diversity_metrics.assign_average_diversity(k, counts)
+            if target == "diverse_top_k":
+                items.sort(key=lambda x: x[0], reverse=True)
+                function = lambda: diverse_top_k(items, k, diversity_constraints)
+            else:
+                function = lambda: online_diverse_selection(items, k, diversity_constraints)
+            units = n
+
+        seconds = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            function()
+            seconds.append(time.perf_counter() - start)
+
+        if trace_allocations:
+            tracemalloc.start()
+            function()
+            _, record["peak_alloc_bytes"] = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+    except (IndexError, ValueError) as e:
+        # Some constraint families have no valid assignment for a (k, counts) pair
+        record["error"] = repr(e)
+        return record
+
+    record.update(
+        seconds=seconds,
+        p50=_percentile(seconds, 50),
+        p90=_percentile(seconds, 90),
+        p99=_percentile(seconds, 99),
+        items_per_sec=units / statistics.median(seconds) if statistics.median(seconds) > 0 else float("inf"),
+    )
+    if resource is not None:
+        # Kilobytes on Linux, bytes on macOS
+        record["peak_rss"] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return record
+
+
+def compare(records, baseline, tolerance):
+    """
+    :return: List of (record, baseline record) pairs whose median latency grew by more than `tolerance`.
+    """
+    key = lambda record: (record["target"], record["n"], record["d"], record["k"], record["skew"],
+                          record.get("scores"), record.get("order"))
+    baseline = {key(record): record for record in baseline if "p50" in record}
+    return [(record, baseline[key(record)]) for record in records
+            if "p50" in record and key(record) in baseline
+            and record["p50"] > baseline[key(record)]["p50"] * (1 + tolerance)]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--targets", nargs="+", default=SELECTION_TARGETS + list(CONSTRAINT_TARGETS),
+                        choices=SELECTION_TARGETS + list(CONSTRAINT_TARGETS))
+    parser.add_argument("--n", nargs="+", type=int, default=[10 ** 3, 10 ** 4, 10 ** 5],
+                        help="Numbers of items, up to 10^8 given enough memory.")
+    parser.add_argument("--d", nargs="+", type=int, default=[2, 10, 100], help="Numbers of categories.")
+    parser.add_argument("--k", nargs="+", type=int, default=[10, 100])
+    parser.add_argument("--skew", nargs="+", type=float, default=[0.0, 1.0],
+                        help="Zipf exponents of the category sizes, 0 is uniform.")
+    parser.add_argument("--scores", default="uniform", choices=synthetic.SCORE_DISTRIBUTIONS)
+    parser.add_argument("--order", default="random", choices=synthetic.ARRIVAL_ORDERS,
+                        help="Arrival order of the items given to online_diverse_selection.")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--trace-allocations", action="store_true",
+                        help="Also record peak Python allocations with tracemalloc (slow).")
+    parser.add_argument("--output", help="JSON file the results are written to.")
+    parser.add_argument("--compare", help="JSON results of an earlier run to check for regressions.")
+    parser.add_argument("--tolerance", type=float, default=0.2,
+                        help="Allowed relative growth of the median latency before a case is a regression.")
+    args = parser.parse_args(argv)
+
+    cases = []
+    for target, n, d, k, skew in itertools.product(args.targets, args.n, args.d, args.k, args.skew):
+        if target in CONSTRAINT_TARGETS and n != args.n[0]:
+            continue  # The constraint functions only depend on the category counts
+        cases.append((target, n, d, k, skew, args.scores, args.order, args.repeat, args.seed, args.trace_allocations))
+
+    records = []
+    # A fresh process per case keeps the peak RSS of every case separate
+    with multiprocessing.get_context("spawn").Pool(1, maxtasksperchild=1) as pool:
+        for record in pool.imap(run_case, cases):
+            records.append(record)
+            case = (f"{record['target']:<36} n={record['n']:<10} d={record['d']:<6} k={record['k']:<6} "
+                    f"skew={record['skew']:<4}")
+            if "error" in record:
+                print(case, record["error"])
+            else:
+                print(case, f"p50={record['p50'] * 1e3:10.3f}ms p99={record['p99'] * 1e3:10.3f}ms "
+                            f"{record['items_per_sec']:14.0f}/s rss={record.get('peak_rss')}")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(records, f, indent=1)
+
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare(records, json.load(f), args.tolerance)
+        for record, base in regressions:
+            print(f"REGRESSION {record['target']} n={record['n']} d={record['d']} k={record['k']} "
+                  f"skew={record['skew']}: p50 {base['p50'] * 1e3:.3f}ms -> {record['p50'] * 1e3:.3f}ms")
+        if regressions:
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,18 +1,165 @@
+import hashlib
 import math
+import os
+import tempfile
 
 import pandas as pd
 import streamlit as st
 
-import topk.diversity_metrics
+from analyze_static import WARMUP_FACTORS, WARMUP_LABELS, constraint_results, plot_constraint_results, \
+    plot_warmup_results, warmup_results
+from topk.server import DEFAULT_PORT, connect
+
+# Constraint family of topk.diversity_metrics.ConstraintPlanner, and whether it takes t
+CONSTRAINT_ALGORITHMS: dict[str, tuple[str, bool]] = {
+    "minimum": ("minimum", False),
+    "proportional": ("proportion", False),
+    "average": ("average", False),
+    "relaxed average": ("relaxed_average", True),
+    "relaxed proportional": ("relaxed_proportion", True),
+}
 
-CONSTRAINT_ALGORITHMS: dict[str, tuple[callable, bool]] = {
-    "minimum": (topk.diversity_metrics.assign_minimum_diversity, False),
-    "proportional": (topk.diversity_metrics.assign_proportion_diversity, False),
-    "average": (topk.diversity_metrics.assign_average_diversity, False),
-    "relaxed average": (topk.diversity_metrics.assign_relaxed_average_diversity, True),
-    "relaxed proportional": (topk.diversity_metrics.assign_relaxed_proportion_diversity, True),
+# Comparison mode labels of the constraint algorithms
+COMPARISON_CONSTRAINTS = {
+    "min": "minimum",
+    "average": "average",
+    "proportion": "proportional",
+    "relaxed_average": "relaxed average",
+    "relaxed_proportion": "relaxed proportional",
 }
 
+# Query server of the constraints, optimal selections and online estimates, see topk.server. It only loads files
+# from its data roots: run it from this directory with --data-root . --data-root <UPLOAD_DIR> to serve the bundled
+# datasets and the uploads.
+
+SERVER_URL = os.environ.get("TOPK_SERVER_URL", f"http://127.0.0.1:{DEFAULT_PORT}")
+UPLOAD_DIR = os.environ.get("TOPK_UPLOAD_DIR", os.path.join(tempfile.gettempdir(), "topk-uploads"))
+
+# Cache bounds, old entries are evicted first
+DATASET_CACHE_SIZE = 8
+CONFIGURATION_CACHE_SIZE = 32
+RESULT_CACHE_SIZE = 64
+
+
+def file_fingerprint(path):
+    stat = os.stat(path)
+    return f"{path}:{stat.st_mtime_ns}:{stat.st_size}"
+
+
+@st.cache_data(max_entries=DATASET_CACHE_SIZE)
+def load_csv(path, fingerprint):
+    return pd.read_csv(path)
+
+
+def uploaded_csv_path(content):
+    """
+    The query server reads datasets from files, so uploads are saved in UPLOAD_DIR under their hash.
+    """
+    os.makedirs(UPLOAD_DIR, exist_ok=True)
+    path = os.path.join(UPLOAD_DIR, f"{hashlib.sha1(content).hexdigest()}.csv")
+    if not os.path.exists(path):
+        with open(path, "wb") as f:
+            f.write(content)
+    return path
+
+
+@st.cache_resource
+def query_client():
+    """
+    TopKClient of the server at SERVER_URL (python -m topk.server), or a LocalTopKClient when none is running.
+    """
+    return connect(SERVER_URL)
+
+
+def served_dataset(path, fingerprint, score_column, n_largest_groups):
+    """
+    Loads the binned dataset into the query client, unless it already holds it.
+
+    :return: Tuple (dataset name, list of categories by code)
+    """
+    client = query_client()
+    name = hashlib.sha1(repr((fingerprint, score_column, n_largest_groups)).encode()).hexdigest()
+    description = client.datasets().get(name)
+    if description is None:
+        description = client.load(name, path, score_column, [column for column, _ in n_largest_groups],
+                                  dict(n_largest_groups))
+    return name, [tuple(category) for category in description["categories"]]
+
+
+@st.cache_data(max_entries=CONFIGURATION_CACHE_SIZE)
+def category_counts(_dataframe, fingerprint, column):
+    return _dataframe[column].value_counts()
+
+
+@st.cache_data(max_entries=CONFIGURATION_CACHE_SIZE)
+def bin_categories(_dataframe, fingerprint, score_column, n_largest_groups):
+    """
+    :param n_largest_groups: Tuple of (sensitive column, number of largest groups kept) pairs.
+    :return: Filtered dataframe, with the same bins as the served dataset.
+    """
+    sensitive_columns = [col for col, _ in n_largest_groups]
+    filtered_dataframe = pd.DataFrame()
+    for sensitive_column, n_largest in n_largest_groups:
+        top_categories = category_counts(_dataframe, fingerprint, sensitive_column).nlargest(n_largest)
+        filtered_dataframe[sensitive_column] = _dataframe[sensitive_column].where(
+            _dataframe[sensitive_column].isin(top_categories.index), "Other")
+
+    filtered_dataframe["score"] = _dataframe[score_column]
+    return filtered_dataframe
+
+
+def query_arguments(constraint_name, t):
+    family, relaxed = CONSTRAINT_ALGORITHMS[constraint_name]
+    return family, t if relaxed else None
+
+
+def diversity_constraints_for(dataset, constraint_name, K, t):
+    """
+    :param dataset: Tuple (dataset name, list of categories by code), see served_dataset.
+    :return: Dict {category: (floor, ceil)}
+    """
+    name, categories = dataset
+    bounds = query_client().constraints(name, K, *query_arguments(constraint_name, t))
+    return dict(zip(categories, zip(bounds["floors"], bounds["ceils"])))
+
+
+def dataframe_items(filtered_dataframe):
+    categories = zip(*(filtered_dataframe[col] for col in filtered_dataframe.columns if col != "score"))
+    return list(zip(filtered_dataframe["score"], categories, filtered_dataframe.index))
+
+
+# The simulated runs behind the scatter plots stay in this process, the query server only has their expectations
+@st.cache_data(max_entries=RESULT_CACHE_SIZE)
+def cached_warmup_results(_filtered_dataframe, dataset, K, t, constraint_name, warmup_factors):
+    diversity_constraints = diversity_constraints_for(dataset, constraint_name, K, t)
+    return warmup_results(dataframe_items(_filtered_dataframe), K, diversity_constraints, warmup_factors)
+
+
+@st.cache_data(max_entries=RESULT_CACHE_SIZE)
+def cached_constraint_results(_filtered_dataframe, dataset, K, t, constraint_names):
+    items = dataframe_items(_filtered_dataframe)
+    inputs = {constraint_name: (items, K, diversity_constraints_for(dataset, constraint_name, K, t))
+              for constraint_name in constraint_names}
+    return constraint_results(inputs)
+
+
+def warmup_estimates(dataset, K, t, constraint_name, warmup_factors):
+    """
+    :return: Dict {warm-up factor: expected accuracy and walking distance with their errors}, see
+    topk.simulation.estimate_online.
+    """
+    family, t = query_arguments(constraint_name, t)
+    return {factor: query_client().online(dataset[0], K, family, t, warmup_ratio=factor)
+            for factor in warmup_factors}
+
+
+def optimal_results(dataset, K, t, constraint_names):
+    """
+    :return: Dict {constraint name: optimal selection}, see TopKClient.top_k.
+    """
+    return {constraint_name: query_client().top_k(dataset[0], K, *query_arguments(constraint_name, t))
+            for constraint_name in constraint_names}
+
 
 def number_input(*args, **kwargs):
 
@@ -29,7 +176,7 @@ def number_input(*args, **kwargs):
         return st.number_input(*args, **kwargs)
 
 
-def dataset_configuration(dataframe: pd.DataFrame, default_score=None, default_sensitives=None):
+def dataset_configuration(dataframe: pd.DataFrame, fingerprint, path, default_score=None, default_sensitives=None):
 
     if default_sensitives is None:
         default_sensitives = {}
@@ -45,10 +192,8 @@ def dataset_configuration(dataframe: pd.DataFrame, default_score=None, default_s
         return None
     st.multiselect("Sensitive Columns", [col for col in df_columns if col != st.session_state.score_column], key="sensitive_columns", default=default_sensitives)
 
-    column_category_counts = {col: dataframe[col].value_counts() for col in st.session_state.sensitive_columns}
-
     for sensitive_column in st.session_state.sensitive_columns:
-        max_value = len(column_category_counts[sensitive_column])
+        max_value = len(category_counts(dataframe, fingerprint, sensitive_column))
         if default_sensitives.get(sensitive_column) is not None:
             default_value = default_sensitives.get(sensitive_column)
         else:
@@ -62,20 +207,14 @@ def dataset_configuration(dataframe: pd.DataFrame, default_score=None, default_s
             value=default_value,
         )
 
-    selected_n_largest = {col: st.session_state.get(f"n_largest_groups_{col}")
-                          for col in st.session_state.sensitive_columns}
-    if all(value is not None for value in selected_n_largest.values()):
-        top_category_counts = {col: df.nlargest(selected_n_largest[col]) for col, df in column_category_counts.items()}
-    filtered_dataframe = pd.DataFrame()
-    for sensitive_column in st.session_state.sensitive_columns:
-        filtered_dataframe[sensitive_column] = dataframe[sensitive_column].apply(
-            lambda x: x if x in top_category_counts[sensitive_column] else "Other")
-
-    filtered_dataframe["score"] = dataframe[st.session_state.score_column]
-
-    counts = {category: len(category_df) for category, category_df in filtered_dataframe.groupby(st.session_state.sensitive_columns)}
+    selected_n_largest = tuple((col, st.session_state.get(f"n_largest_groups_{col}"))
+                               for col in st.session_state.sensitive_columns)
+    if any(value is None for _, value in selected_n_largest):
+        return None
 
-    return filtered_dataframe, counts
+    filtered_dataframe = bin_categories(dataframe, fingerprint, st.session_state.score_column, selected_n_largest)
+    dataset = served_dataset(path, fingerprint, st.session_state.score_column, selected_n_largest)
+    return filtered_dataframe, dataset
 
 
 def app():
@@ -87,31 +226,43 @@ def app():
 
     if st.session_state.dataset == "other":
         st.file_uploader("file", type="csv", key="dataset_file")
-        try:
-            other_dataset = pd.read_csv(st.session_state.dataset_file)
-            result = dataset_configuration(other_dataset)
+        # Nothing to configure until a file is uploaded
+        if st.session_state.dataset_file is not None:
+            content = st.session_state.dataset_file.getvalue()
+            path = uploaded_csv_path(content)
+            fingerprint = hashlib.sha1(content).hexdigest()
+            try:
+                result = dataset_configuration(load_csv(path, fingerprint), fingerprint, path)
+            except ValueError as e:
+                # Unreadable CSV or unusable columns, e.g. a non numeric score column
+                st.error(f"Could not use the uploaded file: {e}")
+                result = None
             if result is not None:
-                filtered_dataframe, counts = result
+                filtered_dataframe, dataset = result
                 max_K = len(filtered_dataframe)
-        except ValueError as e:
-            pass
 
 
     if st.session_state.dataset == "nasa":
-        astronauts = pd.read_csv("astronauts.csv")
+        fingerprint = file_fingerprint("astronauts.csv")
+        astronauts = load_csv("astronauts.csv", fingerprint)
         result = dataset_configuration(
             astronauts,
+            fingerprint,
+            "astronauts.csv",
             default_score="Space Flight (hr)",
             default_sensitives={"Undergraduate Major": 9},
         )
         if result is not None:
-            filtered_dataframe, counts = result
+            filtered_dataframe, dataset = result
             max_K = len(filtered_dataframe)
 
     if st.session_state.dataset == "netflix":
-        astronauts = pd.read_csv("datasets/Netflix TV Shows and Movies Binned.csv")
+        fingerprint = file_fingerprint("datasets/Netflix TV Shows and Movies Binned.csv")
+        astronauts = load_csv("datasets/Netflix TV Shows and Movies Binned.csv", fingerprint)
         result = dataset_configuration(
             astronauts,
+            fingerprint,
+            "datasets/Netflix TV Shows and Movies Binned.csv",
             default_score="imdb_score",
             default_sensitives={
                 "age_certification": 7,
@@ -119,18 +270,21 @@ def app():
             },
         )
         if result is not None:
-            filtered_dataframe, counts = result
+            filtered_dataframe, dataset = result
             max_K = len(filtered_dataframe)
 
     if st.session_state.dataset == "sat":
-        astronauts = pd.read_csv("datasets/scores_backup1.csv")
+        fingerprint = file_fingerprint("datasets/scores_backup1.csv")
+        astronauts = load_csv("datasets/scores_backup1.csv", fingerprint)
         result = dataset_configuration(
             astronauts,
+            fingerprint,
+            "datasets/scores_backup1.csv",
             default_score="Average Score (SAT Math)",
             default_sensitives={"City": 10},
         )
         if result is not None:
-            filtered_dataframe, counts = result
+            filtered_dataframe, dataset = result
             max_K = len(filtered_dataframe)
 
 
@@ -144,63 +298,48 @@ def app():
             st.radio("Constraint", CONSTRAINT_ALGORITHMS, key="constraint")
 
 
-            constraint_algorithm, relaxed = CONSTRAINT_ALGORITHMS[st.session_state.constraint]
+            _, relaxed = CONSTRAINT_ALGORITHMS[st.session_state.constraint]
 
+            t = None
             if relaxed:
                 number_input("t", key="t", min_value=0, value=math.floor(st.session_state.K * .3))
-                diversity_constraints = constraint_algorithm(st.session_state.K, counts, st.session_state.t)
-            else:
-                diversity_constraints = constraint_algorithm(st.session_state.K, counts)
-
-            items = list(zip(
-                filtered_dataframe["score"],
-                filtered_dataframe[[col for col in filtered_dataframe.columns if col != "score"]].itertuples(index=False),
-                filtered_dataframe.index)
-            )
-
-            from analyze_static import main
-            fig = main(items, st.session_state.K, diversity_constraints)
+                t = st.session_state.t
+
+            accuracy_results, walking_distance_results = cached_warmup_results(
+                filtered_dataframe, dataset, st.session_state.K, t, st.session_state.constraint,
+                tuple(WARMUP_FACTORS))
+            fig = plot_warmup_results(accuracy_results, walking_distance_results)
             st.pyplot(fig)
+
+            estimates = warmup_estimates(dataset, st.session_state.K, t, st.session_state.constraint, WARMUP_FACTORS)
+            st.write("### Expected Results")
+            st.dataframe(pd.DataFrame(
+                [{"Warm-Up Strategy": label, "Accuracy": estimates[factor]["accuracy"],
+                  "Accuracy ±": estimates[factor]["accuracy_error"],
+                  "Walking Distance": estimates[factor]["walking_distance"],
+                  "Walking Distance ±": estimates[factor]["walking_distance_error"],
+                  "Completion Rate": estimates[factor]["completion_rate"]}
+                 for label, factor in zip(WARMUP_LABELS, WARMUP_FACTORS)]))
+            st.caption("± is the half-width of the 95% confidence interval of each estimate.")
     else:
         if max_K is not None:
             number_input("K", key="K", value=4, step=1, min_value=1, max_value=max_K)
 
-            items = list(zip(
-                filtered_dataframe["score"],
-                filtered_dataframe[[col for col in filtered_dataframe.columns if col != "score"]].itertuples(
-                    index=False),
-                filtered_dataframe.index)
-            )
-
-            constraints_dict = {
-                "min": (topk.diversity_metrics.assign_minimum_diversity, False),
-                "average": (topk.diversity_metrics.assign_average_diversity, False),
-                "proportion": (topk.diversity_metrics.assign_proportion_diversity, False),
-                "relaxed_average": (topk.diversity_metrics.assign_relaxed_average_diversity, True),
-                "relaxed_proportion": (topk.diversity_metrics.assign_relaxed_proportion_diversity, True),
-            }
-
-            inputs = {}
-            for constraint_name, (constraint_algorithm, relaxed) in constraints_dict.items():
-                if relaxed:
-                    diversity_constraints = constraint_algorithm(st.session_state.K, counts,
-                                                                 math.floor(st.session_state.K * .3))
-                else:
-                    diversity_constraints = constraint_algorithm(st.session_state.K, counts)
-
-                items = list(zip(
-                    filtered_dataframe["score"],
-                    filtered_dataframe[[col for col in filtered_dataframe.columns if col != "score"]].itertuples(
-                        index=False),
-                    filtered_dataframe.index)
-                )
-
-                inputs[constraint_name] = items, st.session_state.K, diversity_constraints
-
-            from analyze_static import main2
-            fig = main2(inputs)
+            results = cached_constraint_results(filtered_dataframe, dataset, st.session_state.K,
+                                                math.floor(st.session_state.K * .3),
+                                                tuple(COMPARISON_CONSTRAINTS.values()))
+            fig = plot_constraint_results(
+                {name: results[constraint_name] for name, constraint_name in COMPARISON_CONSTRAINTS.items()})
             st.pyplot(fig)
 
+            optimal = optimal_results(dataset, st.session_state.K, math.floor(st.session_state.K * .3),
+                                      tuple(COMPARISON_CONSTRAINTS.values()))
+            st.write("### Optimal Selections")
+            st.dataframe(pd.DataFrame(
+                [{"Constraint": name, "Utility": optimal[constraint_name]["utility"],
+                  "Selected": ", ".join(map(str, optimal[constraint_name]["ids"]))}
+                 for name, constraint_name in COMPARISON_CONSTRAINTS.items()]))
+
 
 
 if __name__ == '__main__':
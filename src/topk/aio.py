@@ -0,0 +1,108 @@
+import collections
+import time
+
+from topk.online import OnlineDiverseSelector
+
+
+class AsyncDiverseSelector:
+    """
+    OnlineDiverseSelector fed from an async iterator.
+
+    Items are pulled one at a time and only when the consumer asks for the next decision, so a slow consumer slows
+    the source down instead of buffering it (backpressure), and many selections can share one event loop. Nothing
+    is pulled after K items were selected.
+    """
+
+    def __init__(self, K, diversity_constraints, category_count, warmup_ratio=1.0, clock=time.perf_counter,
+                 max_latencies=10_000):
+        """
+        :param K: Number of items to select.
+        :param diversity_constraints: Dict {category: (floor, ceil)}
+        :param category_count: Dict {category: expected number of items in the stream}, exact or estimated.
+        :param warmup_ratio: Fraction of the N/e warm-up period to observe before selecting.
+        :param clock: Function returning the time in seconds, used for the decision latencies.
+        :param max_latencies: Number of most recent decision latencies kept.
+        """
+        self.selector = OnlineDiverseSelector(K, diversity_constraints, category_count, warmup_ratio)
+        self.latencies = collections.deque(maxlen=max_latencies)
+        """Seconds from an item's arrival to its decision, for the last max_latencies items seen"""
+        self._clock = clock
+
+    @property
+    def selected(self):
+        return self.selector.selected
+
+    @property
+    def total_seen(self):
+        return self.selector.total_seen
+
+    @property
+    def done(self):
+        return self.selector.done
+
+    async def decisions(self, source, close_source=True):
+        """
+        Async generator deciding on the items of `source` as they arrive.
+
+        Stops once K items were selected or the source is exhausted. Cancelling the consuming task, or closing the
+        generator early, stops the pulls; the source is then closed too (aclose) unless close_source is False.
+
+        :param source: Async iterable of tuples (score, category, item_id).
+        :param close_source: Whether to close the source when the selection stops.
+        :return: Yields tuples (item_id, accepted).
+        """
+        iterator = source.__aiter__()
+        offer = self.selector.offer
+        clock = self._clock
+        try:
+            while not self.selector.done:
+                try:
+                    score, category, item_id = await iterator.__anext__()
+                except StopAsyncIteration:
+                    break
+                arrival = clock()
+                accepted = offer(score, category, item_id)
+                self.latencies.append(clock() - arrival)
+                yield item_id, accepted
+        finally:
+            if close_source and hasattr(iterator, "aclose"):
+                await iterator.aclose()
+
+    async def run(self, source, close_source=True):
+        """
+        Consumes `source` until the selection is complete.
+
+        :return: Tuple (list of selected item IDs, total_seen), like online_diverse_selection.
+        """
+        decisions = self.decisions(source, close_source)
+        try:
+            async for _ in decisions:
+                pass
+        finally:
+            await decisions.aclose()
+        return self.selected, self.total_seen
+
+
+async def online_diverse_selection_async(source, K, diversity_constraints, category_count, warmup_ratio=1.0):
+    """
+    online_diverse_selection over an async iterable of tuples (score, category, item_id).
+
+    The number of items per category cannot be counted ahead of an open stream, so it is given.
+
+    :param category_count: Dict {category: expected number of items in the stream}
+    :return: Tuple (list of selected item IDs, total_seen)
+    """
+    return await AsyncDiverseSelector(K, diversity_constraints, category_count, warmup_ratio).run(source)
+
+
+async def iterate_queue(queue, sentinel=None):
+    """
+    Async generator over the items put in an asyncio.Queue until `sentinel` is put. A bounded queue
+    (maxsize > 0) makes the producers wait for the selection.
+    """
+    while True:
+        item = await queue.get()
+        queue.task_done()
+        if item is sentinel:
+            return
+        yield item
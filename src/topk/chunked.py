@@ -0,0 +1,121 @@
+import numpy as np
+import pandas as pd
+
+from topk.dataset import to_json
+from topk.sharded import shard_summary
+from topk.static import diverse_top_k_arrays
+
+
+def chunked_diverse_top_k(chunks, K, diversity_constraints):
+    """
+    diverse_top_k over items read chunk by chunk, for data larger than memory.
+
+    The best max(floor, ceil) items of every category seen so far are the only ones the selection can use, so
+    after each chunk only those survive (shard_summary over the survivors and the chunk). The floor-then-slack fill
+    then runs over the survivors. Memory is bounded by the sum of the ceils plus one chunk, and the result equals
+    diverse_top_k on all the items sorted by decreasing score, ties kept in reading order.
+
+    :param chunks: Iterable of tuples (scores, codes, ids) of aligned arrays, in item order.
+    :param K: Total number of items to select.
+    :param diversity_constraints: Dict {category code: (floor, ceil)}
+    :return: Array of selected item IDs, by decreasing score.
+    """
+    scores = np.empty(0, dtype=np.float64)
+    codes = np.empty(0, dtype=np.int64)
+    ids = np.empty(0, dtype=np.int64)
+    for chunk_scores, chunk_codes, chunk_ids in chunks:
+        # Survivors come first, they were read first
+        scores = np.concatenate((scores, np.asarray(chunk_scores, dtype=np.float64)))
+        codes = np.concatenate((codes, np.asarray(chunk_codes, dtype=np.int64)))
+        ids = np.concatenate((ids, np.asarray(chunk_ids)))
+        scores, codes, kept = shard_summary(scores, codes, diversity_constraints)
+        ids = ids[kept]
+
+    return ids[diverse_top_k_arrays(scores, codes, K, diversity_constraints)]
+
+
+def array_chunks(scores, codes, ids=None, chunk_size=1_000_000):
+    """
+    Reads aligned arrays in chunks, e.g. the memory mapped arrays of a cached Dataset, so only one chunk is paged in
+    at a time.
+
+    :param ids: Item IDs, positions by default.
+    :return: Yields tuples (scores, codes, ids).
+    """
+    for start in range(0, len(scores), chunk_size):
+        end = min(start + chunk_size, len(scores))
+        chunk_ids = np.arange(start, end, dtype=np.int64) if ids is None else np.asarray(ids[start:end])
+        yield np.asarray(scores[start:end]), np.asarray(codes[start:end]), chunk_ids
+
+
+def csv_chunks(path, score_column, sensitive_columns, categories, chunk_size=1_000_000, id_column=None,
+               n_largest=None):
+    """
+    Reads a CSV in chunks, encoding the category of every row as its position in `categories`.
+
+    Category labels are tuples with one value per sensitive column, binned like build_dataset: missing values, and
+    the values outside the n_largest most frequent of a column, are "Other". Rows of other categories get code -1
+    and are never selected.
+
+    :param path: CSV file.
+    :param score_column: Column holding the item scores.
+    :param sensitive_columns: Columns defining the categories.
+    :param categories: Sequence of the category labels, e.g. the keys of the diversity constraints.
+    :param chunk_size: Number of rows per chunk.
+    :param id_column: Column holding integer item IDs, row numbers by default.
+    :param n_largest: Dict {sensitive column: number of most frequent values kept}, see build_dataset. The value
+    counts take an extra pass over the file.
+    :return: Yields tuples (scores, codes, ids).
+    """
+    code_of = {tuple(category): code for code, category in enumerate(categories)}
+    kept = _most_frequent(path, sensitive_columns, n_largest or {}, chunk_size)
+    columns = [score_column, *sensitive_columns] + ([id_column] if id_column is not None else [])
+    start = 0
+    for chunk in pd.read_csv(path, usecols=lambda column: column in columns, chunksize=chunk_size):
+        labels = chunk[list(sensitive_columns)].astype(object).where(chunk[list(sensitive_columns)].notna(), "Other")
+        for column, values in kept.items():
+            labels[column] = labels[column].where(chunk[column].isin(values), "Other")
+        # Look up each distinct label of the chunk once
+        label_codes, uniques = pd.MultiIndex.from_frame(labels).factorize()
+        lookup = np.array([code_of.get(tuple(to_json(value) for value in label), -1) for label in uniques],
+                          dtype=np.int64)
+        codes = lookup[label_codes]
+        if id_column is None:
+            ids = np.arange(start, start + len(chunk), dtype=np.int64)
+        else:
+            ids = chunk[id_column].to_numpy(dtype=np.int64)
+        start += len(chunk)
+        yield chunk[score_column].to_numpy(dtype=np.float64), codes, ids
+
+
+def _most_frequent(path, sensitive_columns, n_largest, chunk_size):
+    """
+    :return: Dict {sensitive column: index of the values kept}, for the columns with an n_largest entry.
+    """
+    columns = [column for column in sensitive_columns if n_largest.get(column) is not None]
+    if not columns:
+        return {}
+    # Counts in order of first appearance, so ties are broken as value_counts over the whole column
+    counts = {column: {} for column in columns}
+    for chunk in pd.read_csv(path, usecols=columns, chunksize=chunk_size):
+        for column in columns:
+            for value, count in chunk[column].value_counts(sort=False).items():
+                counts[column][value] = counts[column].get(value, 0) + count
+    return {column: pd.Series(counts[column], dtype=np.int64).sort_values(ascending=False)
+            .nlargest(n_largest[column]).index for column in columns}
+
+
+def chunked_diverse_top_k_csv(path, score_column, sensitive_columns, K, diversity_constraints, chunk_size=1_000_000,
+                              id_column=None, n_largest=None):
+    """
+    chunked_diverse_top_k over a CSV file.
+
+    :param diversity_constraints: Dict {category label: (floor, ceil)}, labels are tuples with one value per
+    sensitive column.
+    :param n_largest: Dict {sensitive column: number of most frequent values kept}, see csv_chunks.
+    :return: List of selected item IDs, by decreasing score.
+    """
+    chunks = csv_chunks(path, score_column, sensitive_columns, list(diversity_constraints), chunk_size, id_column,
+                        n_largest)
+    constraints = dict(enumerate(diversity_constraints.values()))
+    return chunked_diverse_top_k(chunks, K, constraints).tolist()
@@ -0,0 +1,123 @@
+import hashlib
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+from topk.items import ItemStore
+
+CACHE_VERSION = 1
+
+
+class Dataset(ItemStore):
+    """
+    Columnar form of a scored, binned CSV.
+
+    Category labels are tuples with one value per sensitive column, and the arrays are memory mapped when loaded
+    from the cache.
+    """
+
+
+def _file_hash(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def to_json(value):
+    """
+    :return: The value as a plain Python object, numpy scalars such as category labels read by pandas are unwrapped.
+    """
+    return value.item() if isinstance(value, np.generic) else value
+
+
+def build_dataset(dataframe, score_column, sensitive_columns, n_largest=None):
+    """
+    Bins the sensitive columns and encodes every combination of binned values as an integer category code.
+
+    :param dataframe: Source data.
+    :param score_column: Column holding the item scores.
+    :param sensitive_columns: Columns defining the categories.
+    :param n_largest: Dict {sensitive column: number of most frequent values kept}, the other values (and missing
+    values) are binned into "Other". Columns without an entry keep all their values.
+    :return: Dataset
+    """
+    if n_largest is None:
+        n_largest = {}
+
+    binned = pd.DataFrame(index=dataframe.index)
+    for column in sensitive_columns:
+        value_counts = dataframe[column].value_counts()
+        if n_largest.get(column) is not None:
+            value_counts = value_counts.nlargest(n_largest[column])
+        binned[column] = dataframe[column].where(dataframe[column].isin(value_counts.index), "Other")
+
+    codes, uniques = pd.factorize(pd.MultiIndex.from_frame(binned))
+    categories = [tuple(to_json(value) for value in label) for label in uniques]
+
+    return Dataset(
+        scores=dataframe[score_column].to_numpy(dtype=np.float64),
+        codes=codes.astype(np.int32),
+        ids=dataframe.index.to_numpy(dtype=np.int64),
+        categories=categories,
+        counts=np.bincount(codes, minlength=len(categories)).astype(np.int64),
+    )
+
+
+def load_dataset(path, score_column, sensitive_columns, n_largest=None, cache_dir=None):
+    """
+    Loads a CSV as a Dataset, through a binary cache of its columns.
+
+    The cache holds the arrays as .npy files that are memory mapped on load, and is rebuilt only when the content
+    hash of the CSV changes (the hash is only recomputed when its size or modification time changed).
+
+    :param path: CSV file.
+    :param score_column: Column holding the item scores.
+    :param sensitive_columns: Columns defining the categories.
+    :param n_largest: Dict {sensitive column: number of most frequent values kept}, see build_dataset.
+    :param cache_dir: Cache location, defaults to a .topk_cache directory next to the CSV.
+    :return: Dataset
+    """
+    if cache_dir is None:
+        cache_dir = os.path.join(os.path.dirname(os.path.abspath(path)), ".topk_cache")
+    spec = {
+        "version": CACHE_VERSION,
+        "path": os.path.abspath(path),
+        "score_column": score_column,
+        "sensitive_columns": list(sensitive_columns),
+        "n_largest": {column: n_largest[column] for column in sorted(n_largest or {})},
+    }
+    key = hashlib.sha1(json.dumps(spec, sort_keys=True).encode()).hexdigest()
+    directory = os.path.join(cache_dir, key)
+    meta_path = os.path.join(directory, "meta.json")
+    stat = os.stat(path)
+
+    meta = None
+    if os.path.exists(meta_path):
+        with open(meta_path) as f:
+            meta = json.load(f)
+        if (meta["size"], meta["mtime_ns"]) != (stat.st_size, stat.st_mtime_ns):
+            if meta["sha256"] == _file_hash(path):
+                meta.update(size=stat.st_size, mtime_ns=stat.st_mtime_ns)
+                with open(meta_path, "w") as f:
+                    json.dump(meta, f)
+            else:
+                meta = None
+
+    if meta is None:
+        dataset = build_dataset(pd.read_csv(path), score_column, sensitive_columns, n_largest)
+        os.makedirs(directory, exist_ok=True)
+        for name in ("scores", "codes", "ids", "counts"):
+            np.save(os.path.join(directory, f"{name}.npy"), getattr(dataset, name))
+        # The metadata is written last, a cache without it is rebuilt
+        meta = dict(spec, size=stat.st_size, mtime_ns=stat.st_mtime_ns, sha256=_file_hash(path),
+                    categories=dataset.categories)
+        with open(meta_path, "w") as f:
+            json.dump(meta, f)
+
+    arrays = {name: np.load(os.path.join(directory, f"{name}.npy"), mmap_mode="r")
+              for name in ("scores", "codes", "ids", "counts")}
+    return Dataset(categories=[tuple(label) for label in meta["categories"]], **arrays)
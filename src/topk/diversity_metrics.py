@@ -1,13 +1,19 @@
+import collections
+import hashlib
 import random
 import math
+import threading
 
+import numpy as np
 
-def assign_minimum_diversity(K, count_per_category):
+
+def assign_minimum_diversity(K, count_per_category, rng=random):
     """
     Implements the Minimum Diversity Constraint logic.
 
     :param K: Number of items to select.
     :param num_items_category: Dictionary {category: total available items (n_j)}
+    :param rng: Source of the random choices, e.g. random.Random(seed) for reproducible constraints.
     :return: Dictionary {category: (floor, ceil)}
     """
     diversity_constraints = {}
@@ -29,14 +35,14 @@ def assign_minimum_diversity(K, count_per_category):
             eligible_categories = [category for category, count in count_per_category.items() if
                                    count >= diversity_constraints[category][1] + r]
 
-            chosen_category = random.choice(eligible_categories)
+            chosen_category = rng.choice(eligible_categories)
             floor, ceil = diversity_constraints[chosen_category]
             diversity_constraints[chosen_category] = (floor, ceil + 1)
 
     # Case 2: If K < d, select K categories at random and exclude others
     else:
         # Select K random categories to receive floor_i = ceil_i = 1
-        selected_categories = random.sample(list(count_per_category.keys()), K)
+        selected_categories = rng.sample(list(count_per_category.keys()), K)
 
         # Assign constraints
         diversity_constraints = {category: (1, 1) if category in selected_categories else (0, 0) for category in
@@ -45,12 +51,13 @@ def assign_minimum_diversity(K, count_per_category):
     return diversity_constraints
 
 
-def assign_average_diversity(K, num_items_category):
+def assign_average_diversity(K, num_items_category, rng=random):
     """
     Implements the Average Diversity Constraint logic.
 
     :param K: Number of items to select.
     :param num_items_category: Dictionary {category: total available items (n_j)}
+    :param rng: Source of the random choices, e.g. random.Random(seed) for reproducible constraints.
     :return: Dictionary {category: (floor, ceil)}
     """
 
@@ -73,7 +80,7 @@ def assign_average_diversity(K, num_items_category):
             eligible_categories = [category for category, count in num_items_category.items() if
                                    count >= ceil_constraints[category] + r]
 
-            chosen_category = random.choice(eligible_categories)
+            chosen_category = rng.choice(eligible_categories)
             ceil_constraints[chosen_category] += r
 
         # Merge floor and ceil constraints into final dictionary
@@ -82,19 +89,20 @@ def assign_average_diversity(K, num_items_category):
 
     # Case 2: If K < d, assign as per Minimum Diversity
     else:
-        selected_categories = random.sample(list(num_items_category.keys()), K)
+        selected_categories = rng.sample(list(num_items_category.keys()), K)
         diversity_constraints = {category: (1, 1) if category in selected_categories else (0, 0) for category in
                                  num_items_category}
 
     return diversity_constraints
 
 
-def assign_proportion_diversity(K, num_items_category):
+def assign_proportion_diversity(K, num_items_category, rng=random):
     """
     Implements the Proportional Diversity Constraint logic.
 
     :param K: Number of items to select.
     :param num_items_category: Dictionary {category: total available items (n_j)}
+    :param rng: Source of the random choices, e.g. random.Random(seed) for reproducible constraints.
     :return: Dictionary {category: (floor, ceil)}
     """
     diversity_constraints = {}
@@ -116,20 +124,21 @@ def assign_proportion_diversity(K, num_items_category):
 
     # Case 2: If K < d, use Minimum Diversity allocation
     else:
-        selected_categories = random.sample(list(num_items_category.keys()), K)
+        selected_categories = rng.sample(list(num_items_category.keys()), K)
         diversity_constraints = {category: (1, 1) if category in selected_categories else (0, 0) for category in
                                  num_items_category}
 
     return diversity_constraints
 
 
-def assign_relaxed_average_diversity(K, num_items_category, t):
+def assign_relaxed_average_diversity(K, num_items_category, t, rng=random):
     """
     Implements the Relaxed Average Diversity Constraint logic.
 
     :param K: Number of items to select.
     :param num_items_category: Dictionary {category: total available items (n_j)}
     :param t: Tightness threshold (integer).
+    :param rng: Source of the random choices, e.g. random.Random(seed) for reproducible constraints.
     :return: Dictionary {category: (floor, ceil)}
     """
     diversity_constraints = {}
@@ -155,20 +164,21 @@ def assign_relaxed_average_diversity(K, num_items_category, t):
 
     # Case 2: If K < d, use Minimum Diversity allocation
     else:
-        selected_categories = random.sample(list(num_items_category.keys()), K)
+        selected_categories = rng.sample(list(num_items_category.keys()), K)
         diversity_constraints = {category: (1, 1) if category in selected_categories else (0, 0) for category in
                                  num_items_category}
 
     return diversity_constraints
 
 
-def assign_relaxed_proportion_diversity(K, num_items_category, t):
+def assign_relaxed_proportion_diversity(K, num_items_category, t, rng=random):
     """
     Implements the Relaxed Proportion Diversity Constraint logic.
 
     :param K: Number of items to select.
     :param num_items_category: Dictionary {category: total available items (n_j)}
     :param t: Tightness threshold (integer).
+    :param rng: Source of the random choices, e.g. random.Random(seed) for reproducible constraints.
     :return: Dictionary {category: (floor, ceil)}
     """
     diversity_constraints = {}
@@ -195,8 +205,173 @@ def assign_relaxed_proportion_diversity(K, num_items_category, t):
 
     # Case 2: If K < d, use Minimum Diversity allocation
     else:
-        selected_categories = random.sample(list(num_items_category.keys()), K)
+        selected_categories = rng.sample(list(num_items_category.keys()), K)
         diversity_constraints = {category: (1, 1) if category in selected_categories else (0, 0) for category in
                                  num_items_category}
 
     return diversity_constraints
+
+
+# Constraint families, assign_<family>_diversity, and whether they take a tightness threshold t
+FAMILIES = {
+    "minimum": False,
+    "average": False,
+    "proportion": False,
+    "relaxed_average": True,
+    "relaxed_proportion": True,
+}
+
+# Planned (K, t, family, seed) results kept over all planners, least recently used first evicted
+PLAN_CACHE_SIZE = 4096
+
+# Floor and ceil of every category in the planned rows of infeasible K, see ConstraintPlanner.sweep
+INFEASIBLE = -1
+
+_plans = collections.OrderedDict()
+# Guards every access to _plans, planners are shared between threads (see topk.server)
+_plans_lock = threading.Lock()
+
+
+class ConstraintPlanner:
+    """
+    Computes the floors and ceils of every constraint family from one set of category counts.
+
+    The per-category arithmetic of the assign_*_diversity functions runs on arrays, for many K at once, and the
+    results are memoized by (counts fingerprint, K, t, family, seed). Random choices are drawn from
+    random.Random(seed) for every (family, K, t), so a planned result equals assign_<family>_diversity(K, counts,
+    [t,] rng=random.Random(seed)). With seed None the random choices come from the random module and those results
+    are not memoized.
+    """
+
+    def __init__(self, num_items_category):
+        """
+        :param num_items_category: Dictionary {category: total available items (n_j)}
+        """
+        self.categories = list(num_items_category)
+        self.counts = np.array(list(num_items_category.values()), dtype=np.int64)
+        self.fingerprint = hashlib.sha1(repr(list(num_items_category.items())).encode()).hexdigest()
+
+    def bounds(self, family, K, t=None, seed=None):
+        """
+        :return: Tuple (floors, ceils) of int64 arrays in category order.
+        :raise ValueError: When no category has enough items for the extra slots of K (where the
+        assign_*_diversity functions raise IndexError).
+        """
+        floors, ceils = self.sweep(family, [K], t, seed)
+        if (floors[0] == INFEASIBLE).any():
+            raise ValueError(f"no category has enough items for the {family} constraints of K={K}")
+        return floors[0], ceils[0]
+
+    def constraints(self, family, K, t=None, seed=None):
+        """
+        :param family: One of FAMILIES.
+        :param K: Number of items to select.
+        :param t: Tightness threshold of the relaxed families.
+        :param seed: Seed of the random choices, None for the random module.
+        :return: Dictionary {category: (floor, ceil)}
+        """
+        floors, ceils = self.bounds(family, K, t, seed)
+        return dict(zip(self.categories, zip(floors.tolist(), ceils.tolist())))
+
+    def all_families(self, K, t=None, seed=None):
+        """
+        :return: Dictionary {family: {category: (floor, ceil)}}, t only applying to the relaxed families.
+        """
+        return {family: self.constraints(family, K, t if relaxed else None, seed)
+                for family, relaxed in FAMILIES.items()}
+
+    def sweep(self, family, Ks, t=None, seed=None):
+        """
+        Plans a range of K in one pass.
+
+        Some K have no category with enough items to take the extra slots of the minimum and average families.
+        Their rows are INFEASIBLE for every category instead of failing the whole range, e.g. infeasible =
+        (floors == INFEASIBLE).any(axis=1).
+
+        :param Ks: Sequence of numbers of items to select.
+        :return: Tuple (floors, ceils) of int64 arrays of shape (len(Ks), d).
+        """
+        if family not in FAMILIES:
+            raise ValueError(f"unknown constraint family {family!r}, expected one of {list(FAMILIES)}")
+        if not FAMILIES[family]:
+            t = None
+        elif t is None:
+            raise ValueError(f"the {family} family needs a tightness threshold t")
+
+        planned = {}
+        missing = []
+        with _plans_lock:
+            for K in dict.fromkeys(int(K) for K in Ks):
+                key = (self.fingerprint, K, t, family, seed)
+                if key in _plans:
+                    _plans.move_to_end(key)
+                    planned[K] = _plans[key]
+                else:
+                    missing.append(K)
+        if missing:
+            # Planned outside the lock, two threads may plan the same K once each
+            floors, ceils, random_rows = self._plan(family, np.array(missing, dtype=np.int64), t, seed)
+            with _plans_lock:
+                for K, row_floors, row_ceils, random_row in zip(missing, floors, ceils, random_rows.tolist()):
+                    planned[K] = (row_floors, row_ceils)
+                    # Choices drawn from the random module are fresh on every call
+                    if seed is not None or not random_row:
+                        _plans[self.fingerprint, K, t, family, seed] = planned[K]
+                while len(_plans) > PLAN_CACHE_SIZE:
+                    _plans.popitem(last=False)
+
+        d = len(self.counts)
+        floors = np.array([planned[int(K)][0] for K in Ks], dtype=np.int64).reshape(len(Ks), d)
+        ceils = np.array([planned[int(K)][1] for K in Ks], dtype=np.int64).reshape(len(Ks), d)
+        return floors, ceils
+
+    def _plan(self, family, Ks, t, seed):
+        """
+        :return: Tuple (floors, ceils, random_rows), random_rows[i] telling if row i drew random choices.
+        Infeasible rows draw none.
+        """
+        n = self.counts
+        d = len(n)
+        K = Ks[:, None]
+        random_rows = np.zeros(len(Ks), dtype=bool)
+
+        if family == "minimum":
+            floors = np.ones((len(Ks), d), dtype=np.int64)
+            ceils = np.ones((len(Ks), d), dtype=np.int64)
+        elif family in ("average", "relaxed_average"):
+            floors = np.minimum(np.floor(K / d).astype(np.int64), n)
+            ceils = np.minimum(np.ceil(K / d).astype(np.int64), n)
+        else:
+            share = K * (n / n.sum())
+            floors = np.floor(share).astype(np.int64)
+            ceils = np.ceil(share).astype(np.int64)
+        if t is not None:
+            floors = np.maximum(floors - t, 0)
+            ceils = np.minimum(ceils + t, n)
+
+        for row, K in enumerate(Ks.tolist()):
+            rng = random if seed is None else random.Random(seed)
+            if K < d:
+                # Case 2 of every family: K random categories get (1, 1)
+                selected = np.zeros(d, dtype=np.int64)
+                selected[rng.sample(range(d), K)] = 1
+                floors[row] = selected
+                ceils[row] = selected
+                random_rows[row] = True
+            elif family == "minimum" and K > d:
+                eligible = np.flatnonzero(n >= 1 + (K - d)).tolist()
+                if not eligible:
+                    floors[row] = ceils[row] = INFEASIBLE
+                    continue
+                ceils[row, rng.choice(eligible)] += 1
+                random_rows[row] = True
+            elif family == "average" and K - ceils[row].sum() > 0:
+                r = int(ceils[row].sum())
+                eligible = np.flatnonzero(n >= ceils[row] + r).tolist()
+                if not eligible:
+                    floors[row] = ceils[row] = INFEASIBLE
+                    continue
+                ceils[row, rng.choice(eligible)] += r
+                random_rows[row] = True
+
+        return floors, ceils, random_rows
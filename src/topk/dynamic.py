@@ -0,0 +1,336 @@
+import collections
+import heapq
+import time
+
+
+class _TopSplit:
+    """
+    Dynamic set of items split into its `size` best items (top) and the others (rest).
+
+    Items are identified by a sequence number, better means higher score, then lower sequence number. Both parts
+    are heaps with lazy deletion, so add and discard take O(log n) and report which items crossed the split.
+    """
+
+    def __init__(self, size):
+        self.size = size
+        self._top = []
+        """(score, -seq), min is the worst top item"""
+        self._rest = []
+        """(-score, seq), min is the best rest item"""
+        self._in_top = {}
+        self._scores = {}
+        self._top_count = 0
+        self._rest_count = 0
+
+    def _peek_top(self):
+        top = self._top
+        while True:
+            score, neg_seq = top[0]
+            if self._in_top.get(-neg_seq) is True and self._scores[-neg_seq] == score:
+                return -neg_seq
+            heapq.heappop(top)
+
+    def _peek_rest(self):
+        rest = self._rest
+        while True:
+            neg_score, seq = rest[0]
+            if self._in_top.get(seq) is False and self._scores[seq] == -neg_score:
+                return seq
+            heapq.heappop(rest)
+
+    def _to_top(self, seq):
+        self._in_top[seq] = True
+        self._top_count += 1
+        heapq.heappush(self._top, (self._scores[seq], -seq))
+        if len(self._top) > 2 * self._top_count + 64:
+            self._top = [(self._scores[s], -s) for s, in_top in self._in_top.items() if in_top]
+            heapq.heapify(self._top)
+
+    def _to_rest(self, seq):
+        self._in_top[seq] = False
+        self._rest_count += 1
+        heapq.heappush(self._rest, (-self._scores[seq], seq))
+        if len(self._rest) > 2 * self._rest_count + 64:
+            self._rest = [(-self._scores[s], s) for s, in_top in self._in_top.items() if not in_top]
+            heapq.heapify(self._rest)
+
+    def score(self, seq):
+        return self._scores[seq]
+
+    def add(self, seq, score):
+        """
+        :return: Tuple (seq if it entered the top else None, top item moved to the rest or None)
+        """
+        self._scores[seq] = score
+        if self._top_count < self.size:
+            self._to_top(seq)
+            return seq, None
+        if self.size > 0:
+            worst = self._peek_top()
+            if (score, -seq) > (self._scores[worst], -worst):
+                heapq.heappop(self._top)
+                self._top_count -= 1
+                self._to_rest(worst)
+                self._to_top(seq)
+                return seq, worst
+        self._to_rest(seq)
+        return None, None
+
+    def discard(self, seq):
+        """
+        :return: Tuple (whether seq was in the top, rest item moved to the top or None)
+        """
+        in_top = self._in_top.pop(seq)
+        if not in_top:
+            self._rest_count -= 1
+            del self._scores[seq]
+            return False, None
+        self._top_count -= 1
+        del self._scores[seq]
+        if self._rest_count:
+            best = self._peek_rest()
+            heapq.heappop(self._rest)
+            self._rest_count -= 1
+            self._to_top(best)
+            return True, best
+        return True, None
+
+
+class DynamicDiverseTopK:
+    """
+    Diverse top-K of a changing item set, maintained incrementally.
+
+    Every category splits its items into its best `floor` (floor tier), the next `ceil - floor` (slack candidates)
+    and the rest. The result is the K best of the floor tier and the `slack` best slack candidates across
+    categories, which is what diverse_top_k selects from the items sorted by decreasing score (ties in insertion
+    order). Each tier boundary is a pair of heaps, so an insert, delete or score update costs O(log n).
+    """
+
+    def __init__(self, K, diversity_constraints, items=()):
+        """
+        :param K: Total number of items to select.
+        :param diversity_constraints: Dict {category: (floor, ceil)}, categories without constraints are never
+        selected.
+        :param items: Initial tuples (score, category, item_id).
+        """
+        self.K = K
+        self.diversity_constraints = diversity_constraints
+        self._floor_tiers = {category: _TopSplit(floor) for category, (floor, _) in diversity_constraints.items()}
+        self._slack_tiers = {category: _TopSplit(max(ceil - floor, 0))
+                             for category, (floor, ceil) in diversity_constraints.items()}
+
+        floor_sum = sum(f for f, _ in diversity_constraints.values())
+        self._floor_pool = _TopSplit(K)
+        self._slack_pool = _TopSplit(max(K - floor_sum, 0))
+
+        self._items = {}
+        """item_id -> (score, category, seq)"""
+        self._ids = {}
+        """seq -> item_id"""
+        self._next_seq = 0
+        self._selected = set()
+
+        for score, category, item_id in items:
+            self.insert(score, category, item_id)
+
+    def __len__(self):
+        return len(self._items)
+
+    def __contains__(self, item_id):
+        return item_id in self._items
+
+    @property
+    def selected(self):
+        """
+        :return: List of selected item IDs, by decreasing score.
+        """
+        items = self._items
+        return sorted(self._selected, key=lambda item_id: (-items[item_id][0], items[item_id][2]))
+
+    def _pool_event(self, pool, seq, score, changes):
+        if score is None:
+            was_top, promoted = pool.discard(seq)
+            if was_top:
+                changes[seq] = changes.get(seq, 0) - 1
+        else:
+            entered, demoted = pool.add(seq, score)
+            promoted = None
+            if entered is not None:
+                changes[seq] = changes.get(seq, 0) + 1
+            if demoted is not None:
+                changes[demoted] = changes.get(demoted, 0) - 1
+        if promoted is not None:
+            changes[promoted] = changes.get(promoted, 0) + 1
+
+    def _add(self, seq, score, category, changes):
+        floor_tier = self._floor_tiers.get(category)
+        if floor_tier is None:
+            return
+        entered, demoted = floor_tier.add(seq, score)
+        if entered is not None:
+            self._pool_event(self._floor_pool, seq, score, changes)
+        if demoted is not None:
+            self._pool_event(self._floor_pool, demoted, None, changes)
+        to_slack = demoted if entered is not None else seq
+        if to_slack is None:
+            return
+        slack_score = floor_tier.score(to_slack)
+        entered, demoted = self._slack_tiers[category].add(to_slack, slack_score)
+        if entered is not None:
+            self._pool_event(self._slack_pool, to_slack, slack_score, changes)
+        if demoted is not None:
+            self._pool_event(self._slack_pool, demoted, None, changes)
+
+    def _discard(self, seq, category, changes):
+        floor_tier = self._floor_tiers.get(category)
+        if floor_tier is None:
+            return
+        was_top, promoted = floor_tier.discard(seq)
+        if was_top:
+            self._pool_event(self._floor_pool, seq, None, changes)
+            if promoted is not None:
+                self._pool_event(self._floor_pool, promoted, floor_tier.score(promoted), changes)
+        from_slack = promoted if was_top else seq
+        if from_slack is None:
+            return
+        slack_tier = self._slack_tiers[category]
+        was_top, promoted = slack_tier.discard(from_slack)
+        if was_top:
+            self._pool_event(self._slack_pool, from_slack, None, changes)
+            if promoted is not None:
+                self._pool_event(self._slack_pool, promoted, slack_tier.score(promoted), changes)
+
+    def _apply(self, changes):
+        entered = []
+        left = []
+        for seq, change in changes.items():
+            if change > 0:
+                entered.append(self._ids[seq])
+            elif change < 0:
+                left.append(self._ids[seq])
+        self._selected.update(entered)
+        self._selected.difference_update(left)
+        return entered, left
+
+    def insert(self, score, category, item_id):
+        """
+        :return: Tuple (item IDs that entered the result, item IDs that left it)
+        """
+        if item_id in self._items:
+            raise KeyError(f"item {item_id!r} already exists")
+        seq = self._next_seq
+        self._next_seq += 1
+        self._items[item_id] = (score, category, seq)
+        self._ids[seq] = item_id
+        changes = {}
+        self._add(seq, score, category, changes)
+        return self._apply(changes)
+
+    def delete(self, item_id):
+        """
+        :return: Tuple (item IDs that entered the result, item IDs that left it)
+        """
+        _, category, seq = self._items.pop(item_id)
+        changes = {}
+        self._discard(seq, category, changes)
+        result = self._apply(changes)
+        del self._ids[seq]
+        return result
+
+    def update_score(self, item_id, score):
+        """
+        Changes the score of an item, keeping its insertion order for ties.
+
+        :return: Tuple (item IDs that entered the result, item IDs that left it)
+        """
+        _, category, seq = self._items[item_id]
+        self._items[item_id] = (score, category, seq)
+        changes = {}
+        self._discard(seq, category, changes)
+        self._add(seq, score, category, changes)
+        return self._apply(changes)
+
+
+class SlidingWindowDiverseTopK:
+    """
+    Diverse top-K of the last `size` items of an endless stream, or of the items of the last `duration` seconds.
+
+    Arrivals are inserted into a DynamicDiverseTopK and expired items are deleted from it in arrival order, so every
+    arrival or expiry costs O(log W) for a window of W items and the window is never rescanned.
+    """
+
+    def __init__(self, K, diversity_constraints, size=None, duration=None, clock=time.monotonic):
+        """
+        :param K: Total number of items to select.
+        :param diversity_constraints: Dict {category: (floor, ceil)}, categories without constraints are never
+        selected.
+        :param size: Maximal number of items in the window, unbounded when None.
+        :param duration: Items older than this many seconds expire, never when None.
+        :param clock: Function returning the time in seconds, used when no timestamp is given.
+        """
+        if size is None and duration is None:
+            raise ValueError("a window needs a size or a duration")
+        self.size = size
+        self.duration = duration
+        self._clock = clock
+        self._dynamic = DynamicDiverseTopK(K, diversity_constraints)
+        self._window = collections.deque()
+        """(timestamp, item_id) in arrival order"""
+
+    def __len__(self):
+        return len(self._window)
+
+    def __contains__(self, item_id):
+        return item_id in self._dynamic
+
+    @property
+    def selected(self):
+        """
+        :return: List of selected item IDs of the window, by decreasing score.
+        """
+        return self._dynamic.selected
+
+    def push(self, score, category, item_id, timestamp=None):
+        """
+        Adds an arrival, after expiring the items that leave the window.
+
+        :param timestamp: Arrival time in seconds, non-decreasing, clock() by default.
+        :return: Tuple (item IDs that entered the result, item IDs that left it)
+        """
+        if timestamp is None:
+            timestamp = self._clock()
+        changes = {}
+        self._expire(timestamp, changes, 1)
+        self._window.append((timestamp, item_id))
+        self._record(self._dynamic.insert(score, category, item_id), changes)
+        return self._net(changes)
+
+    def expire(self, now=None):
+        """
+        Removes the items older than the duration, e.g. from a timer when no item arrives.
+
+        :return: Tuple (item IDs that entered the result, item IDs that left it)
+        """
+        changes = {}
+        self._expire(self._clock() if now is None else now, changes, 0)
+        return self._net(changes)
+
+    def _expire(self, now, changes, incoming):
+        window = self._window
+        while window and ((self.size is not None and len(window) + incoming > self.size)
+                          or (self.duration is not None and window[0][0] <= now - self.duration)):
+            _, item_id = window.popleft()
+            self._record(self._dynamic.delete(item_id), changes)
+
+    @staticmethod
+    def _record(result, changes):
+        entered, left = result
+        for item_id in entered:
+            changes[item_id] = changes.get(item_id, 0) + 1
+        for item_id in left:
+            changes[item_id] = changes.get(item_id, 0) - 1
+
+    @staticmethod
+    def _net(changes):
+        return ([item_id for item_id, change in changes.items() if change > 0],
+                [item_id for item_id, change in changes.items() if change < 0])
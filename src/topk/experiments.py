@@ -0,0 +1,124 @@
+import atexit
+import concurrent.futures
+import os
+import threading
+
+import numpy as np
+
+from topk.online import online_diverse_selection
+from topk.static import DiverseTopKIndex
+
+
+def calc_accuracy(min_val, optimal_sol, sub_optimal):
+    sum1 = 0
+    sum2 = 0
+    for i in range(len(optimal_sol)):
+        sum2 += (optimal_sol[i] - min_val)
+        sum1 += (sub_optimal[i] - min_val)
+    return sum1 / sum2
+
+
+# Below this many tasks the runs are cheaper inline than shipped to worker processes
+INLINE_TASKS = 256
+
+# Process pools shared by every call, by number of workers
+_executors = {}
+_executors_lock = threading.Lock()
+
+
+def _shared_executor(max_workers):
+    with _executors_lock:
+        executor = _executors.get(max_workers)
+        if executor is None:
+            executor = _executors[max_workers] = concurrent.futures.ProcessPoolExecutor(max_workers=max_workers)
+        return executor
+
+
+@atexit.register
+def _shutdown_executors():
+    with _executors_lock:
+        for executor in _executors.values():
+            executor.shutdown()
+        _executors.clear()
+
+
+def _run_task(state, task):
+    scores, codes, K, constraints, optimal_scores, min_val = state
+    constraint_index, factor_index, factor, run, seed = task
+
+    # Every task draws its own permutation, independent of the worker that runs it
+    permutation = np.random.default_rng([seed, constraint_index, factor_index, run]).permutation(len(scores))
+    items = [(scores[i], codes[i], i) for i in permutation.tolist()]
+
+    selected, walking_distance = online_diverse_selection(items, K, constraints[constraint_index], factor)
+    if len(selected) < K:
+        return None
+    accuracy = calc_accuracy(min_val, optimal_scores[constraint_index], [scores[i] for i in selected])
+    return accuracy, walking_distance
+
+
+def _run_tasks(state, tasks):
+    return [_run_task(state, task) for task in tasks]
+
+
+def run_experiments(items, K, constraints, warmup_factors=(1.0,), runs=100, seed=0, max_workers=None,
+                    executor=None):
+    """
+    Runs the online algorithm over random arrival orders of the items, in a process pool.
+
+    Each (constraint, warm-up factor, run) task shuffles the items with its own seeded permutation, so the results
+    do not depend on the number of workers. Runs that select fewer than K items are skipped. Unless an executor is
+    given, fewer than INLINE_TASKS tasks run in the calling process and larger experiments go to a process pool shared
+    by every call with the same max_workers.
+
+    :param items: List of tuples (score, category, item_id).
+    :param K: Number of items to select.
+    :param constraints: Dict {name: diversity_constraints}
+    :param warmup_factors: Warm-up ratios passed to online_diverse_selection.
+    :param runs: Number of random arrival orders per constraint and warm-up factor.
+    :param seed: Seed of the permutations.
+    :param max_workers: Number of worker processes, defaults to the number of CPUs. 1 runs the tasks inline.
+    :param executor: Executor to run the tasks in instead of the shared process pool.
+    :return: Dict {(name, warmup_factor): (accuracies, walking_distances)}
+    """
+    # Categories are sent to the workers as integer codes, labels such as itertuples rows do not pickle
+    category_codes = {}
+    codes = [category_codes.setdefault(category, len(category_codes)) for _, category, _ in items]
+    scores = [float(score) for score, _, _ in items]
+    coded_constraints = [
+        {category_codes.setdefault(category, len(category_codes)): bounds for category, bounds in dc.items()}
+        for dc in constraints.values()
+    ]
+
+    index = DiverseTopKIndex(list(zip(scores, codes, range(len(items)))))
+    optimal_scores = [[scores[i] for i in index.query(K, dc)] for dc in coded_constraints]
+    min_val = min(scores)
+
+    tasks = [(constraint_index, factor_index, factor, run, seed)
+             for constraint_index in range(len(coded_constraints))
+             for factor_index, factor in enumerate(warmup_factors)
+             for run in range(runs)]
+
+    state = (scores, codes, K, coded_constraints, optimal_scores, min_val)
+    if max_workers is None:
+        max_workers = os.cpu_count() or 1
+    if executor is None and (max_workers == 1 or len(tasks) < INLINE_TASKS):
+        outcomes = _run_tasks(state, tasks)
+    else:
+        if executor is None:
+            executor = _shared_executor(max_workers)
+        # The dataset goes along with every chunk of tasks, the pool may outlive this call
+        chunksize = max(1, len(tasks) // (4 * max_workers))
+        futures = [executor.submit(_run_tasks, state, tasks[start:start + chunksize])
+                   for start in range(0, len(tasks), chunksize)]
+        outcomes = [outcome for future in futures for outcome in future.result()]
+
+    names = list(constraints)
+    results = {(name, factor): ([], []) for name in names for factor in warmup_factors}
+    for (constraint_index, _, factor, _, _), outcome in zip(tasks, outcomes):
+        if outcome is None:
+            continue
+        accuracies, walking_distances = results[names[constraint_index], factor]
+        accuracies.append(outcome[0])
+        walking_distances.append(outcome[1])
+    return results
@@ -0,0 +1,283 @@
+import bisect
+import collections
+
+import numpy as np
+
+# Sorted items converted to Python lists at a time by the greedy scan
+_CHUNK = 4096
+
+
+def attribute_groups(categories):
+    """
+    Splits tuple category labels, one value per sensitive column, into one group per attribute.
+
+    :param categories: Sequence of tuple labels, categories[code] the label of category code (e.g.
+    Dataset.categories).
+    :return: Tuple (table, groups), table an int32 array of shape (d, A) with table[code, a] the attribute a group
+    code of category code, and groups[a] the list of attribute a group labels.
+    """
+    num_attributes = len(categories[0]) if len(categories) else 0
+    code_of = [{} for _ in range(num_attributes)]
+    table = np.empty((len(categories), num_attributes), dtype=np.int32)
+    for code, category in enumerate(categories):
+        for attribute, value in enumerate(category):
+            table[code, attribute] = code_of[attribute].setdefault(value, len(code_of[attribute]))
+    return table, [list(groups) for groups in code_of]
+
+
+def attribute_counts(groups, num_groups=None):
+    """
+    :param groups: Integer array of shape (N, A), groups[i, a] the attribute a group code of item i.
+    :param num_groups: Optional list with the number of groups of every attribute.
+    :return: List of dicts {group code: number of items}, one per attribute, the input of the
+    assign_*_diversity functions.
+    """
+    groups = np.asarray(groups)
+    counts = []
+    for attribute in range(groups.shape[1]):
+        minlength = 0 if num_groups is None else num_groups[attribute]
+        counts.append(dict(enumerate(np.bincount(groups[:, attribute], minlength=minlength).tolist())))
+    return counts
+
+
+def intersectional_top_k(scores, groups, K, constraints):
+    """
+    Selects K items maximizing utility under separate floor and ceil constraints on every attribute.
+
+    Every item belongs to one group per attribute, so the constraints grow with the sum of the group counts rather
+    than with their product. Items are scanned by decreasing score and taken when no ceil is exceeded and, for every
+    attribute, the floors still missing fit in the remaining slots. With a single attribute this is exactly
+    diverse_top_k. Two attributes are solved exactly as a min-cost flow (see _two_attribute_flow). With more,
+    floors can compete for the same slots: a repair phase then swaps the lowest scoring items that no floor needs
+    for the best items of the groups still below their floor, and fills any remaining slot with the best items the
+    ceils allow. Ceils always hold, floors hold whenever the repair finds them.
+
+    :param scores: Float array of item scores.
+    :param groups: Integer array of shape (N, A), groups[i, a] the attribute a group code of item i.
+    :param K: Total number of items to select.
+    :param constraints: List of (floors, ceils) pairs, one per attribute, sequences indexed by group code.
+    :return: Array of selected item indices, by decreasing score (ties kept in array order).
+    """
+    scores = np.asarray(scores, dtype=np.float64)
+    groups = np.asarray(groups)
+    num_attributes = len(constraints)
+    attributes = range(num_attributes)
+    floors = [list(map(int, floors)) for floors, _ in constraints]
+    ceils = [list(map(int, ceils)) for _, ceils in constraints]
+    counts = [[0] * len(attribute_floors) for attribute_floors in floors]
+    deficits = [sum(attribute_floors) for attribute_floors in floors]
+
+    order = np.argsort(-scores, kind="stable")
+    if num_attributes == 2:
+        selected = _two_attribute_flow(scores[order], groups[order], K, floors, ceils)
+        return order[np.sort(np.asarray(selected, dtype=np.intp))]
+
+    selected = []
+    for start in range(0, len(order), _CHUNK):
+        if len(selected) == K:
+            break
+        chunk = order[start:start + _CHUNK]
+        for rank, item_groups in enumerate(groups[chunk].tolist(), start):
+            remaining = K - len(selected) - 1
+            for a in attributes:
+                group = item_groups[a]
+                count = counts[a][group]
+                if count >= ceils[a][group] or deficits[a] - (count < floors[a][group]) > remaining:
+                    break
+            else:
+                for a in attributes:
+                    group = item_groups[a]
+                    if counts[a][group] < floors[a][group]:
+                        deficits[a] -= 1
+                    counts[a][group] += 1
+                selected.append(rank)
+                if len(selected) == K:
+                    break
+
+    if len(selected) < K:
+        selected = _repair(selected, groups[order], K, floors, ceils, counts)
+
+    return order[np.sort(np.asarray(selected, dtype=np.intp))]
+
+
+def _two_attribute_flow(scores, groups, K, floors, ceils):
+    """
+    Exact selection for two attributes.
+
+    The selection is a flow of K units source -> attribute 0 group -> cell -> attribute 1 group -> sink, a cell
+    holding the items of one pair of groups. Group arcs have capacity ceil and their first floor units earn a
+    floor bonus, the k-th unit through a cell costs the score of its k-th best item. Costs are pairs compared
+    lexicographically, (-floor units, -score), so successive shortest paths give the most floor units first and the
+    highest utility among those, every arc cost being convex in its flow. Only the best min(ceil, K) items of each
+    cell can be used, so the graph has d0 + d1 + cells arcs whatever the number of items.
+
+    :param scores: Item scores in decreasing order.
+    :param groups: Group codes of the items in the same order, shape (N, 2).
+    :return: List of the selected ranks.
+    """
+    d0 = len(floors[0])
+    d1 = len(floors[1])
+    cell_of = groups[:, 0].astype(np.int64) * d1 + groups[:, 1]
+    order = np.argsort(cell_of, kind="stable")
+    cells, starts, sizes = np.unique(cell_of[order], return_index=True, return_counts=True)
+
+    # Arcs [tail, head, flow, unit costs], nodes: source, attribute 0 groups, attribute 1 groups, sink
+    source = 0
+    sink = d0 + d1 + 1
+    arcs = []
+    cell_ranks = []
+    for group, (floor, ceil) in enumerate(zip(floors[0], ceils[0])):
+        arcs.append([source, 1 + group, 0, [(-1, 0.0)] * min(floor, ceil) + [(0, 0.0)] * max(ceil - floor, 0)])
+    for group, (floor, ceil) in enumerate(zip(floors[1], ceils[1])):
+        arcs.append([1 + d0 + group, sink, 0, [(-1, 0.0)] * min(floor, ceil) + [(0, 0.0)] * max(ceil - floor, 0)])
+    for cell, start, size in zip(cells.tolist(), starts.tolist(), sizes.tolist()):
+        group0, group1 = divmod(cell, d1)
+        ranks = order[start:start + min(size, ceils[0][group0], ceils[1][group1], K)]
+        if len(ranks) == 0:
+            continue
+        cell_ranks.append((len(arcs), ranks))
+        arcs.append([1 + group0, 1 + d0 + group1, 0, [(0, -score) for score in scores[ranks].tolist()]])
+
+    # Rounding of the summed scores must not be mistaken for an improvement, which could cycle
+    epsilon = 1e-9 * (float(np.abs(scores).max()) + 1.0) if len(scores) else 0.0
+
+    adjacent = [[] for _ in range(sink + 1)]
+    for index, (tail, head, _, _) in enumerate(arcs):
+        adjacent[tail].append(index)
+        adjacent[head].append(index)
+
+    for _ in range(K):
+        # Shortest path in the residual graph (SPFA), costs may be negative but there is no negative cycle
+        distance = [None] * (sink + 1)
+        parent = [None] * (sink + 1)
+        distance[source] = (0, 0.0)
+        queue = collections.deque([source])
+        queued = [False] * (sink + 1)
+        queued[source] = True
+        while queue:
+            node = queue.popleft()
+            queued[node] = False
+            base_penalty, base_cost = distance[node]
+            for index in adjacent[node]:
+                tail, head, flow, costs = arcs[index]
+                if tail == node and flow < len(costs):
+                    penalty, cost = costs[flow]
+                    other = head
+                elif head == node and flow > 0:
+                    penalty, cost = costs[flow - 1]
+                    penalty, cost = -penalty, -cost
+                    other = tail
+                else:
+                    continue
+                penalty += base_penalty
+                cost += base_cost
+                if (distance[other] is None or penalty < distance[other][0]
+                        or (penalty == distance[other][0] and cost < distance[other][1] - epsilon)):
+                    distance[other] = (penalty, cost)
+                    parent[other] = index
+                    if not queued[other]:
+                        queued[other] = True
+                        queue.append(other)
+        if distance[sink] is None:
+            break
+
+        node = sink
+        while node != source:
+            arc = arcs[parent[node]]
+            if arc[1] == node:
+                arc[2] += 1
+                node = arc[0]
+            else:
+                arc[2] -= 1
+                node = arc[1]
+
+    return [rank for index, ranks in cell_ranks for rank in ranks[:arcs[index][2]].tolist()]
+
+
+def _repair(selected, groups, K, floors, ceils, counts):
+    """
+    Completes a greedy selection that stopped short of K items.
+
+    :param selected: Ranks of the selected items in the score order.
+    :param groups: Group codes of the items in the score order.
+    :return: List of the selected ranks.
+    """
+    attributes = range(len(floors))
+    chosen = set(selected)
+    selected = sorted(selected)
+
+    def fits(rank, removed=None):
+        for a in attributes:
+            group = groups[rank, a]
+            if counts[a][group] - (removed is not None and groups[removed, a] == group) >= ceils[a][group]:
+                return False
+        return True
+
+    def needed(rank, added):
+        # Whether removing the item at rank, after adding the item at added, breaks a floor
+        for a in attributes:
+            group = groups[rank, a]
+            if counts[a][group] + (groups[added, a] == group) <= floors[a][group]:
+                return True
+        return False
+
+    def move(rank, step):
+        for a in attributes:
+            counts[a][groups[rank, a]] += step
+
+    # Bring every group below its floor up, best candidates first
+    for a in attributes:
+        for group, floor in enumerate(floors[a]):
+            if counts[a][group] >= floor:
+                continue
+            for rank in np.flatnonzero(groups[:, a] == group).tolist():
+                if counts[a][group] >= floor:
+                    break
+                if rank in chosen:
+                    continue
+                if len(selected) < K and fits(rank):
+                    move(rank, 1)
+                    chosen.add(rank)
+                    bisect.insort(selected, rank)
+                    continue
+                # Swap out the lowest scoring selected item no floor depends on, when full or at a ceil
+                for removed in reversed(selected):
+                    if fits(rank, removed) and not needed(removed, rank):
+                        move(removed, -1)
+                        move(rank, 1)
+                        chosen.discard(removed)
+                        chosen.add(rank)
+                        selected.remove(removed)
+                        bisect.insort(selected, rank)
+                        break
+
+    # Fill the slots left with the best items the ceils allow
+    for rank in range(len(groups)):
+        if len(selected) == K:
+            break
+        if rank not in chosen and fits(rank):
+            move(rank, 1)
+            chosen.add(rank)
+            selected.append(rank)
+
+    return selected
+
+
+def intersectional_diverse_top_k(items, K, diversity_constraints):
+    """
+    Label level version of intersectional_top_k.
+
+    :param items: List of tuples (score, category, item_id), category a tuple with one group per attribute.
+    :param K: Total number of items to select.
+    :param diversity_constraints: List of dicts {group: (floor, ceil)}, one per attribute. Groups without
+    constraints are never selected.
+    :return: List of selected item IDs, by decreasing score.
+    """
+    code_of = [{group: code for code, group in enumerate(constraints)} for constraints in diversity_constraints]
+    # Groups without constraints share an extra (0, 0) code
+    groups = np.array([[codes.get(group, len(codes)) for codes, group in zip(code_of, category)]
+                       for _, category, _ in items], dtype=np.int32).reshape(len(items), len(code_of))
+    constraints = [([f for f, _ in dc.values()] + [0], [c for _, c in dc.values()] + [0])
+                   for dc in diversity_constraints]
+    selected = intersectional_top_k([score for score, _, _ in items], groups, K, constraints)
+    return [items[i][2] for i in selected.tolist()]
@@ -0,0 +1,76 @@
+import numpy as np
+
+
+class ItemStore:
+    """
+    Struct-of-arrays item storage.
+
+    scores (float64), codes (int32) and ids (int64) are aligned arrays, categories[code] is the label of a category
+    code and counts[code] its number of items. The arrays are kept as given when they already have these dtypes,
+    so memory maps and array('d') buffers are used without a copy.
+    """
+
+    def __init__(self, scores, codes, ids=None, categories=None, counts=None):
+        self.scores = np.asanyarray(scores, dtype=np.float64)
+        self.codes = np.asanyarray(codes, dtype=np.int32)
+        self.ids = np.arange(len(self.scores), dtype=np.int64) if ids is None else np.asanyarray(ids, dtype=np.int64)
+        if categories is None:
+            categories = list(range(int(self.codes.max()) + 1 if len(self.codes) else 0))
+        self.categories = categories
+        self.counts = np.bincount(self.codes, minlength=len(categories)) if counts is None else counts
+
+    @classmethod
+    def from_items(cls, items):
+        """
+        :param items: Iterable of tuples (score, category, item_id) with integer item IDs.
+        """
+        code_of = {}
+        scores = []
+        codes = []
+        ids = []
+        for score, category, item_id in items:
+            scores.append(score)
+            codes.append(code_of.setdefault(category, len(code_of)))
+            ids.append(item_id)
+        return cls(scores, codes, ids, list(code_of))
+
+    def __len__(self):
+        return len(self.scores)
+
+    def category_count(self):
+        """
+        :return: Dict {category code: number of items}, the input of the assign_*_diversity functions.
+        """
+        return dict(enumerate(self.counts.tolist()))
+
+    def items(self):
+        """
+        :return: List of tuples (score, category label, item_id).
+        """
+        categories = self.categories
+        return [(score, categories[code], item_id)
+                for score, code, item_id in zip(self.scores.tolist(), self.codes.tolist(), self.ids.tolist())]
+
+    def compile_constraints(self, diversity_constraints, by_label=False):
+        """
+        :param diversity_constraints: Dict {category code: (floor, ceil)}, or {category label: (floor, ceil)} with
+        by_label.
+        :return: compile_constraints over this store's categories.
+        """
+        keys = self.categories if by_label else range(len(self.categories))
+        return compile_constraints(diversity_constraints, keys)
+
+
+def compile_constraints(diversity_constraints, categories):
+    """
+    Turns diversity constraints into dense arrays indexed by category code.
+
+    :param diversity_constraints: Dict {category: (floor, ceil)}
+    :param categories: Sequence of the categories, position i holding the category of code i. Categories without
+    constraints get (0, 0) and are never selected.
+    :return: Tuple (floors, ceils) of int64 arrays.
+    """
+    bounds = [diversity_constraints.get(category, (0, 0)) for category in categories]
+    floors = np.array([floor for floor, _ in bounds], dtype=np.int64)
+    ceils = np.array([ceil for _, ceil in bounds], dtype=np.int64)
+    return floors, ceils
@@ -1,5 +1,15 @@
+import collections
 import math
 import heapq
+import operator
+
+import numpy as np
+
+from topk.stats import phase
+
+# Smallest and largest number of arrivals offer_batch compares at once
+_MIN_WINDOW = 64
+_MAX_WINDOW = 1 << 16
 
 
 class Heap:
@@ -30,73 +40,360 @@ class Heap:
     #     self._list = [(-1.0, -1)] * (self._capacity - len(self._list)) + self._list
 
 
-def online_diverse_selection(items, K, diversity_constraints, warmup_ratio = 1.0):
+class OnlineDiverseSelector:
+    """
+    Single pass version of the online diverse selection algorithm, deciding on every item as it arrives.
+
+    Only the per-category counters, the warm-up heaps and the selected items are kept, so memory is O(d + K)
+    regardless of the stream length. The state is held in lists indexed by integer category code, labels are
+    encoded once per item by offer, or not at all by offer_code.
+    """
+
+    def __init__(self, K, diversity_constraints, category_count, warmup_ratio=1.0, stats=None):
+        """
+        :param K: Number of items to select.
+        :param diversity_constraints: Dict {category: (floor, ceil)}
+        :param category_count: Dict {category: expected number of items in the stream}, exact or estimated.
+        :param warmup_ratio: Fraction of the N/e warm-up period to observe before selecting.
+        :param stats: Optional topk.stats.SelectionStats, see report_stats.
+        """
+        self.diversity_constraints = diversity_constraints
+        self._code_of = {category: code for code, category in enumerate(diversity_constraints)}
+        self._setup(K,
+                    [f for f, _ in diversity_constraints.values()],
+                    [c for _, c in diversity_constraints.values()],
+                    [category_count.get(category, 0) for category in diversity_constraints],
+                    warmup_ratio, stats)
+
+    @classmethod
+    def from_codes(cls, K, floors, ceils, category_count, warmup_ratio=1.0, stats=None, labels=None):
+        """
+        Builds a selector over integer category codes, see topk.items.compile_constraints.
+
+        :param floors: Sequence of floors indexed by category code.
+        :param ceils: Sequence of ceils indexed by category code.
+        :param category_count: Sequence of expected numbers of items indexed by category code.
+        :param labels: Optional category labels indexed by code, stats count the accepted items by label. Codes are
+        used otherwise.
+        """
+        selector = cls.__new__(cls)
+        selector.diversity_constraints = {code: (floor, ceil) for code, (floor, ceil) in enumerate(zip(floors, ceils))}
+        selector._code_of = None
+        selector._setup(K, list(floors), list(ceils), list(category_count), warmup_ratio, stats, labels)
+        return selector
+
+    def _setup(self, K, floors, ceils, category_count, warmup_ratio, stats, labels=None):
+        self.K = K
+        self.stats = stats
+        self._labels = list(self.diversity_constraints) if labels is None else list(labels)
+        # Derived counters already added to stats: (warm-up items, items seen, selected items, heap pushes)
+        self._reported = (0, 0, 0, 0)
+        self.selected = []
+        self.total_seen = 0
+
+        d = len(floors)
+        self._floors = [int(f) for f in floors]
+        self._ceils = [int(c) for c in ceils]
+        self._num_items_category = [0] * d
+        """k"""
+        self._visited_categories = [0] * d
+        """m"""
+        self._category_count = [int(n) for n in category_count]
+        """n"""
+
+        self._R = [math.floor(warmup_ratio * (n / math.e)) for n in self._category_count]
+        self._heaps = [Heap(capacity=floor) for floor in self._floors]
+
+        floor_sum = sum(self._floors)
+        self._slack = K - floor_sum
+        N = sum(self._category_count)
+        self._r = math.floor(warmup_ratio * (N / math.e))
+        self._T = Heap(capacity=self._slack)
+
+        # Unseen items of categories that have not reached their ceil, kept up to date as items arrive
+        self._num_feasible_items = sum(n for n, ceil in zip(self._category_count, self._ceils) if ceil > 0)
+
+    @property
+    def done(self):
+        return len(self.selected) == self.K
+
+    def _select(self, category, ceil, item_id, branch):
+        if self.stats is not None:
+            self.stats.branches[branch] += 1
+            self.stats.accepted[self._labels[category]] += 1
+        self.selected.append(item_id)
+        self._num_items_category[category] += 1
+        if self._num_items_category[category] == ceil:
+            self._num_feasible_items -= self._category_count[category] - self._visited_categories[category]
+
+    def offer(self, score, category, item_id):
+        """
+        Decides on the next arriving item.
+
+        :return: True if the item was selected. Items offered after K items were selected are rejected and not counted.
+        """
+        if self._code_of is not None:
+            category = self._code_of[category]
+        return self.offer_code(score, category, item_id)
+
+    def offer_code(self, score, category, item_id):
+        """
+        offer with the integer code of the item's category.
+        """
+        if len(self.selected) == self.K:
+            return False
+        if self.total_seen < self._r:
+            self._T.push(score, item_id)
+        if self._visited_categories[category] < self._R[category]:
+            self._heaps[category].push(score, item_id)
+        return self._decide(score, category, item_id)
+
+    def _decide(self, score, category, item_id):
+        # The item's warm-up pushes are already done
+        floor = self._floors[category]
+        ceil = self._ceils[category]
+        num_items_category = self._num_items_category
+        visited = self._visited_categories[category]
+        heap = self._heaps[category]
+        accepted = True
+
+        if visited < self._R[category]:
+            accepted = False
+        # ((ki < floori)∧(score(x) > дetMinElement(Ti))∨(ni −mi == floori −ki)
+        elif ((num_items_category[category] < floor and score > heap.min_value())
+              or ((self._category_count[category] - visited) == (floor - num_items_category[category]))):
+            if not heap.is_empty():
+                heap.pop()
+                if self.stats is not None:
+                    self.stats.heap_pops += 1
+            self._select(category, ceil, item_id, "floor")
+        elif (self.total_seen >= self._r and score > self._T.min_value() and num_items_category[category] < ceil
+              and self._slack > 0):
+            if not self._T.is_empty():
+                self._T.pop()
+                if self.stats is not None:
+                    self.stats.heap_pops += 1
+            self._select(category, ceil, item_id, "slack")
+            self._slack -= 1
+        elif num_items_category[category] < ceil and self._num_feasible_items == (self.K - len(self.selected)):
+            self._select(category, ceil, item_id, "fallback")
+            self._slack -= 1
+        else:
+            accepted = False
+
+        if num_items_category[category] < ceil:
+            self._num_feasible_items -= 1
+        self._visited_categories[category] = visited + 1
+        self.total_seen += 1
+        return accepted
+
+    def offer_batch(self, scores, codes, item_ids):
+        """
+        offer_code on a batch of arrivals, with the same decisions and final state as offering them one by one.
+
+        A heap only receives pushes before its first pop (a category heap during the category's warm-up, T before
+        r items were seen), so the warm-up pushes of a window of arrivals are applied up front, keeping only the
+        scores that can enter each heap. Until an item is selected the counters k and the slack stay fixed, so the
+        branch conditions of the whole window are evaluated on arrays. The first selected item goes through the
+        scalar path and the next window starts after it, sized from the distance to that selection.
+
+        :param scores: Float array of scores.
+        :param codes: Integer array of category codes.
+        :param item_ids: Array of item IDs, selected contains them as Python scalars.
+        :return: Boolean array, True for the selected items.
+        """
+        scores = np.asarray(scores, dtype=np.float64)
+        # Stable sorts of 16 bit codes are radix sorts
+        codes = np.asarray(codes, dtype=np.int16 if len(self._floors) <= np.iinfo(np.int16).max else np.intp)
+        item_ids = np.asarray(item_ids)
+        accepted = np.zeros(len(scores), dtype=bool)
+
+        floors = np.array(self._floors, dtype=np.int64)
+        ceils = np.array(self._ceils, dtype=np.int64)
+        category_count = np.array(self._category_count, dtype=np.int64)
+        R = np.array(self._R, dtype=np.int64)
+
+        start = 0
+        pushed = 0
+        window = _MAX_WINDOW
+        while start < len(scores) and not self.done:
+            end = min(len(scores), start + window)
+            window_scores = scores[start:end]
+            window_codes = codes[start:end]
+            visited = np.array(self._visited_categories, dtype=np.int64)[window_codes] + _occurrences(window_codes)
+            warmup = visited < R[window_codes]
+
+            # Pushes are never undone, later windows skip the arrivals already pushed
+            if pushed < end:
+                new = slice(pushed - start, None) if pushed > start else slice(None)
+                self._push_warmup(window_scores[new], window_codes[new], item_ids[start:end][new], warmup[new],
+                                  self.total_seen + np.arange(end - start)[new])
+                pushed = end
+
+            k = np.array(self._num_items_category, dtype=np.int64)[window_codes]
+            floor = floors[window_codes]
+            ceil = ceils[window_codes]
+            below_ceil = k < ceil
+            present = np.flatnonzero(np.bincount(window_codes, minlength=len(floors))).tolist()
+            heap_min = np.zeros(len(floors))
+            heap_min[present] = [self._heaps[code].min_value() for code in present]
+
+            floor_branch = ~warmup & (((k < floor) & (window_scores > heap_min[window_codes]))
+                                      | ((category_count[window_codes] - visited) == (floor - k)))
+            slack_branch = ((self.total_seen + np.arange(end - start) >= self._r) & below_ceil
+                            & (window_scores > self._T.min_value())) if self._slack > 0 else np.zeros(end - start, bool)
+            feasible = self._num_feasible_items - (np.cumsum(below_ceil) - below_ceil)
+            fallback_branch = below_ceil & (feasible == self.K - len(self.selected))
+            hits = np.flatnonzero(floor_branch | (~warmup & (slack_branch | fallback_branch)))
+
+            # The arrivals before the first hit are rejected
+            stop = int(hits[0]) if len(hits) else end - start
+            visited_counts = np.bincount(window_codes[:stop], minlength=len(floors))
+            self._visited_categories = (np.array(self._visited_categories) + visited_counts).tolist()
+            self._num_feasible_items -= int(below_ceil[:stop].sum())
+            self.total_seen += stop
+
+            if len(hits):
+                position = start + stop
+                accepted[position] = self._decide(float(scores[position]), int(codes[position]),
+                                                  item_ids[position].item())
+                start = position + 1
+                # Expect the next selection about as far away
+                window = min(max(2 * (stop + 1), _MIN_WINDOW), _MAX_WINDOW)
+            else:
+                start = end
+                window = min(2 * window, _MAX_WINDOW)
+
+        return accepted
+
+    def report_stats(self):
+        """
+        Adds the counters derived from the state since the last report (warm-up, rejected and seen items, heap
+        pushes) to stats and reports it. Does nothing without stats.
+
+        :return: stats
+        """
+        if self.stats is None:
+            return None
+        warmup = sum(min(visited, R) for visited, R in zip(self._visited_categories, self._R))
+        pushes = sum(min(visited, R) for visited, R, floor in zip(self._visited_categories, self._R, self._floors)
+                     if floor > 0)
+        if self.K - sum(self._floors) > 0:
+            pushes += min(self.total_seen, self._r)
+        reported_warmup, reported_seen, reported_selected, reported_pushes = self._reported
+        self.stats.branches["warmup"] += warmup - reported_warmup
+        self.stats.branches["rejected"] += ((self.total_seen - reported_seen) - (warmup - reported_warmup)
+                                            - (len(self.selected) - reported_selected))
+        self.stats.items_seen += self.total_seen - reported_seen
+        self.stats.heap_pushes += pushes - reported_pushes
+        self._reported = (warmup, self.total_seen, len(self.selected), pushes)
+        return self.stats.report()
+
+    def _push_warmup(self, scores, codes, item_ids, warmup, seen):
+        if self._slack > 0:
+            T_items = seen < self._r
+            _push_many(self._T, scores[T_items], item_ids[T_items])
+        if warmup.any():
+            scores = scores[warmup]
+            codes = codes[warmup]
+            item_ids = item_ids[warmup]
+            order = np.argsort(codes, kind="stable")
+            sorted_codes = codes[order]
+            starts = np.flatnonzero(np.concatenate(([True], sorted_codes[1:] != sorted_codes[:-1])))
+            ends = np.append(starts[1:], len(codes))
+            for code, start, end in zip(sorted_codes[starts].tolist(), starts.tolist(), ends.tolist()):
+                group = order[start:end]
+                _push_many(self._heaps[code], scores[group], item_ids[group])
+
+
+def _occurrences(codes):
+    """
+    :return: For every element, the number of equal elements before it.
+    """
+    order = np.argsort(codes, kind="stable")
+    sorted_codes = codes[order]
+    starts = np.flatnonzero(np.concatenate(([True], sorted_codes[1:] != sorted_codes[:-1])))
+    counts = np.diff(np.append(starts, len(codes)))
+    occurrences = np.empty(len(codes), dtype=np.int64)
+    occurrences[order] = np.arange(len(codes)) - np.repeat(starts, counts)
+    return occurrences
+
+
+def _push_many(heap, scores, item_ids):
+    """
+    Pushes arrivals in order, skipping those that would be rejected or pushed out again by larger ones.
+    """
+    capacity = heap._capacity
+    if capacity <= 0 or len(scores) == 0:
+        return
+    keep = np.ones(len(scores), dtype=bool)
+    if len(heap._list) == capacity:
+        # The minimum only grows, an item not above it is rejected
+        keep &= scores > heap._list[0][0]
+    if len(scores) > capacity:
+        kth = np.partition(scores, len(scores) - capacity)[len(scores) - capacity]
+        keep &= scores >= kth
+    for score, item_id in zip(scores[keep].tolist(), item_ids[keep].tolist()):
+        heap.push(score, item_id)
+
+
+def online_diverse_selection(items, K, diversity_constraints, warmup_ratio = 1.0, stats=None, category_count=None):
     """
     Implements the online version of the diverse selection algorithm.
 
+    The warm-up lengths need the number of items of every category, counted in a first pass over the items unless
+    category_count is given. The selection pass then stops after K items are selected, looking up the labels of the
+    items it reads only. Callers holding integer category codes use online_diverse_selection_store instead.
+
     :param items: List of tuples (score, category, item_id), arriving in random order.
     :param K: Number of items to select.
     :param diversity_constraints: Dict {category: (floor, ceil)}
     :param require_k: If the number of feasible items gets to (K -|L|), ignore the ceil condition to ensure the output
     has K feasible items.
+    :param stats: Optional topk.stats.SelectionStats, reported at the end.
+    :param category_count: Optional dict {category: number of items}, e.g. Dataset counts, which saves the counting
+    pass and lets `items` be any iterable.
     :return: List of selected item IDs.
     """
-    selected = []
-
-    num_items_category = {k: 0 for k in diversity_constraints}
-    """k"""
-    visited_categories = {m: 0 for m in diversity_constraints}
-    """m"""
-
-    category_count = {c: 0 for c in diversity_constraints}
-    """n"""
-    for _, category, _ in items:
-        category_count[category] += 1
-
-    R = {category: math.floor(warmup_ratio * (category_count[category] / math.e)) for category in diversity_constraints}
-    heaps = {category: Heap(capacity=floor) for category, (floor, _) in diversity_constraints.items()}
-
-    floor_sum = sum(f for f, _ in diversity_constraints.values())
-    slack = K - floor_sum
-    N = len(items)
-    r = math.floor(warmup_ratio * (N / math.e))
-    T = Heap(capacity=slack)
-    total_seen = 0
-
-    for score, category, item_id in items:
-        floor, ceil = diversity_constraints[category]
-        if total_seen < r:
-            T.push(score, item_id)
-        if visited_categories[category] < R[category]:
-            heaps[category].push(score, item_id)
-        # ((ki < floori)∧(score(x) > дetMinElement(Ti))∨(ni −mi == floori −ki)
-        elif ((num_items_category[category] < floor and score > heaps[category].min_value())
-              or ((category_count[category] - visited_categories[category]) == (floor - num_items_category[category]))):
-
-            if not heaps[category].is_empty():
-                heaps[category].pop()
-
-            selected.append(item_id)
-            num_items_category[category] += 1
-        elif total_seen >= r and score > T.min_value() and num_items_category[category] < ceil and slack > 0:
-            if not T.is_empty():
-                T.pop()
-            selected.append(item_id)
-            num_items_category[category] += 1
-            slack -= 1
-        elif num_items_category[category] < ceil:
-            num_feasible_items = sum(
-                (category_count[category] - visited_categories[category])
-                for category, (_, ceil) in diversity_constraints.items()
-                if (ceil - num_items_category[category]) > 0)
-            if num_feasible_items == (K - len(selected)):
-                selected.append(item_id)
-                num_items_category[category] += 1
-                slack -= 1
-        visited_categories[category] += 1
-        total_seen += 1
-
-        if len(selected) == K:
-            break
-
-    return selected, total_seen
+    if category_count is None:
+        with phase(stats, "count"):
+            category_count = collections.Counter(map(operator.itemgetter(1), items))
+
+    selector = OnlineDiverseSelector(K, diversity_constraints, category_count, warmup_ratio, stats)
+    # Same encoding as the selector's, offer_code saves a call per item
+    code_of = {category: code for code, category in enumerate(diversity_constraints)}
+    offer_code = selector.offer_code
+    with phase(stats, "select"):
+        for score, category, item_id in items:
+            offer_code(score, code_of[category], item_id)
+            if selector.done:
+                break
+
+    selector.report_stats()
+    return selector.selected, selector.total_seen
+
+
+def online_diverse_selection_store(store, K, floors, ceils, warmup_ratio=1.0, batch_size=4096, stats=None):
+    """
+    online_diverse_selection over an ItemStore, the items arriving in store order.
+
+    :param store: topk.items.ItemStore
+    :param floors: Array of floors indexed by category code.
+    :param ceils: Array of ceils indexed by category code.
+    :param batch_size: Number of arrivals given to offer_batch at once.
+    :param stats: Optional topk.stats.SelectionStats, reported at the end.
+    :return: Tuple (list of selected item IDs, total_seen)
+    """
+    selector = OnlineDiverseSelector.from_codes(K, floors.tolist(), ceils.tolist(),
+                                                store.counts[:len(floors)].tolist(), warmup_ratio, stats,
+                                                store.categories[:len(floors)])
+    with phase(stats, "select"):
+        for start in range(0, len(store), batch_size):
+            end = start + batch_size
+            selector.offer_batch(store.scores[start:end], store.codes[start:end], store.ids[start:end])
+            if selector.done:
+                break
+
+    selector.report_stats()
+
+    return selector.selected, selector.total_seen
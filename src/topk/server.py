@@ -0,0 +1,396 @@
+import argparse
+import collections
+import concurrent.futures
+import http.server
+import ipaddress
+import json
+import os
+import socket
+import threading
+import urllib.error
+import urllib.request
+
+import numpy as np
+
+from topk.dataset import load_dataset
+from topk.diversity_metrics import ConstraintPlanner
+from topk.simulation import estimate_online
+from topk.static import DiverseTopKIndex
+
+DEFAULT_PORT = 8765
+RESULT_CACHE_SIZE = 1024
+
+
+class _WarmDataset:
+    """
+    A loaded Dataset with everything the queries reuse: the per-category sorted index and the constraint planner.
+    """
+
+    def __init__(self, dataset, version):
+        self.dataset = dataset
+        self.version = version
+        """Changes when the name is loaded again, so cached results of the old data are never returned"""
+        self.scores = np.asarray(dataset.scores)
+        self.codes = np.asarray(dataset.codes)
+        self.index = DiverseTopKIndex(list(zip(self.scores.tolist(), self.codes.tolist(),
+                                               np.asarray(dataset.ids).tolist())))
+        self.planner = ConstraintPlanner(dataset.category_count())
+
+    def describe(self):
+        return {
+            "N": len(self.dataset),
+            "categories": self.dataset.categories,
+            "counts": np.asarray(self.dataset.counts).tolist(),
+        }
+
+
+class TopKService:
+    """
+    Query logic of the server: warm datasets and an LRU cache of the results, safe to call from many threads.
+
+    Queries refer to categories by code, their position in the dataset's categories. Constraints are given either
+    as a family of topk.diversity_metrics.FAMILIES with K, t and seed, planned on the dataset counts (seed 0 by
+    default so the results are reproducible and cacheable), or as explicit "floors" and "ceils" lists.
+    """
+
+    def __init__(self, cache_size=RESULT_CACHE_SIZE, data_roots=None):
+        """
+        :param cache_size: Number of cached results.
+        :param data_roots: Directories the loaded files must be in, None allows any file (in-process use only).
+        """
+        self.cache_size = cache_size
+        self.data_roots = None if data_roots is None else [os.path.realpath(root) for root in data_roots]
+        self.hits = 0
+        self.misses = 0
+        self._datasets = {}
+        self._versions = 0
+        self._results = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def load(self, name, path, score_column, sensitive_columns, n_largest=None):
+        """
+        Loads a CSV through the dataset cache and warms it under `name`, replacing a dataset of the same name.
+
+        :return: Description of the dataset: N, categories and counts.
+        :raises PermissionError: The file is outside the data roots.
+        """
+        real_path = os.path.realpath(path)
+        if self.data_roots is not None and not any(os.path.commonpath([root, real_path]) == root
+                                                   for root in self.data_roots):
+            raise PermissionError(f"{path} is outside the data roots")
+        dataset = load_dataset(real_path, score_column, sensitive_columns, n_largest)
+        with self._lock:
+            self._versions += 1
+            version = self._versions
+        warm = _WarmDataset(dataset, version)
+        with self._lock:
+            self._datasets[name] = warm
+        return warm.describe()
+
+    def datasets(self):
+        """
+        :return: Dict {name: description}
+        """
+        with self._lock:
+            datasets = dict(self._datasets)
+        return {name: warm.describe() for name, warm in datasets.items()}
+
+    def stats(self):
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "size": len(self._results)}
+
+    def constraints(self, query):
+        """
+        :return: Dict with the "floors" and "ceils" lists indexed by category code.
+        """
+        warm = self._dataset(query)
+        return self._cached(warm, "constraints", query, lambda: self._bounds(warm, query))
+
+    def top_k(self, query):
+        """
+        Optimal diverse top-K of a dataset, see DiverseTopKIndex.
+
+        :return: Dict with the selected "ids" by decreasing score and their total "utility".
+        """
+        warm = self._dataset(query)
+
+        def compute():
+            bounds = self._bounds(warm, query)
+            constraints = dict(enumerate(zip(bounds["floors"], bounds["ceils"])))
+            positions = warm.index.query_positions(int(query["K"]), constraints)
+            return {
+                "ids": [warm.index.ids[position] for position in positions],
+                "utility": float(sum(warm.index.scores[position] for position in positions)),
+            }
+
+        return self._cached(warm, "topk", query, compute)
+
+    def online(self, query):
+        """
+        Expected accuracy and walking distance of the online selection over random arrival orders, see
+        topk.simulation.estimate_online, which takes the optional "warmup_ratio", "tolerance", "confidence",
+        "method", "max_runs" and "estimate_seed" query fields.
+
+        :return: The estimate dict.
+        """
+        warm = self._dataset(query)
+
+        def compute():
+            bounds = self._bounds(warm, query)
+            constraints = dict(enumerate(zip(bounds["floors"], bounds["ceils"])))
+            options = {key: query[key] for key in ("warmup_ratio", "tolerance", "confidence", "method", "max_runs")
+                       if key in query}
+            return estimate_online(warm.scores, warm.codes, int(query["K"]), constraints,
+                                   seed=query.get("estimate_seed", 0), **options)
+
+        return self._cached(warm, "online", query, compute)
+
+    def _dataset(self, query):
+        with self._lock:
+            warm = self._datasets.get(query.get("dataset"))
+        if warm is None:
+            raise KeyError(f"unknown dataset {query.get('dataset')!r}")
+        return warm
+
+    def _bounds(self, warm, query):
+        if "floors" in query:
+            floors = [int(floor) for floor in query["floors"]]
+            ceils = [int(ceil) for ceil in query["ceils"]]
+            if len(floors) != len(warm.dataset.categories) or len(ceils) != len(floors):
+                raise ValueError(f"floors and ceils need one value per category ({len(warm.dataset.categories)})")
+            return {"floors": floors, "ceils": ceils}
+        floors, ceils = warm.planner.bounds(query["family"], int(query["K"]), query.get("t"), query.get("seed", 0))
+        return {"floors": floors.tolist(), "ceils": ceils.tolist()}
+
+    def _cached(self, warm, kind, query, compute):
+        key = (warm.version, kind, json.dumps(query, sort_keys=True))
+        with self._lock:
+            if key in self._results:
+                self._results.move_to_end(key)
+                self.hits += 1
+                return self._results[key]
+            self.misses += 1
+        # Computed outside the lock, two threads may compute the same result once each
+        result = compute()
+        with self._lock:
+            self._results[key] = result
+            while len(self._results) > self.cache_size:
+                self._results.popitem(last=False)
+        return result
+
+
+class _Handler(http.server.BaseHTTPRequestHandler):
+    routes = {
+        ("GET", "/datasets"): lambda service, _: service.datasets(),
+        ("GET", "/stats"): lambda service, _: service.stats(),
+        ("POST", "/datasets"): lambda service, body: service.load(
+            body["name"], body["path"], body["score_column"], body["sensitive_columns"], body.get("n_largest")),
+        ("POST", "/constraints"): lambda service, body: service.constraints(body),
+        ("POST", "/topk"): lambda service, body: service.top_k(body),
+        ("POST", "/online"): lambda service, body: service.online(body),
+    }
+
+    def do_GET(self):
+        self._handle("GET")
+
+    def do_POST(self):
+        self._handle("POST")
+
+    def _handle(self, method):
+        route = self.routes.get((method, self.path))
+        if route is None:
+            self._reply(404, {"error": f"no route {method} {self.path}"})
+            return
+        try:
+            length = int(self.headers.get("Content-Length") or 0)
+            body = json.loads(self.rfile.read(length)) if length else {}
+            result = route(self.server.service, body)
+        except (KeyError, ValueError, TypeError, OSError) as e:
+            self._reply(400, {"error": f"{type(e).__name__}: {e}"})
+            return
+        except Exception as e:
+            # Any other failure still gets an answer instead of a dropped connection
+            self._reply(500, {"error": f"{type(e).__name__}: {e}"})
+            raise
+        self._reply(200, result)
+
+    def _reply(self, status, result):
+        content = json.dumps(result).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+
+class TopKServer(http.server.HTTPServer):
+    """
+    HTTP/JSON front of a TopKService. Every request is handled by a thread of a fixed worker pool, so a slow query
+    does not hold the others up and the number of threads stays bounded.
+
+    Routes: GET /datasets, GET /stats, POST /datasets (load), POST /constraints, POST /topk and POST /online, the
+    POST bodies being the TopKService queries.
+    """
+
+    def __init__(self, address=("127.0.0.1", DEFAULT_PORT), service=None, workers=None, verbose=False,
+                 allow_remote=False):
+        """
+        :param address: Tuple (host, port), port 0 picks a free port.
+        :param service: TopKService, by default a new one loading files from the current directory only.
+        :param workers: Number of worker threads, see concurrent.futures.ThreadPoolExecutor.
+        :param verbose: Whether to log every request.
+        :param allow_remote: Whether to listen on a host other than loopback. There is no authentication, any client
+        that reaches the server can load files from the data roots.
+        """
+        if not allow_remote and not _is_loopback(address[0]):
+            raise ValueError(f"{address[0]!r} is not a loopback host, the server has no authentication")
+        super().__init__(address, _Handler)
+        self.service = TopKService(data_roots=[os.getcwd()]) if service is None else service
+        self.verbose = verbose
+        self._executor = concurrent.futures.ThreadPoolExecutor(workers, thread_name_prefix="topk-server")
+
+    @property
+    def url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def process_request(self, request, client_address):
+        self._executor.submit(self._process, request, client_address)
+
+    def _process(self, request, client_address):
+        try:
+            self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            self.shutdown_request(request)
+
+    def server_close(self):
+        super().server_close()
+        self._executor.shutdown(wait=True)
+
+
+class TopKClient:
+    """
+    Thin client of a TopKServer, the methods mirror TopKService. Errors reported by the server raise ValueError.
+    """
+
+    def __init__(self, url=f"http://127.0.0.1:{DEFAULT_PORT}", timeout=60.0):
+        self.url = url.rstrip("/")
+        self.timeout = timeout
+
+    def _call(self, path, body=None):
+        data = None if body is None else json.dumps(body).encode()
+        request = urllib.request.Request(self.url + path, data, {"Content-Type": "application/json"})
+        try:
+            with urllib.request.urlopen(request, timeout=self.timeout) as response:
+                return json.loads(response.read())
+        except urllib.error.HTTPError as e:
+            raise ValueError(json.loads(e.read()).get("error", str(e))) from None
+
+    def datasets(self):
+        return self._call("/datasets")
+
+    def stats(self):
+        return self._call("/stats")
+
+    def load(self, name, path, score_column, sensitive_columns, n_largest=None):
+        return self._call("/datasets", {"name": name, "path": path, "score_column": score_column,
+                                        "sensitive_columns": list(sensitive_columns), "n_largest": n_largest})
+
+    def constraints(self, dataset, K, family, t=None, seed=0):
+        return self._call("/constraints", {"dataset": dataset, "K": K, "family": family, "t": t, "seed": seed})
+
+    def top_k(self, dataset, K, family=None, t=None, seed=0, floors=None, ceils=None):
+        return self._call("/topk", _query(dataset, K, family, t, seed, floors, ceils))
+
+    def online(self, dataset, K, family=None, t=None, seed=0, floors=None, ceils=None, **options):
+        """
+        :param options: estimate_online arguments, see TopKService.online.
+        """
+        return self._call("/online", dict(_query(dataset, K, family, t, seed, floors, ceils), **options))
+
+
+class LocalTopKClient(TopKClient):
+    """
+    TopKClient answered by a TopKService in this process, for when no server is running. The results are the same
+    as over HTTP, JSON types included.
+    """
+
+    def __init__(self, service=None):
+        self.service = TopKService() if service is None else service
+
+    def _call(self, path, body=None):
+        method = "GET" if body is None else "POST"
+        route = _Handler.routes.get((method, path))
+        if route is None:
+            raise ValueError(f"no route {method} {path}")
+        try:
+            return json.loads(json.dumps(route(self.service, body or {})))
+        except (KeyError, ValueError, TypeError, OSError) as e:
+            raise ValueError(f"{type(e).__name__}: {e}") from None
+
+
+def connect(url=f"http://127.0.0.1:{DEFAULT_PORT}", timeout=60.0, probe_timeout=1.0):
+    """
+    :param timeout: Timeout of the queries, in seconds.
+    :param probe_timeout: Timeout of the check that a server answers, in seconds.
+    :return: TopKClient of the server at url, or a LocalTopKClient when no server answers there.
+    """
+    client = TopKClient(url, probe_timeout)
+    try:
+        client.stats()
+    except OSError:
+        return LocalTopKClient()
+    client.timeout = timeout
+    return client
+
+
+def _is_loopback(host):
+    """
+    :return: Whether every address of host is a loopback address.
+    """
+    try:
+        addresses = {info[4][0] for info in socket.getaddrinfo(host, None)}
+    except (socket.gaierror, UnicodeError):
+        return False
+    return bool(addresses) and all(ipaddress.ip_address(address.split("%")[0]).is_loopback for address in addresses)
+
+
+def _query(dataset, K, family, t, seed, floors, ceils):
+    if floors is not None:
+        return {"dataset": dataset, "K": K, "floors": list(floors), "ceils": list(ceils)}
+    return {"dataset": dataset, "K": K, "family": family, "t": t, "seed": seed}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Serves diverse top-k queries over warm datasets.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--verbose", action="store_true")
+    parser.add_argument("--data-root", action="append", dest="data_roots",
+                        help="Directory the clients may load CSV files from, can be repeated. The current directory "
+                             "by default.")
+    parser.add_argument("--allow-remote", action="store_true",
+                        help="Listen on a host other than loopback. There is no authentication.")
+    args = parser.parse_args(argv)
+    service = TopKService(data_roots=args.data_roots or [os.getcwd()])
+    try:
+        server = TopKServer((args.host, args.port), service, args.workers, args.verbose, args.allow_remote)
+    except ValueError as e:
+        parser.error(f"{e}, pass --allow-remote to listen on it anyway")
+    with server:
+        print(f"Serving on {server.url}")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+
+
+if __name__ == "__main__":
+    main()
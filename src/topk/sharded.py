@@ -0,0 +1,84 @@
+import concurrent.futures
+import os
+
+import numpy as np
+
+from topk.static import _category_groups, _top_indices, diverse_top_k_arrays
+
+
+def shard_summary(scores, categories, diversity_constraints, offset=0):
+    """
+    Summarizes a shard by the best max(floor, ceil) items of every category, which is all diverse_top_k can
+    select from it.
+
+    :param scores: Float array of the shard's item scores.
+    :param categories: Integer array of the shard's category codes.
+    :param diversity_constraints: Dict {category code: (floor, ceil)}
+    :param offset: Global index of the shard's first item.
+    :return: Tuple (scores, categories, indices) of the kept items, indices are global and ascending.
+    """
+    scores = np.asarray(scores, dtype=np.float64)
+    categories = np.asarray(categories)
+    groups = _category_groups(categories)
+    kept = [_top_indices(groups[category], scores, max(floor, ceil))
+            for category, (floor, ceil) in diversity_constraints.items() if category in groups]
+    kept = np.sort(np.concatenate(kept)) if kept else np.empty(0, dtype=np.intp)
+    return scores[kept], categories[kept], kept + offset
+
+
+def merge_summaries(summaries, K, diversity_constraints):
+    """
+    Combines shard summaries into the result diverse_top_k_arrays gives on the whole data.
+
+    :param summaries: Iterable of shard_summary results.
+    :param K: Total number of items to select.
+    :param diversity_constraints: Dict {category code: (floor, ceil)}
+    :return: Array of selected global item indices, by decreasing score.
+    """
+    summaries = list(summaries)
+    if not summaries:
+        return np.empty(0, dtype=np.intp)
+    scores = np.concatenate([summary[0] for summary in summaries])
+    categories = np.concatenate([summary[1] for summary in summaries])
+    indices = np.concatenate([summary[2] for summary in summaries])
+
+    # Ties are broken by array position, so the candidates are laid out in global index order
+    order = np.argsort(indices, kind="stable")
+    selected = diverse_top_k_arrays(scores[order], categories[order], K, diversity_constraints)
+    return indices[order][selected]
+
+
+def sharded_diverse_top_k(scores, categories, K, diversity_constraints, num_shards=None, max_workers=None):
+    """
+    Runs diverse_top_k_arrays over contiguous shards of the items in a process pool.
+
+    Every shard only sends back its per-category best items, so the data exchanged is bounded by the number of
+    shards times the sum of the ceils rather than by the number of items.
+
+    :param scores: Float array of item scores.
+    :param categories: Integer array of category codes, aligned with `scores`.
+    :param K: Total number of items to select.
+    :param diversity_constraints: Dict {category code: (floor, ceil)}
+    :param num_shards: Number of shards, defaults to the number of workers.
+    :param max_workers: Number of worker processes, defaults to the number of CPUs.
+    :return: Array of selected item indices, by decreasing score.
+    """
+    scores = np.asarray(scores, dtype=np.float64)
+    categories = np.asarray(categories)
+    if max_workers is None:
+        max_workers = os.cpu_count() or 1
+    if num_shards is None:
+        num_shards = max_workers
+
+    bounds = np.linspace(0, len(scores), num_shards + 1).astype(np.intp)
+    starts = bounds[:-1].tolist()
+    ends = bounds[1:].tolist()
+    with concurrent.futures.ProcessPoolExecutor(max_workers=max_workers) as executor:
+        summaries = executor.map(
+            shard_summary,
+            [scores[start:end] for start, end in zip(starts, ends)],
+            [categories[start:end] for start, end in zip(starts, ends)],
+            [diversity_constraints] * num_shards,
+            starts,
+        )
+        return merge_summaries(summaries, K, diversity_constraints)
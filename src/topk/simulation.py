@@ -0,0 +1,585 @@
+import math
+from statistics import NormalDist
+
+import numpy as np
+
+from topk.static import diverse_top_k_arrays
+
+
+def simulate_online(scores, categories, K, diversity_constraints, permutations, warmup_ratio=1.0, block_size=4096):
+    """
+    Runs online_diverse_selection on many arrival orders of the same items at once.
+
+    All the permutations advance together one arrival at a time, with the counters, heaps and slack of every run
+    held in arrays. The warm-up heaps only receive items before their category (or, for T, the stream) leaves
+    warm-up and are only popped afterwards, so each heap is the sorted top of its warm-up items and a pop count.
+
+    :param scores: Float array of item scores.
+    :param categories: Integer array of category codes, aligned with `scores`.
+    :param K: Number of items to select.
+    :param diversity_constraints: Dict {category code: (floor, ceil)}
+    :param permutations: Integer array of shape (B, N), each row an arrival order of the item indices.
+    :param warmup_ratio: Fraction of the N/e warm-up period to observe before selecting.
+    :param block_size: Number of permutations simulated together, bounds memory use.
+    :return: Tuple (selections, walking_distances, accuracies). selections is a (B, K) array of selected item
+    indices in selection order, padded with -1. accuracies is NaN for runs that selected fewer than K items.
+    """
+    scores = np.asarray(scores, dtype=np.float64)
+    categories = np.asarray(categories)
+    permutations = np.atleast_2d(np.asarray(permutations))
+
+    # Dense category indices in [0, d), in the order of the constraints
+    keys = np.array(list(diversity_constraints))
+    key_order = np.argsort(keys, kind="stable")
+    positions = np.searchsorted(keys, categories, sorter=key_order)
+    category_index = key_order[np.minimum(positions, len(keys) - 1)]
+    if not np.array_equal(keys[category_index], categories):
+        raise KeyError("every category needs diversity constraints")
+
+    selections = []
+    walking_distances = []
+    for start in range(0, len(permutations), block_size):
+        block_selections, block_walking_distances = _simulate_block(
+            scores, category_index, K, list(diversity_constraints.values()), permutations[start:start + block_size],
+            warmup_ratio)
+        selections.append(block_selections)
+        walking_distances.append(block_walking_distances)
+    selections = np.concatenate(selections) if selections else np.empty((0, K), dtype=np.intp)
+    walking_distances = np.concatenate(walking_distances) if walking_distances else np.empty(0, dtype=np.intp)
+
+    # Same summation order as calc_accuracy
+    optimal = diverse_top_k_arrays(scores, categories, K, diversity_constraints)
+    min_val = scores.min()
+    complete = (selections >= 0).all(axis=1)
+    sum1 = np.zeros(len(selections))
+    sum2 = 0
+    for i in range(len(optimal)):
+        sum2 += scores[optimal[i]] - min_val
+        sum1 += scores[selections[:, i]] - min_val
+    accuracies = np.where(complete, sum1 / sum2 if sum2 else np.nan, np.nan)
+
+    return selections, walking_distances, accuracies
+
+
+def _simulate_block(scores, category_index, K, bounds, permutations, warmup_ratio):
+    B, N = permutations.shape
+    d = len(bounds)
+
+    floors = np.array([f for f, _ in bounds], dtype=np.int64)
+    ceils = np.array([c for _, c in bounds], dtype=np.int64)
+    n = np.bincount(category_index, minlength=d)
+    R = np.array([math.floor(warmup_ratio * (n_j / math.e)) for n_j in n.tolist()], dtype=np.int64)
+    slack0 = K - int(floors.sum())
+    r = math.floor(warmup_ratio * (N / math.e))
+
+    # Rank of every arrival within its category, i.e. visited_categories when it arrives
+    arrival_categories = category_index[permutations]
+    by_category = np.argsort(arrival_categories, axis=1, kind="stable")
+    offsets = np.concatenate(([0], np.cumsum(n)[:-1]))
+    sorted_ranks = np.arange(N) - np.repeat(offsets, n)
+    ranks = np.empty((B, N), dtype=np.int64)
+    np.put_along_axis(ranks, by_category, np.broadcast_to(sorted_ranks, (B, N)), axis=1)
+
+    # Category heaps: top min(floor, R) warm-up scores in ascending order, stored side by side
+    heap_sizes = np.where(floors > 0, np.minimum(floors, R), 0)
+    heap_offsets = np.concatenate(([0], np.cumsum(heap_sizes)[:-1]))
+    heap_values = np.empty((B, max(1, int(heap_sizes.sum()))))
+    for j in range(d):
+        size = int(heap_sizes[j])
+        if size == 0:
+            continue
+        warmup = scores[np.take_along_axis(permutations, by_category[:, offsets[j]:offsets[j] + R[j]], axis=1)]
+        heap_values[:, heap_offsets[j]:heap_offsets[j] + size] = np.sort(warmup, axis=1)[:, R[j] - size:]
+
+    # T holds the top `slack` scores of the first r arrivals, it is only used while slack > 0
+    T_size = max(0, min(slack0, r))
+    T_values = np.empty((B, max(1, T_size)))
+    if T_size:
+        T_values[:, :T_size] = np.sort(scores[permutations[:, :r]], axis=1)[:, r - T_size:]
+
+    num_items_category = np.zeros((B, d), dtype=np.int64)
+    heap_pops = np.zeros((B, d), dtype=np.int64)
+    T_pops = np.zeros(B, dtype=np.int64)
+    slack = np.full(B, slack0, dtype=np.int64)
+    num_selected = np.zeros(B, dtype=np.int64)
+    num_feasible_items = np.full(B, int(n[ceils > 0].sum()), dtype=np.int64)
+    selections = np.full((B, K), -1, dtype=np.intp)
+    walking_distances = np.full(B, N, dtype=np.intp)
+
+    active = np.arange(B)
+    for t in range(N):
+        if len(active) == 0:
+            break
+        item = permutations[active, t]
+        c = category_index[item]
+        score = scores[item]
+        m = ranks[active, t]
+        floor = floors[c]
+        ceil = ceils[c]
+        k = num_items_category[active, c]
+
+        in_warmup = m < R[c]
+
+        pops = heap_pops[active, c]
+        heap_nonempty = pops < heap_sizes[c]
+        heap_slot = np.minimum(heap_offsets[c] + pops, heap_values.shape[1] - 1)
+        heap_min = np.where(heap_nonempty, heap_values[active, heap_slot], -1.0)
+        floor_branch = ~in_warmup & (((k < floor) & (score > heap_min)) | ((n[c] - m) == (floor - k)))
+
+        T_nonempty = T_pops[active] < T_size
+        T_min = np.where(T_nonempty, T_values[active, np.minimum(T_pops[active], T_values.shape[1] - 1)], -1.0)
+        slack_branch = (~in_warmup & ~floor_branch & (t >= r) & (score > T_min) & (k < ceil)
+                        & (slack[active] > 0))
+
+        fallback_branch = (~in_warmup & ~floor_branch & ~slack_branch & (k < ceil)
+                           & (num_feasible_items[active] == K - num_selected[active]))
+
+        accepted = floor_branch | slack_branch | fallback_branch
+
+        heap_pops[active[floor_branch & heap_nonempty], c[floor_branch & heap_nonempty]] += 1
+        T_pops[active[slack_branch & T_nonempty]] += 1
+        slack[active[slack_branch | fallback_branch]] -= 1
+
+        rows = active[accepted]
+        selections[rows, num_selected[rows]] = item[accepted]
+        num_selected[rows] += 1
+        num_items_category[rows, c[accepted]] += 1
+
+        k = k + accepted
+        reached_ceil = accepted & (k == ceil)
+        num_feasible_items[active[reached_ceil]] -= n[c[reached_ceil]] - m[reached_ceil]
+        num_feasible_items[active] -= k < ceil
+
+        finished = num_selected[active] == K
+        walking_distances[active[finished]] = t + 1
+        active = active[~finished]
+
+    return selections, walking_distances
+
+
+def estimate_online(scores, categories, K, diversity_constraints, warmup_ratio=1.0, tolerance=0.01, confidence=0.95,
+                    method="normal", max_runs=100_000, block_size=512, seed=0):
+    """
+    Estimates the expected accuracy and walking distance of online_diverse_selection over uniformly random arrival
+    orders.
+
+    The selection depends on the joint arrival order of every category through the shared slack, T and the
+    feasibility fallback, so the expectations have no tractable closed form with a guaranteed error
+    (approximate_online is a fast one without a bound, for constraints with no slack). They are estimated instead
+    from simulate_online runs, drawing only as many arrival orders as the requested error bound needs:
+
+    - "normal": blocks of runs are added until the confidence interval half-widths (normal approximation with the
+      sample standard deviation) are within tolerance.
+    - "hoeffding": a fixed number of runs from Hoeffding's inequality, a distribution-free bound using the range of
+      each quantity: [0, (top-K sum - K min) / (optimal sum - K min)] for the accuracy and [0, N] for the walking
+      distance.
+
+    :param scores: Float array of item scores.
+    :param categories: Integer array of category codes, aligned with `scores`.
+    :param K: Number of items to select.
+    :param diversity_constraints: Dict {category code: (floor, ceil)}
+    :param warmup_ratio: Fraction of the N/e warm-up period to observe before selecting.
+    :param tolerance: Half-width of the interval for the accuracy, and for the walking distance divided by N.
+    :param confidence: Probability that the interval holds the expectation.
+    :param method: "normal" or "hoeffding".
+    :param max_runs: Largest number of simulated arrival orders, the bound may then not be met.
+    :param block_size: Number of arrival orders simulated together.
+    :param seed: Seed of the arrival orders.
+    :return: Dict with the estimates "accuracy" (over the runs that select K items), "walking_distance" and
+    "completion_rate", the half-widths "accuracy_error" and "walking_distance_error", and the number of "runs".
+    """
+    scores = np.asarray(scores, dtype=np.float64)
+    categories = np.asarray(categories)
+    N = len(scores)
+    rng = np.random.default_rng(seed)
+    if sum(min(ceil, int((categories == c).sum())) for c, (_, ceil) in diversity_constraints.items()) < K:
+        # No run selects K items and every run walks the whole stream
+        return {"accuracy": math.nan, "accuracy_error": 0.0, "walking_distance": float(N),
+                "walking_distance_error": 0.0, "completion_rate": 0.0, "runs": 0}
+
+    if method == "hoeffding":
+        optimal = diverse_top_k_arrays(scores, categories, K, diversity_constraints)
+        min_val = scores.min()
+        top = np.sort(scores)[::-1][:len(optimal)]
+        optimal_sum = (scores[optimal] - min_val).sum()
+        accuracy_range = (top - min_val).sum() / optimal_sum if optimal_sum else 1.0
+        # Both quantities use the same runs, each gets half of the failure probability
+        runs = math.ceil(max(accuracy_range, 1.0) ** 2 * math.log(4 / (1 - confidence)) / (2 * tolerance ** 2))
+        target_runs = min(runs, max_runs)
+    elif method == "normal":
+        z = NormalDist().inv_cdf(0.5 + confidence / 2)
+        target_runs = max_runs
+    else:
+        raise ValueError(f"unknown method {method!r}, expected 'normal' or 'hoeffding'")
+
+    accuracies = []
+    walking_distances = []
+    runs = 0
+    while runs < target_runs:
+        size = min(block_size, target_runs - runs)
+        permutations = rng.permuted(np.broadcast_to(np.arange(N), (size, N)), axis=1)
+        _, block_walking_distances, block_accuracies = simulate_online(
+            scores, categories, K, diversity_constraints, permutations, warmup_ratio, block_size)
+        accuracies.append(block_accuracies)
+        walking_distances.append(block_walking_distances)
+        runs += size
+
+        if method == "normal":
+            accuracy_error, walking_distance_error = _normal_errors(accuracies, walking_distances, z)
+            if accuracy_error <= tolerance and walking_distance_error <= tolerance * N:
+                break
+
+    accuracies = np.concatenate(accuracies)
+    walking_distances = np.concatenate(walking_distances).astype(np.float64)
+    complete = accuracies[~np.isnan(accuracies)]
+    if method == "normal":
+        accuracy_error, walking_distance_error = _normal_errors([accuracies], [walking_distances], z)
+    else:
+        failure = 4 / (1 - confidence)
+        accuracy_error = (max(accuracy_range, 1.0) * math.sqrt(math.log(failure) / (2 * len(complete)))
+                          if len(complete) else math.inf)
+        walking_distance_error = N * math.sqrt(math.log(failure) / (2 * runs))
+
+    return {
+        "accuracy": float(complete.mean()) if len(complete) else math.nan,
+        "accuracy_error": float(accuracy_error),
+        "walking_distance": float(walking_distances.mean()),
+        "walking_distance_error": float(walking_distance_error),
+        "completion_rate": len(complete) / runs,
+        "runs": runs,
+    }
+
+
+def _normal_errors(accuracies, walking_distances, z):
+    """
+    :return: Confidence interval half-widths of the mean accuracy (complete runs) and walking distance.
+    """
+    accuracies = np.concatenate(accuracies)
+    accuracies = accuracies[~np.isnan(accuracies)]
+    walking_distances = np.concatenate(walking_distances)
+    # Fewer than two runs say nothing about the spread
+    accuracy_error = z * accuracies.std(ddof=1) / math.sqrt(len(accuracies)) if len(accuracies) > 1 else math.inf
+    walking_distance_error = (z * walking_distances.std(ddof=1) / math.sqrt(len(walking_distances))
+                              if len(walking_distances) > 1 else math.inf)
+    return accuracy_error, walking_distance_error
+
+
+def approximate_online(scores, categories, K, diversity_constraints, warmup_ratio=1.0):
+    """
+    Approximates the expected accuracy and walking distance of online_diverse_selection over uniformly random
+    arrival orders without simulating any, for constraints whose floors add up to K.
+
+    Each category's floor picks follow a Markov chain over the rank of its heap minimum and the number of items
+    above it that already arrived, stepped over the category's own arrivals. Walking distance and accuracy follow
+    from when every chain finishes and the expected scores of its picks.
+
+    There is no guaranteed bound. Against 1000 to 3000 simulate_online runs for each of the 57 such settings of
+    astronauts.csv, the Netflix dataset and a lognormal synthetic dataset (K from 5 to 40, every ConstraintPlanner
+    family, warm-up ratios 1, 1/4 and 1/16) the accuracy is within 0.011 and the walking distance within 0.9% of N.
+    With slack picks the chains are only coupled through expected counts and the error reaches 0.19, so those
+    constraints are refused, estimate_online bounds them. It runs in tens of milliseconds on these datasets.
+
+    :param scores: Float array of item scores.
+    :param categories: Integer array of category codes, aligned with `scores`.
+    :param K: Number of items to select.
+    :param diversity_constraints: Dict {category code: (floor, ceil)}, the floors adding up to K.
+    :param warmup_ratio: Fraction of the N/e warm-up period to observe before selecting.
+    :return: Dict with the expected "accuracy" of the runs that select K items (as calc_accuracy, NaN when the
+    constraints cannot be met) and the expected "walking_distance".
+    """
+    if sum(floor for floor, _ in diversity_constraints.values()) != K:
+        raise ValueError("approximate_online needs floors that add up to K, use estimate_online")
+    scores = np.asarray(scores, dtype=np.float64)
+    categories = np.asarray(categories)
+    N = len(scores)
+    if not np.isin(categories, list(diversity_constraints)).all():
+        raise KeyError("every category needs diversity constraints")
+    if sum(min(ceil, int((categories == c).sum())) for c, (_, ceil) in diversity_constraints.items()) < K:
+        return {"accuracy": math.nan, "walking_distance": float(N)}
+
+    log_factorials = np.concatenate(([0.0], np.cumsum(np.log(np.arange(1, N + 2)))))
+    points = np.unique(np.round(np.linspace(0, N - 1, min(N, _GLOBAL_POINTS))).astype(np.int64))
+
+    # P(every floor is met by each point of the stream) and the floor picks
+    done = np.ones(len(points))
+    floor_total = 0.0
+    floor_count = 0.0
+    for c, (floor, _) in diversity_constraints.items():
+        if floor == 0:
+            continue
+        category_scores = scores[categories == c]
+        category = _Category(log_factorials, category_scores, floor, warmup_ratio)
+        pick_mass, score_sum = category.picks()
+        floor_total += score_sum.sum()
+        floor_count += pick_mass.sum()
+        done *= pick_mass[-1] @ _arrival_tails(log_factorials, N, len(category_scores), points + 1,
+                                               category.position + 1).T
+
+    # Same normalisation as calc_accuracy
+    min_val = scores.min()
+    optimal = diverse_top_k_arrays(scores, categories, K, diversity_constraints)
+    optimal_sum = (scores[optimal] - min_val).sum()
+    accuracy = (floor_total - floor_count * min_val) / optimal_sum if optimal_sum else math.nan
+    walking_distance = N - np.interp(np.arange(N - 1), points, done).sum()
+    return {"accuracy": float(accuracy), "walking_distance": float(walking_distance)}
+
+
+# Grid sizes of approximate_online: rank buckets of the heap minimum, count bins of the items above it that already
+# arrived, time buckets, and stream points of the walking distance
+_RANK_BUCKETS = 32
+_COUNT_BINS = 8
+_TIME_BUCKETS = 64
+_GLOBAL_POINTS = 256
+
+
+def _log_binomial(log_factorials, n, k):
+    """
+    :return: log C(n, k), -inf outside 0 <= k <= n.
+    """
+    n, k = np.broadcast_arrays(np.asarray(n), np.asarray(k))
+    defined = (n >= k) & (k >= 0)
+    n = np.where(defined, n, 0)
+    k = np.where(defined, k, 0)
+    return np.where(defined, log_factorials[n] - log_factorials[k] - log_factorials[n - k], -np.inf)
+
+
+def _log(x):
+    return np.log(np.maximum(x, 0.0), where=x > 0, out=np.full(np.shape(x), -np.inf))
+
+
+def _edges(size, count):
+    """
+    :return: At most count + 1 bucket edges over [0, size], one per item when size <= count.
+    """
+    if size <= count:
+        return np.arange(size + 1)
+    return np.unique(np.round(np.linspace(0, size, count + 1)).astype(np.int64))
+
+
+def _hypergeometric(log_factorials, population, successes, draws, values):
+    with np.errstate(invalid="ignore"):
+        log_pmf = (_log_binomial(log_factorials, successes, values)
+                   + _log_binomial(log_factorials, population - successes, draws - values)
+                   - _log_binomial(log_factorials, population, draws))
+    return np.exp(np.nan_to_num(log_pmf, nan=-np.inf))
+
+
+def _arrival_tails(log_factorials, N, n, draws, counts):
+    """
+    :return: [len(draws), len(counts)] P(at least counts[j] of the n items of a category among the first draws[i]
+    arrivals)
+    """
+    x = np.arange(n + 1)
+    pmf = _hypergeometric(log_factorials, N, n, draws[:, None], x[None, :])
+    tail = np.concatenate((np.cumsum(pmf[:, ::-1], axis=1)[:, ::-1], np.zeros((len(draws), 1))), axis=1)
+    return tail[:, np.minimum(counts, n + 1)]
+
+
+class _Threshold:
+    """
+    Minimum of a warm-up heap, the top H of the first R of n items, popped once per pick.
+
+    States are buckets of the rank of the minimum among the n items, state B is the empty heap. Given the rank x
+    of the minimum, the other H - 1 heap items are uniform over the x - 1 better ranks, which gives the moves of a
+    pop and how many of the items above the minimum are in the heap.
+    """
+
+    def __init__(self, log_factorials, sorted_scores, R, H, size):
+        n = len(sorted_scores)
+        x = np.arange(1, n + 1)
+        if H > 0:
+            pmf = np.exp(_log_binomial(log_factorials, x - 1, H - 1) + _log_binomial(log_factorials, n - x, R - H)
+                         - _log_binomial(log_factorials, n, R))
+        else:
+            pmf = np.zeros(n)
+        # Pops only improve the rank, the buckets cover the likely starting ranks, the best ones one by one
+        cap = int(np.searchsorted(np.cumsum(pmf), 1 - 1e-9)) + 2 if H > 0 else n
+        cap = min(max(cap, size), n)
+        if cap <= size:
+            edges = np.arange(1, cap + 1)
+        else:
+            edges = np.unique(np.concatenate((
+                np.arange(1, size // 2 + 1),
+                np.round(np.linspace(size // 2 + 1, cap, size - size // 2)).astype(np.int64))))
+        edges = np.append(edges, n + 1)
+        low, high = edges[:-1], edges[1:]
+        rank = (low + high - 1) // 2
+        self.B = B = len(rank)
+        self.rank = rank
+
+        # Items strictly above the minimum, and the mean score of the items above and below it
+        above = n - np.searchsorted(sorted_scores[::-1], sorted_scores[rank - 1], side="right")
+        self.above = np.append(above, n)
+        prefix = np.concatenate(([0.0], np.cumsum(sorted_scores)))
+        self.above_mean = np.append(np.where(above > 0, prefix[above] / np.maximum(above, 1), sorted_scores[0]),
+                                    prefix[n] / n)
+        self.below_mean = np.append(np.where(above < n, (prefix[n] - prefix[above]) / np.maximum(n - above, 1),
+                                             sorted_scores[-1]), prefix[n] / n)
+        # Share of the items above the minimum held by each other heap item
+        self.heap_share = above / np.maximum(rank - 1, 1)
+
+        self.start = np.zeros(B + 1)
+        if H > 0:
+            cdf = np.concatenate(([0.0], np.cumsum(pmf)))
+            self.start[:B] = cdf[high - 1] - cdf[low - 1]
+        else:
+            self.start[B] = 1.0
+
+        # With h items left, the next minimum is the best of the h - 1 others
+        h = np.arange(H + 1)[:, None]
+        self.log_norms = _log_binomial(log_factorials, rank[None, :] - 1, h - 1)
+        upper = _log_binomial(log_factorials, high[None, :] - 1, h - 1)
+        lower = _log_binomial(log_factorials, low[None, :] - 1, h - 1)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            self.log_moves = np.nan_to_num(upper + np.log1p(-np.exp(lower - upper)), nan=-np.inf)
+            self.stays = np.where(np.isfinite(self.log_norms), -np.expm1(lower - self.log_norms), 0.0)
+
+    def pop_kernel(self, h, G):
+        """
+        :return: [B * G + 1, B * G + 1] transition of a pop with h items in the heap, over the states (rank bucket,
+        count bin) and empty. The arrived items above the old minimum stay above the new one in proportion.
+        """
+        B = self.B
+        C = B * G + 1
+        kernel = np.zeros((C, C))
+        kernel[C - 1, C - 1] = 1.0
+        if h <= 1:
+            kernel[:, C - 1] = 1.0
+            return kernel
+        b = np.arange(B)
+        with np.errstate(invalid="ignore", over="ignore"):
+            move = np.exp(self.log_moves[h][None, :] - self.log_norms[h][:, None])
+        move = np.where(b[None, :] < b[:, None], np.nan_to_num(move), 0.0)
+        move[b, b] = self.stays[h]
+
+        # Hypergeometric thinning of the c arrived items among the free ones above the old minimum
+        above = self.above[:B]
+        free_old = np.round(np.maximum(above - (h - 1) * self.heap_share, 0))[:, None]
+        free_new = np.round(np.maximum(above - (h - 2) * self.heap_share, 0))[None, :]
+        thin = np.zeros((B, B, G, G))
+        for c in range(1, G + 1):
+            old = np.maximum(free_old, c)
+            new = np.minimum(free_new, old)
+            gone = old - new
+            kept = [np.ones_like(new)]
+            lost = [np.ones_like(gone)]
+            total = np.ones_like(old)
+            for j in range(1, c + 1):
+                kept.append(kept[-1] * np.maximum(new - j + 1, 0) / j)
+                lost.append(lost[-1] * np.maximum(gone - j + 1, 0) / j)
+                total = total * (old - j + 1) / j
+            for g in range(min(c + 1, G)):
+                thin[:, :, c - 1, g] = kept[g] * lost[c - g] / total
+        thin[..., G - 1] = np.clip(1.0 - thin[..., :G - 1].sum(axis=-1), 0.0, 1.0)
+        kernel[:C - 1, :C - 1] = (move[:, :, None, None] * thin).transpose(0, 2, 1, 3).reshape(B * G, B * G)
+        return kernel
+
+
+class _Category:
+    """
+    Floor picks of one category over its own arrivals.
+    """
+
+    def __init__(self, log_factorials, scores, floor, warmup_ratio):
+        scores = np.sort(scores)[::-1]
+        self.n = n = len(scores)
+        self.floor = floor
+        self.R = R = math.floor(warmup_ratio * (n / math.e))
+        self.H = H = min(floor, R) if floor > 0 else 0
+        self.threshold = _Threshold(log_factorials, scores, R, H, _RANK_BUCKETS)
+        edges = R + _edges(n - R, _TIME_BUCKETS)
+        self.low, self.high = edges[:-1], edges[1:]
+        self.position = (self.low + self.high - 1) // 2
+        self.log_factorials = log_factorials
+        self.mean = scores.mean()
+
+    def _phi(self, x, a):
+        """
+        :return: log((n - x - a)! / (n - x)!), minus the log chance that a given unseen items all arrive after the
+        first x own arrivals, up to a term constant in x. inf when fewer than a items remain.
+        """
+        remaining = self.n - x
+        grid = np.arange(len(self.log_factorials))
+        value = (np.interp(np.maximum(remaining - a, 0), grid, self.log_factorials)
+                 - np.interp(remaining + 0.0 * a, grid, self.log_factorials))
+        return np.where(remaining - a < 0, np.inf, value)
+
+    def picks(self):
+        """
+        :return: Tuple (pick_mass, score_sum), [floor, Q] probability that the j-th floor pick falls in each time
+        bucket and the expected score it adds there.
+        """
+        th = self.threshold
+        B, G = th.B, _COUNT_BINS
+        C = B * G + 1
+        n, f, H = self.n, self.floor, self.H
+        Q = len(self.low)
+        pick_mass = np.zeros((f, Q))
+        score_sum = np.zeros((f, Q))
+        if f == 0 or f > n - self.R:
+            return pick_mass, score_sum
+
+        # mass[q] is the state distribution after the previous pick, at the start of time bucket q (0: warm-up end)
+        mass = np.zeros((Q + 1, C))
+        start = np.zeros((B, G))
+        start[:, 0] = th.start[:B]
+        mass[0, :C - 1] = start.reshape(-1)
+        mass[0, C - 1] = th.start[B]
+        m0 = np.concatenate(([self.R], self.position + 1))
+        low, high = self.low, self.high
+        above = np.repeat(th.above[:B], G)
+        counts = np.tile(np.arange(G), B)
+        share = np.repeat(th.heap_share, G)
+        above_mean = np.repeat(th.above_mean[:B], G)
+        below_mean = np.repeat(th.below_mean[:B], G)
+        stay = np.concatenate(([0.0], 1.0 - 1.0 / np.maximum(high - low, 1)))
+        for j in range(f):
+            h = H - j
+            forced_at = n - (f - j)
+            # Unseen items above the minimum, a pick is the first of them to arrive
+            a = np.maximum(above - (h - 1) * share - counts, 0.0) if h > 0 else np.zeros(C - 1)
+            src = np.minimum(m0, forced_at)[:, None]
+            lo = np.minimum(low, forced_at)[:, None]
+            hi = np.minimum(high, forced_at)[:, None]
+            phi_src = self._phi(src, a[None, :])
+            phi_lo = self._phi(lo, a[None, :])
+            phi_hi = self._phi(hi, a[None, :])
+            phi_forced = self._phi(np.array([[forced_at]]), a[None, :])[0]
+            nat_mass = mass[:, :C - 1]
+            with np.errstate(invalid="ignore", divide="ignore", over="ignore"):
+                log_src = _log(nat_mass) + phi_src
+                before = np.logaddexp.accumulate(log_src, axis=0)[:Q]
+                log_diff = -phi_lo + np.log1p(-np.exp(phi_lo - phi_hi))
+                log_diff = np.where(np.isfinite(phi_lo), log_diff, -np.inf)
+                cross = np.nan_to_num(np.exp(before + log_diff))
+                same = -np.expm1(np.minimum(phi_src[1:] - phi_hi, 0.0))
+                same = np.where(np.isfinite(phi_src[1:]), same, 1.0)
+                survival = np.exp(np.minimum(phi_src - phi_forced[None, :], 0.0))
+                survival = np.nan_to_num(np.where(np.isfinite(phi_src), survival, 0.0))
+            natural = cross + nat_mass[1:] * same
+
+            # Runs with no pick before the last f - j items take them all
+            forced_mass = nat_mass * survival
+            forced_bucket = np.minimum(np.searchsorted(high, np.maximum(forced_at, m0), side="right"), Q - 1)
+            forced = np.zeros((Q, C - 1))
+            np.add.at(forced, forced_bucket, forced_mass)
+            left = f - j
+            forced_above = np.minimum(a, left)
+            forced_score = (forced_above * above_mean + (left - forced_above) * below_mean) / left
+
+            # An empty heap takes the next arrival
+            empty = mass[:, C - 1]
+            empty_next = np.zeros(Q)
+            empty_next[0] += empty[0]
+            empty_next += empty[1:] * stay[1:]
+            empty_next[1:] += (empty[1:] * (1 - stay[1:]))[:-1]
+
+            score_sum[j] = ((natural * above_mean).sum(axis=1) + (forced * forced_score).sum(axis=1)
+                            + empty_next * self.mean)
+            pick_mass[j] = natural.sum(axis=1) + forced.sum(axis=1) + empty_next
+            picked = np.zeros((Q, C))
+            picked[:, :C - 1] = natural + forced
+            picked[:, C - 1] = empty_next
+            mass = np.zeros((Q + 1, C))
+            mass[1:] = picked @ th.pop_kernel(h, G) if h > 0 else picked
+        return pick_mass, score_sum
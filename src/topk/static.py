@@ -1,33 +1,416 @@
+import heapq
 
-def diverse_top_k(items, K, diversity_constraints):
+import numpy as np
+
+from topk.diversity_metrics import INFEASIBLE, ConstraintPlanner
+from topk.stats import phase
+
+
+def diverse_top_k(items, K, diversity_constraints, stats=None):
     """
     Selects K items maximizing utility while ensuring diversity constraints.
 
-    :param items: List of tuples (score, category, item_id), sorted by decreasing score.
+    Label level adapter of diverse_top_k_codes: the items are read once, only until K items are selected, and the
+    label of every item read is looked up once. Callers holding integer category codes skip the lookup with
+    diverse_top_k_codes, or diverse_top_k_store over a topk.items.ItemStore.
+
+    :param items: Iterable of tuples (score, category, item_id), sorted by decreasing score.
     :param K: Total number of items to select.
     :param diversity_constraints: Dict {category: (floor, ceil)}
+    :param stats: Optional topk.stats.SelectionStats, reported at the end.
     :return: List of selected item IDs.
     """
+    code_of = {category: code for code, category in enumerate(diversity_constraints)}
+    floors = [f for f, _ in diversity_constraints.values()]
+    ceils = [c for _, c in diversity_constraints.values()]
+    ids = []
+
+    def codes():
+        # IDs of the items read, the scan returns positions
+        append = ids.append
+        for _, category, item_id in items:
+            append(item_id)
+            yield code_of[category]
+
+    with phase(stats, "scan"):
+        selected = diverse_top_k_codes(codes(), K, floors, ceils, stats, list(diversity_constraints))
+    if stats is not None:
+        stats.report()
+    return [ids[position] for position in selected]
+
+
+def diverse_top_k_codes(codes, K, floors, ceils, stats=None, labels=None):
+    """
+    diverse_top_k over integer category codes.
+
+    :param codes: Iterable of the category codes of the items, sorted by decreasing score.
+    :param K: Total number of items to select.
+    :param floors: Sequence of floors indexed by category code.
+    :param ceils: Sequence of ceils indexed by category code.
+    :param stats: Optional topk.stats.SelectionStats the scan is added to.
+    :param labels: Optional category labels indexed by code, for stats.
+    :return: List of the selected positions in `codes`.
+    """
     selected = []
-    category_count = {k_: 0 for k_ in diversity_constraints}
+    category_count = [0] * len(floors)
 
     # Compute slack
-    floor_sum = sum(f for f, _ in diversity_constraints.values())
+    floor_sum = sum(floors)
     slack = K - floor_sum
 
-    for score, category, item_id in items:
-        floor, ceil = diversity_constraints[category]
+    position = -1
+    for position, category in enumerate(codes):
+        count = category_count[category]
 
         # Always select items needed to meet floor constraints
-        if category_count[category] < floor:
-            selected.append(item_id)
-            category_count[category] += 1
-        elif category_count[category] < ceil and slack > 0:
-            selected.append(item_id)
-            category_count[category] += 1
+        if count < floors[category]:
+            selected.append(position)
+            category_count[category] = count + 1
+        elif count < ceils[category] and slack > 0:
+            selected.append(position)
+            category_count[category] = count + 1
             slack -= 1
 
         if len(selected) == K:
             break
 
+    if stats is not None:
+        stats.record_scan(position + 1, max(K - floor_sum, 0) - max(slack, 0), category_count, labels)
+    return selected
+
+
+def diverse_top_k_store(store, K, floors, ceils, stats=None):
+    """
+    diverse_top_k over an ItemStore, in any order.
+
+    :param store: topk.items.ItemStore
+    :param K: Total number of items to select.
+    :param floors: Array of floors indexed by category code.
+    :param ceils: Array of ceils indexed by category code.
+    :param stats: Optional topk.stats.SelectionStats, see diverse_top_k_arrays.
+    :return: Array of selected item IDs, by decreasing score.
+    """
+    diversity_constraints = {code: (floor, ceil) for code, (floor, ceil) in enumerate(zip(floors.tolist(),
+                                                                                          ceils.tolist()))}
+    return store.ids[diverse_top_k_arrays(store.scores, store.codes, K, diversity_constraints, stats)]
+
+
+def diverse_top_k_many(items, queries):
+    """
+    Answers several diverse_top_k queries in a single sweep over the items.
+
+    Every query keeps its own counters and slack, and leaves the sweep as soon as it has selected K items.
+
+    :param items: List of tuples (score, category, item_id), sorted by decreasing score.
+    :param queries: List of tuples (K, diversity_constraints), diversity_constraints as in diverse_top_k.
+    :return: List of selected item ID lists, one per query.
+    """
+    results = [[] for _ in queries]
+
+    # [K, diversity_constraints, category_count, slack, selected] per query
+    active = [[K, diversity_constraints, {k_: 0 for k_ in diversity_constraints},
+               K - sum(f for f, _ in diversity_constraints.values()), selected]
+              for (K, diversity_constraints), selected in zip(queries, results)]
+
+    for score, category, item_id in items:
+        if not active:
+            break
+        finished = False
+        for state in active:
+            K, diversity_constraints, category_count, slack, selected = state
+            floor, ceil = diversity_constraints[category]
+
+            # Always select items needed to meet floor constraints
+            if category_count[category] < floor:
+                selected.append(item_id)
+                category_count[category] += 1
+            elif category_count[category] < ceil and slack > 0:
+                selected.append(item_id)
+                category_count[category] += 1
+                state[3] = slack - 1
+
+            if len(selected) == K:
+                finished = True
+        if finished:
+            active = [state for state in active if len(state[4]) != state[0]]
+
+    return results
+
+
+class DiverseTopKIndex:
+    """
+    Per-category sorted index answering many diverse_top_k queries over the same items.
+
+    The items are sorted once by decreasing score (ties keep their input order), and every category keeps the
+    positions of its items in that order. A query takes each category's floor prefix and merges the heads of the
+    [floor, ceil) ranges to fill the slack, in O(K log K + d log d) instead of a scan over all the items.
+    """
+
+    def __init__(self, items):
+        """
+        :param items: List of tuples (score, category, item_id), in any order.
+        """
+        items = sorted(items, key=lambda item: item[0], reverse=True)
+        self.scores = [score for score, _, _ in items]
+        self.ids = [item_id for _, _, item_id in items]
+        self.category_positions = {}
+        for position, (_, category, _) in enumerate(items):
+            self.category_positions.setdefault(category, []).append(position)
+
+    def __len__(self):
+        return len(self.ids)
+
+    def query_positions(self, K, diversity_constraints):
+        """
+        :return: Sorted list of the selected positions in the score order.
+        """
+        floor_sum = sum(f for f, _ in diversity_constraints.values())
+        slack = K - floor_sum
+
+        floor_positions = []
+        heads = []
+        for category, (floor, ceil) in diversity_constraints.items():
+            positions = self.category_positions.get(category)
+            if positions is None:
+                continue
+            floor_positions.extend(positions[:floor])
+            if floor < min(ceil, len(positions)):
+                heads.append((positions[floor], floor, ceil, category))
+
+        if slack < 0:
+            # More floor items than K: the scan stops after the K best of them
+            return heapq.nsmallest(K, floor_positions)
+
+        # Merge the heads of the [floor, ceil) ranges until the slack is used
+        heapq.heapify(heads)
+        slack_positions = []
+        while heads and len(slack_positions) < slack:
+            position, rank, ceil, category = heads[0]
+            slack_positions.append(position)
+            positions = self.category_positions[category]
+            if rank + 1 < min(ceil, len(positions)):
+                heapq.heapreplace(heads, (positions[rank + 1], rank + 1, ceil, category))
+            else:
+                heapq.heappop(heads)
+
+        return sorted(floor_positions + slack_positions)
+
+    def query(self, K, diversity_constraints):
+        """
+        Same result as diverse_top_k on the items sorted by decreasing score. Categories without constraints are
+        never selected.
+
+        :param K: Total number of items to select.
+        :param diversity_constraints: Dict {category: (floor, ceil)}
+        :return: List of selected item IDs.
+        """
+        ids = self.ids
+        return [ids[position] for position in self.query_positions(K, diversity_constraints)]
+
+    def sweep(self, Ks, categories, floors, ceils, selections=True):
+        """
+        Answers query for many K at once, e.g. every K from 1 to Kmax with ConstraintPlanner.sweep constraints.
+
+        Every category takes a prefix of its positions: at least min(floor, n) of them, and the slack goes to the
+        smallest positions of the [floor, ceil) ranges. The number taken from each category is then a clipped count
+        of its positions below a threshold position, found by a binary search run for all the K together, and the
+        utility is a sum of per-category prefix sums. The curve costs O(|Ks| d log N) on top of the index.
+
+        :param Ks: Sequence of the numbers of items to select.
+        :param categories: Sequence of the d categories the columns of floors and ceils refer to.
+        :param floors: Integer array of shape (len(Ks), d).
+        :param ceils: Integer array of shape (len(Ks), d).
+        :param selections: Whether to also build the selected item IDs of every K.
+        :return: Tuple (utilities, selections): float array of the total score selected for every K, and the list
+        of the query results (None without selections).
+        """
+        positions, prefix_sums = self._category_arrays(categories)
+        Ks = np.asarray(Ks, dtype=np.int64)
+        floors = np.asarray(floors, dtype=np.int64).reshape(len(Ks), len(positions))
+        ceils = np.asarray(ceils, dtype=np.int64).reshape(len(Ks), len(positions))
+        n = np.array([len(category_positions) for category_positions in positions], dtype=np.int64)
+
+        slack = Ks - floors.sum(axis=1)
+        with_slack = (slack >= 0)[:, None]
+        # With slack the floor prefixes are always taken, without it the K best floor items are
+        low = np.where(with_slack, np.minimum(floors, n), 0)
+        high = np.where(with_slack, np.maximum(np.minimum(ceils, n), low), np.minimum(floors, n))
+        target = np.where(slack >= 0, slack, Ks)
+
+        def taken(threshold):
+            return np.stack([np.clip(np.searchsorted(category_positions, threshold), low[:, c], high[:, c])
+                             for c, category_positions in enumerate(positions)], axis=1) if len(positions) else low
+
+        # Smallest threshold position with `target` items above it in the ranges, or all of them
+        lower = np.zeros(len(Ks), dtype=np.int64)
+        upper = np.full(len(Ks), len(self.ids), dtype=np.int64)
+        while (lower < upper).any():
+            middle = (lower + upper) // 2
+            enough = (taken(middle) - low).sum(axis=1) >= target
+            upper = np.where(enough, middle, upper)
+            lower = np.where(enough, lower, middle + 1)
+        counts = taken(lower)
+
+        utilities = np.zeros(len(Ks))
+        for c, prefix_sum in enumerate(prefix_sums):
+            utilities += prefix_sum[counts[:, c]]
+
+        if not selections:
+            return utilities, None
+        ids = self.ids
+        results = []
+        for row in counts.tolist():
+            selected = np.sort(np.concatenate([category_positions[:count]
+                                               for category_positions, count in zip(positions, row)]
+                                              or [np.empty(0, dtype=np.int64)]))
+            results.append([ids[position] for position in selected.tolist()])
+        return utilities, results
+
+    def _category_arrays(self, categories):
+        """
+        :return: Tuple (positions, prefix_sums), the position array and the score prefix sums of every category.
+        """
+        if not hasattr(self, "_arrays"):
+            self._arrays = {}
+        scores = np.asarray(self.scores, dtype=np.float64)
+        for category in categories:
+            if category not in self._arrays:
+                category_positions = np.asarray(self.category_positions.get(category, []), dtype=np.int64)
+                prefix_sum = np.concatenate(([0.0], np.cumsum(scores[category_positions])))
+                self._arrays[category] = (category_positions, prefix_sum)
+        return [self._arrays[category][0] for category in categories], [self._arrays[category][1]
+                                                                      for category in categories]
+
+
+def diverse_top_k_sweep(items, K_max, family, t=None, seed=None, selections=True, index=None,
+                        num_items_category=None):
+    """
+    Optimal diverse selection and its utility for every K from 1 to K_max under one constraint family.
+
+    :param items: List of tuples (score, category, item_id), in any order.
+    :param K_max: Largest number of items to select.
+    :param family: Constraint family, see topk.diversity_metrics.FAMILIES.
+    :param t: Tightness threshold of the relaxed families, or a function of K returning it.
+    :param seed: Seed of the constraints' random choices, see ConstraintPlanner.
+    :param selections: Whether to also return the selected item IDs of every K.
+    :param index: Optional DiverseTopKIndex of the items, built when not given.
+    :param num_items_category: Optional dictionary {category: number of items}, the random choices depend on its
+    order. Counted from the items by default.
+    :return: Tuple (Ks, utilities, selections), see DiverseTopKIndex.sweep. K the family cannot plan (see
+    ConstraintPlanner.sweep) get a NaN utility and a None selection.
+    """
+    if index is None:
+        index = DiverseTopKIndex(items)
+    if num_items_category is None:
+        num_items_category = {category: len(positions) for category, positions in index.category_positions.items()}
+    planner = ConstraintPlanner(num_items_category)
+
+    Ks = np.arange(1, K_max + 1)
+    floors = np.empty((len(Ks), len(planner.categories)), dtype=np.int64)
+    ceils = np.empty((len(Ks), len(planner.categories)), dtype=np.int64)
+    thresholds = [t(K) if callable(t) else t for K in Ks.tolist()]
+    for threshold in dict.fromkeys(thresholds):
+        rows = np.array([row for row, row_t in enumerate(thresholds) if row_t == threshold])
+        floors[rows], ceils[rows] = planner.sweep(family, Ks[rows], threshold, seed)
+
+    feasible = ~(floors == INFEASIBLE).any(axis=1)
+    utilities = np.full(len(Ks), np.nan)
+    utilities[feasible], feasible_results = index.sweep(Ks[feasible], planner.categories, floors[feasible],
+                                                        ceils[feasible], selections)
+    results = None
+    if selections:
+        results = [None] * len(Ks)
+        for row, selected in zip(np.flatnonzero(feasible).tolist(), feasible_results):
+            results[row] = selected
+    return Ks, utilities, results
+
+
+def _top_indices(indices, scores, m):
+    """
+    Returns the m best of `indices` ordered by decreasing score, ties broken by lower index.
+
+    :param indices: Ascending array of item indices.
+    :param scores: Score array indexed by item index.
+    :param m: Number of indices to keep.
+    """
+    if m <= 0:
+        return indices[:0]
+    values = scores[indices]
+    if m < len(indices):
+        # Partial selection: the m-th largest value splits the candidates, ties on it keep the lowest indices
+        kth = np.partition(values, len(values) - m)[len(values) - m]
+        above = indices[values > kth]
+        ties = indices[values == kth][:m - len(above)]
+        indices = np.concatenate((above, ties))
+        values = scores[indices]
+    return indices[np.lexsort((indices, -values))]
+
+
+def _category_groups(categories):
+    """
+    Groups item indices by category, each group stays in ascending index order.
+
+    :return: Dict {category code: array of item indices}
+    """
+    order = np.argsort(categories, kind="stable")
+    codes, starts, counts = np.unique(categories[order], return_index=True, return_counts=True)
+    return {code: order[start:start + count] for code, start, count in zip(codes.tolist(), starts, counts)}
+
+
+def diverse_top_k_arrays(scores, categories, K, diversity_constraints, stats=None):
+    """
+    Columnar version of diverse_top_k that does not need the items to be sorted.
+
+    Each category keeps only its best `ceil` items (partial selection), the first `floor` of them are always
+    selected and the slack is filled with the best of the remaining candidates. The result equals diverse_top_k
+    on the items sorted by decreasing score, ties kept in array order. Categories without constraints are never
+    selected.
+
+    :param scores: Float array of item scores.
+    :param categories: Integer array of category codes, aligned with `scores`.
+    :param K: Total number of items to select.
+    :param diversity_constraints: Dict {category code: (floor, ceil)}
+    :param stats: Optional topk.stats.SelectionStats, reported at the end. All the items count as seen.
+    :return: Array of selected item indices, by decreasing score.
+    """
+    scores = np.asarray(scores, dtype=np.float64)
+    categories = np.asarray(categories)
+
+    with phase(stats, "group"):
+        groups = _category_groups(categories)
+
+    floor_sum = sum(f for f, _ in diversity_constraints.values())
+    slack = K - floor_sum
+
+    floor_items = []
+    slack_items = []
+    with phase(stats, "candidates"):
+        for category, (floor, ceil) in diversity_constraints.items():
+            group = groups.get(category)
+            if group is None:
+                continue
+            candidates = _top_indices(group, scores, max(floor, ceil))
+            floor_items.append(candidates[:floor])
+            slack_items.append(candidates[floor:ceil])
+
+    empty = np.empty(0, dtype=np.intp)
+    floor_items = np.concatenate(floor_items) if floor_items else empty
+    slack_items = np.concatenate(slack_items) if slack_items else empty
+
+    with phase(stats, "merge"):
+        if slack < 0:
+            # More floor items than K: the scan stops after the K best of them
+            selected = _top_indices(np.sort(floor_items), scores, K)
+            slack_selected = 0
+        else:
+            slack_selected = _top_indices(np.sort(slack_items), scores, slack)
+            selected = np.concatenate((floor_items, slack_selected))
+            slack_selected = len(slack_selected)
+        selected = _top_indices(np.sort(selected), scores, len(selected))
+
+    if stats is not None:
+        selected_categories, counts = np.unique(categories[selected], return_counts=True)
+        category_count = dict(zip(selected_categories.tolist(), counts.tolist()))
+        stats.record_scan(len(scores), slack_selected, list(category_count.values()), list(category_count))
+        stats.report()
     return selected
@@ -0,0 +1,88 @@
+import collections
+import contextlib
+import time
+
+# Decision branches of the selection algorithms
+BRANCHES = ("warmup", "floor", "slack", "fallback", "rejected")
+
+
+class SelectionStats:
+    """
+    Opt-in counters of selection runs, filled by the functions and classes taking a `stats` argument.
+
+    Counters add up over runs, so one object can describe a whole experiment. Everything that can be derived from
+    the final state of a run (warm-up and rejected items, heap pushes) is added when the run reports, the hot loops
+    only pay for a None check on selected items.
+    """
+
+    def __init__(self, callback=None):
+        """
+        :param callback: Function called with this object every time a run reports.
+        """
+        self.branches = collections.Counter()
+        """{branch: number of items}, see BRANCHES"""
+        self.heap_pushes = 0
+        """Warm-up items offered to a heap with a positive capacity"""
+        self.heap_pops = 0
+        self.items_seen = 0
+        self.accepted = collections.Counter()
+        """{category: number of selected items}"""
+        self.timings = collections.defaultdict(float)
+        """{phase: seconds}"""
+        self.runs = 0
+        self.callback = callback
+
+    @contextlib.contextmanager
+    def phase(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.timings[name] += time.perf_counter() - start
+
+    def record_scan(self, scanned, slack_selected, category_count, labels=None):
+        """
+        Adds a greedy scan over items sorted by decreasing score, like diverse_top_k.
+
+        :param scanned: Number of items looked at.
+        :param slack_selected: Number of items selected with the slack.
+        :param category_count: Sequence of the number of selected items indexed by category code.
+        :param labels: Optional sequence of category labels indexed by code, codes are used otherwise.
+        """
+        num_selected = sum(category_count)
+        self.branches["floor"] += num_selected - slack_selected
+        self.branches["slack"] += slack_selected
+        self.branches["rejected"] += scanned - num_selected
+        self.items_seen += scanned
+        for code, count in enumerate(category_count):
+            if count:
+                self.accepted[code if labels is None else labels[code]] += count
+
+    def report(self):
+        """
+        Ends a run: calls the callback.
+
+        :return: This object.
+        """
+        self.runs += 1
+        if self.callback is not None:
+            self.callback(self)
+        return self
+
+    def as_dict(self):
+        return {
+            "runs": self.runs,
+            "items_seen": self.items_seen,
+            "branches": {branch: self.branches[branch] for branch in BRANCHES},
+            "heap_pushes": self.heap_pushes,
+            "heap_pops": self.heap_pops,
+            "accepted": dict(self.accepted),
+            "timings": dict(self.timings),
+        }
+
+
+def phase(stats, name):
+    """
+    :return: stats.phase(name), or a context doing nothing when stats is None.
+    """
+    return stats.phase(name) if stats is not None else contextlib.nullcontext()
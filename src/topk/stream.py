@@ -0,0 +1,243 @@
+import json
+import struct
+
+import numpy as np
+
+from topk.chunked import chunked_diverse_top_k
+from topk.dataset import to_json
+from topk.items import ItemStore, compile_constraints
+from topk.online import OnlineDiverseSelector
+from topk.stats import phase
+
+MAGIC = b"TOPKITEM"
+VERSION = 2
+
+# Fixed-width little-endian records, 24 bytes each: the code is padded to 8 bytes so every score and id is aligned
+RECORD_DTYPE = np.dtype({"names": ["score", "code", "id"], "formats": ["<f8", "<i4", "<i8"], "offsets": [0, 8, 16],
+                         "itemsize": 24})
+
+# Magic, version, length of the JSON category dictionary, N
+_PREAMBLE = struct.Struct("<8sIIQ")
+
+
+def _from_json(value):
+    # JSON turns tuple labels into lists
+    return tuple(_from_json(part) for part in value) if isinstance(value, list) else value
+
+
+class ItemStreamWriter:
+    """
+    Writes an item stream: a header with the category dictionary, N and the number of items of every category,
+    followed by one fixed-width (score, category code, id) record per item, see RECORD_DTYPE.
+
+    When the counts are given up front the header is final as soon as it is written, so the stream can go to a
+    pipe or a socket. Otherwise the file must be seekable and N and the counts are filled in on close.
+    """
+
+    def __init__(self, file, categories, counts=None):
+        """
+        :param file: Path, or binary file object positioned at the start of the stream.
+        :param categories: Sequence of the category labels, categories[code] the label of category code. Labels
+        must be JSON serializable, tuples are read back as tuples.
+        :param counts: Optional sequence of the number of items of every category, checked on close.
+        """
+        self._owned = isinstance(file, (str, bytes)) or hasattr(file, "__fspath__")
+        self._file = open(file, "wb") if self._owned else file
+        self.categories = list(categories)
+        self.expected = None if counts is None else np.asarray(counts, dtype=np.int64)
+        self.counts = np.zeros(len(self.categories), dtype=np.int64)
+        self.closed = False
+        if self.expected is None and not self._file.seekable():
+            raise ValueError("the counts must be given to write to a non seekable file")
+
+        dictionary = json.dumps([[to_json(part) for part in label] if isinstance(label, tuple) else to_json(label)
+                                 for label in self.categories]).encode()
+        # Padded so the counts and the records are 8-byte aligned
+        dictionary += b" " * (-(_PREAMBLE.size + len(dictionary)) % 8)
+        self._start = self._file.tell() if self._file.seekable() else 0
+        self._dictionary_size = len(dictionary)
+        N = 0 if self.expected is None else int(self.expected.sum())
+        header_counts = self.counts if self.expected is None else self.expected
+        self._file.write(_PREAMBLE.pack(MAGIC, VERSION, len(dictionary), N))
+        self._file.write(dictionary)
+        self._file.write(header_counts.astype("<i8").tobytes())
+
+    def write(self, scores, codes, ids):
+        """
+        Appends aligned arrays of items.
+        """
+        codes = np.asarray(codes)
+        if len(codes) and (codes.min() < 0 or codes.max() >= len(self.categories)):
+            raise ValueError(f"category codes must be in [0, {len(self.categories)})")
+        # Zeroed so the padding bytes are too
+        records = np.zeros(len(codes), dtype=RECORD_DTYPE)
+        records["score"] = scores
+        records["code"] = codes
+        records["id"] = ids
+        self.counts += np.bincount(codes, minlength=len(self.categories))
+        self._file.write(records.tobytes())
+
+    def close(self, check=True):
+        """
+        Finishes the header and closes the file if the writer opened it.
+
+        :param check: Whether to check the number of items written against the counts given up front.
+        """
+        if self.closed:
+            return
+        self.closed = True
+        try:
+            if self.expected is not None:
+                if check and not np.array_equal(self.counts, self.expected):
+                    raise ValueError(f"wrote {self.counts.tolist()} items per category, "
+                                     f"the header announces {self.expected.tolist()}")
+            else:
+                end = self._file.tell()
+                self._file.seek(self._start)
+                self._file.write(_PREAMBLE.pack(MAGIC, VERSION, self._dictionary_size, int(self.counts.sum())))
+                self._file.seek(self._start + _PREAMBLE.size + self._dictionary_size)
+                self._file.write(self.counts.astype("<i8").tobytes())
+                self._file.seek(end)
+            self._file.flush()
+        finally:
+            if self._owned:
+                self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        # A stream cut short by an error is not also a count mismatch
+        self.close(check=exc_type is None)
+
+
+class ItemStreamReader:
+    """
+    Reads an item stream written by ItemStreamWriter.
+
+    The header is read on open, so N and the number of items of every category are known before the first record.
+    Records are then read sequentially with chunks, or memory mapped with memmap and store when the stream is a
+    file.
+    """
+
+    def __init__(self, file):
+        """
+        :param file: Path, or binary file object positioned at the start of the stream.
+        """
+        self._owned = isinstance(file, (str, bytes)) or hasattr(file, "__fspath__")
+        self._file = open(file, "rb") if self._owned else file
+        self._path = file if self._owned else getattr(file, "name", None)
+        start = self._file.tell() if self._file.seekable() else 0
+
+        preamble = self._file.read(_PREAMBLE.size)
+        if len(preamble) < _PREAMBLE.size or preamble[:len(MAGIC)] != MAGIC:
+            raise ValueError("not an item stream")
+        _, version, dictionary_size, N = _PREAMBLE.unpack(preamble)
+        if version != VERSION:
+            raise ValueError(f"unsupported item stream version {version}, expected {VERSION}")
+        self.categories = [_from_json(label) for label in json.loads(self._file.read(dictionary_size))]
+        self.counts = np.frombuffer(self._file.read(8 * len(self.categories)), dtype="<i8").astype(np.int64)
+        self.N = N
+        self.offset = start + _PREAMBLE.size + dictionary_size + 8 * len(self.categories)
+        """Position of the first record in the file"""
+        self.records_read = 0
+
+    def __len__(self):
+        return self.N
+
+    def category_count(self):
+        """
+        :return: Dict {category code: number of items}, the input of the assign_*_diversity functions.
+        """
+        return dict(enumerate(self.counts.tolist()))
+
+    def chunks(self, chunk_size=1_000_000):
+        """
+        Reads the records sequentially from the current position, reading ahead at most one chunk.
+
+        :return: Yields tuples (scores, codes, ids).
+        """
+        while self.records_read < self.N:
+            size = min(chunk_size, self.N - self.records_read)
+            buffer = self._file.read(size * RECORD_DTYPE.itemsize)
+            if len(buffer) < size * RECORD_DTYPE.itemsize:
+                raise ValueError(f"truncated item stream, {self.N} records announced")
+            records = np.frombuffer(buffer, dtype=RECORD_DTYPE)
+            self.records_read += size
+            yield records["score"], records["code"], records["id"]
+
+    def memmap(self):
+        """
+        :return: Read-only structured array of all the records, see RECORD_DTYPE, memory mapped from the file.
+        """
+        if self._path is None:
+            raise ValueError("only item streams read from a file can be memory mapped")
+        return np.memmap(self._path, dtype=RECORD_DTYPE, mode="r", offset=self.offset, shape=(self.N,))
+
+    def store(self):
+        """
+        :return: topk.items.ItemStore over the memory mapped records, the columns being strided views.
+        """
+        records = self.memmap()
+        return ItemStore(records["score"], records["code"], records["id"], self.categories, self.counts)
+
+    def close(self):
+        if self._owned:
+            self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+def write_store(file, store):
+    """
+    Writes a topk.items.ItemStore (or a Dataset) as an item stream, its counts going in the header up front.
+    """
+    with ItemStreamWriter(file, store.categories, store.counts) as writer:
+        writer.write(store.scores, store.codes, store.ids)
+
+
+def online_diverse_selection_stream(file, K, diversity_constraints, warmup_ratio=1.0, chunk_size=4096,
+                                    stats=None):
+    """
+    online_diverse_selection over an item stream, the items arriving in record order.
+
+    The header gives the number of items of every category, so the selection decides from the first record on and
+    stops reading once K items are selected: at most one chunk past total_seen is read.
+
+    :param file: Path or binary file object, see ItemStreamReader.
+    :param diversity_constraints: Dict {category label: (floor, ceil)}, labels as in the header. Categories without
+    constraints are never selected.
+    :param chunk_size: Number of records read and given to offer_batch at once.
+    :param stats: Optional topk.stats.SelectionStats, reported at the end.
+    :return: Tuple (list of selected item IDs, total_seen)
+    """
+    with ItemStreamReader(file) as reader:
+        floors, ceils = compile_constraints(diversity_constraints, reader.categories)
+        selector = OnlineDiverseSelector.from_codes(K, floors.tolist(), ceils.tolist(), reader.counts.tolist(),
+                                                    warmup_ratio, stats, reader.categories)
+        with phase(stats, "select"):
+            for scores, codes, ids in reader.chunks(chunk_size):
+                selector.offer_batch(scores, codes, ids)
+                if selector.done:
+                    break
+
+    selector.report_stats()
+
+    return selector.selected, selector.total_seen
+
+
+def diverse_top_k_stream(file, K, diversity_constraints, chunk_size=1_000_000):
+    """
+    diverse_top_k over an item stream in one sequential pass, see topk.chunked.chunked_diverse_top_k.
+
+    :param diversity_constraints: Dict {category label: (floor, ceil)}, labels as in the header.
+    :return: List of selected item IDs, by decreasing score.
+    """
+    with ItemStreamReader(file) as reader:
+        floors, ceils = compile_constraints(diversity_constraints, reader.categories)
+        constraints = dict(enumerate(zip(floors.tolist(), ceils.tolist())))
+        return chunked_diverse_top_k(reader.chunks(chunk_size), K, constraints).tolist()
@@ -0,0 +1,188 @@
+import math
+
+import numpy as np
+import pandas as pd
+
+from topk.stream import ItemStreamWriter
+
+SCORE_DISTRIBUTIONS = ("uniform", "normal", "lognormal", "pareto")
+
+ARRIVAL_ORDERS = ("random", "ascending", "descending", "category_blocks")
+
+# Items drawn per independent random stream
+_BLOCK = 1 << 16
+
+
+def category_weights(d, skew):
+    """
+    :return: Probabilities of d categories with Zipf-like sizes, P(category j) ~ 1 / (j + 1)^skew.
+    """
+    weights = 1.0 / np.arange(1, d + 1) ** skew
+    return weights / weights.sum()
+
+
+def _draw_scores(rng, size, distribution):
+    if distribution == "uniform":
+        return rng.random(size)
+    if distribution == "normal":
+        return rng.standard_normal(size)
+    if distribution == "lognormal":
+        return rng.lognormal(size=size)
+    if distribution == "pareto":
+        return rng.pareto(1.5, size)
+    raise ValueError(f"unknown score distribution {distribution!r}, expected one of {SCORE_DISTRIBUTIONS}")
+
+
+def _generate_blocks(n, d, skew, scores, attributes, seed):
+    # Every block has its own random stream, so the items do not depend on how they are chunked
+    for block_start in range(0, n, _BLOCK):
+        size = min(_BLOCK, n - block_start)
+        rng = np.random.default_rng([seed, block_start // _BLOCK])
+        block_scores = _draw_scores(rng, size, scores)
+        if attributes is None:
+            block_codes = rng.choice(d, size=size, p=category_weights(d, skew))
+        else:
+            groups = np.column_stack([rng.choice(cardinality, size=size, p=category_weights(cardinality, group_skew))
+                                      for cardinality, group_skew in attributes])
+            block_codes = intersect_categories(groups, attributes)
+        yield block_scores, block_codes
+
+
+def generate_chunks(n, d=10, skew=1.0, scores="uniform", decimals=None, attributes=None, chunk_size=1_000_000,
+                    seed=0):
+    """
+    Generates n items in chunks, so the whole dataset never has to be in memory.
+
+    :param n: Number of items.
+    :param d: Number of categories.
+    :param skew: Zipf exponent of the category sizes, 0 gives equal sizes.
+    :param scores: Score distribution, one of SCORE_DISTRIBUTIONS.
+    :param decimals: Scores are rounded to this many decimals to create ties, None keeps them continuous.
+    :param attributes: List of (cardinality, skew) pairs. When given, every item draws one group per attribute and
+    its category is the intersection of its groups, encoded by intersect_categories; d and skew are then ignored.
+    The product of the cardinalities must fit the int32 category codes.
+    :param chunk_size: Maximal number of items per chunk.
+    :param seed: Seed of the generator, the same arguments give the same items whatever the chunk size.
+    :return: Iterator of (scores, category codes, item ids) arrays.
+    """
+    num_categories = d if attributes is None else math.prod(cardinality for cardinality, _ in attributes)
+    if num_categories > np.iinfo(np.int32).max + 1:
+        raise ValueError(f"{num_categories} categories do not fit int32 category codes")
+    pending_scores = np.empty(0)
+    pending_codes = np.empty(0, dtype=np.int64)
+    start = 0
+    blocks = _generate_blocks(n, d, skew, scores, attributes, seed)
+    while start < n:
+        size = min(chunk_size, n - start)
+        if len(pending_scores) < size:
+            parts = [(pending_scores, pending_codes)]
+            missing = size - len(pending_scores)
+            while missing > 0:
+                parts.append(next(blocks))
+                missing -= len(parts[-1][0])
+            pending_scores = np.concatenate([part[0] for part in parts])
+            pending_codes = np.concatenate([part[1] for part in parts])
+        chunk_scores = pending_scores[:size]
+        if decimals is not None:
+            chunk_scores = np.round(chunk_scores, decimals)
+        yield chunk_scores, pending_codes[:size].astype(np.int32), np.arange(start, start + size, dtype=np.int64)
+        pending_scores = pending_scores[size:]
+        pending_codes = pending_codes[size:]
+        start += size
+
+
+def intersect_categories(groups, attributes):
+    """
+    Encodes per-attribute groups as one intersectional category code, like grouping by several sensitive columns.
+
+    :param groups: Integer array of shape (n, len(attributes)), one group code per attribute.
+    :param attributes: List of (cardinality, skew) pairs.
+    :return: Integer array of category codes.
+    """
+    codes = np.zeros(len(groups), dtype=np.int64)
+    for column, (cardinality, _) in enumerate(attributes):
+        codes = codes * cardinality + groups[:, column]
+    return codes
+
+
+def split_categories(codes, attributes):
+    """
+    Inverse of intersect_categories.
+
+    :return: Integer array of shape (n, len(attributes)).
+    """
+    codes = np.asarray(codes, dtype=np.int64)
+    groups = np.empty((len(codes), len(attributes)), dtype=np.int64)
+    for column in range(len(attributes) - 1, -1, -1):
+        cardinality = attributes[column][0]
+        groups[:, column] = codes % cardinality
+        codes = codes // cardinality
+    return groups
+
+
+def generate(n, **kwargs):
+    """
+    :return: Tuple (scores, category codes, item ids) of all n items, see generate_chunks for the arguments.
+    """
+    chunks = list(generate_chunks(n, **kwargs))
+    if not chunks:
+        return np.empty(0), np.empty(0, dtype=np.int32), np.empty(0, dtype=np.int64)
+    return tuple(np.concatenate(arrays) for arrays in zip(*chunks))
+
+
+def generate_items(n, **kwargs):
+    """
+    :return: List of tuples (score, category, item_id), see generate_chunks for the arguments.
+    """
+    scores, codes, ids = generate(n, **kwargs)
+    return list(zip(scores.tolist(), codes.tolist(), ids.tolist()))
+
+
+def arrival_order(scores, codes, order="random", seed=0):
+    """
+    Arrival orders for the online algorithm, including adversarial ones.
+
+    "ascending" feeds the worst items first, so the warm-up thresholds are as low as possible, "descending" feeds
+    the best items during the warm-up, and "category_blocks" sends the categories one after another.
+
+    :param order: One of ARRIVAL_ORDERS.
+    :return: Permutation of the item indices.
+    """
+    rng = np.random.default_rng(seed)
+    if order == "random":
+        return rng.permutation(len(scores))
+    if order == "ascending":
+        return np.argsort(scores, kind="stable")
+    if order == "descending":
+        return np.argsort(-np.asarray(scores), kind="stable")
+    if order == "category_blocks":
+        shuffled = rng.permutation(len(scores))
+        return shuffled[np.argsort(np.asarray(codes)[shuffled], kind="stable")]
+    raise ValueError(f"unknown arrival order {order!r}, expected one of {ARRIVAL_ORDERS}")
+
+
+def write_csv(path, n, chunk_size=1_000_000, **kwargs):
+    """
+    Streams n generated items into a CSV with id, score and category columns, plus one attribute_<i> column per
+    attribute when attributes are given. See generate_chunks for the arguments.
+    """
+    attributes = kwargs.get("attributes")
+    with open(path, "w", newline="") as f:
+        for scores, codes, ids in generate_chunks(n, chunk_size=chunk_size, **kwargs):
+            chunk = pd.DataFrame({"id": ids, "score": scores, "category": codes})
+            if attributes is not None:
+                for i, groups in enumerate(split_categories(codes, attributes).T):
+                    chunk[f"attribute_{i}"] = groups
+            chunk.to_csv(f, header=f.tell() == 0, index=False)
+
+
+def write_stream(path, n, chunk_size=1_000_000, **kwargs):
+    """
+    Streams n generated items into an item stream file (see topk.stream), category labels being the codes. See
+    generate_chunks for the arguments.
+    """
+    attributes = kwargs.get("attributes")
+    num_categories = kwargs.get("d", 10) if attributes is None else int(np.prod([c for c, _ in attributes]))
+    with ItemStreamWriter(path, range(num_categories)) as writer:
+        for scores, codes, ids in generate_chunks(n, chunk_size=chunk_size, **kwargs):
+            writer.write(scores, codes, ids)
@@ -0,0 +1,53 @@
+import shutil
+
+import pandas as pd
+import pytest
+
+from topk.dataset import load_dataset
+
+
+@pytest.fixture
+def astronauts():
+    """
+    astronauts.csv with a "Major Category" column: the 9 most frequent undergraduate majors, the others binned into
+    "Other".
+    """
+    df = pd.read_csv("astronauts.csv")
+    top_majors = df['Undergraduate Major'].value_counts().nlargest(9).index.tolist()
+    df['Major Category'] = df['Undergraduate Major'].apply(lambda x: x if x in top_majors else "Other")
+    return df
+
+
+@pytest.fixture
+def astronaut_counts(astronauts):
+    """
+    Dict {major category: number of astronauts}
+    """
+    return {category: len(category_df) for category, category_df in astronauts.groupby('Major Category')}
+
+
+@pytest.fixture
+def astronaut_items(astronauts):
+    """
+    List of tuples (space flight hours, major category, row index).
+    """
+    return list(zip(astronauts['Space Flight (hr)'], astronauts['Major Category'], astronauts.index))
+
+
+@pytest.fixture
+def astronauts_csv(tmp_path):
+    """
+    Copy of astronauts.csv in tmp_path, so the dataset caches are written there.
+    """
+    path = tmp_path / "astronauts.csv"
+    shutil.copy("astronauts.csv", path)
+    return path
+
+
+@pytest.fixture
+def astronaut_dataset(astronauts_csv):
+    """
+    Dataset of astronauts_csv binned like `astronauts`, cached in tmp_path.
+    """
+    return load_dataset(astronauts_csv, "Space Flight (hr)", ["Undergraduate Major"], {"Undergraduate Major": 9},
+                        cache_dir=astronauts_csv.parent / "cache")
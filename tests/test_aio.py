@@ -0,0 +1,81 @@
+import asyncio
+import random
+
+import pytest
+
+from topk.aio import AsyncDiverseSelector, iterate_queue, online_diverse_selection_async
+from topk.diversity_metrics import assign_proportion_diversity
+from topk.online import online_diverse_selection
+
+
+async def produce(items, pulled, delay=0.0):
+    for item in items:
+        pulled.append(item[2])
+        await asyncio.sleep(delay)
+        yield item
+
+
+@pytest.mark.parametrize("seed", [0, 1, 2])
+def test_async_matches_online(seed, astronaut_items, astronaut_counts):
+    random.Random(seed).shuffle(astronaut_items)
+    diversity_constraints = assign_proportion_diversity(10, astronaut_counts)
+    expected_selected, expected_seen = online_diverse_selection(astronaut_items, 10, diversity_constraints)
+
+    pulled = []
+    selected, seen = asyncio.run(online_diverse_selection_async(produce(astronaut_items, pulled), 10,
+                                                                diversity_constraints, astronaut_counts))
+    assert (selected, seen) == (expected_selected, expected_seen)
+    # Nothing is pulled after the K-th selection
+    assert len(pulled) == expected_seen
+
+
+def test_concurrent_selections_and_queue(astronaut_items, astronaut_counts):
+    diversity_constraints = assign_proportion_diversity(10, astronaut_counts)
+    orders = [random.Random(seed).sample(astronaut_items, len(astronaut_items)) for seed in range(4)]
+
+    async def from_queue(order):
+        queue = asyncio.Queue(maxsize=8)
+        selector = AsyncDiverseSelector(10, diversity_constraints, astronaut_counts, max_latencies=16)
+
+        async def producer():
+            for item in order:
+                await queue.put(item)
+            await queue.put(None)
+
+        task = asyncio.create_task(producer())
+        decisions = [decision async for decision in selector.decisions(iterate_queue(queue))]
+        task.cancel()
+        assert len(decisions) == selector.total_seen
+        assert len(selector.latencies) == min(selector.total_seen, 16)
+        return selector.selected, selector.total_seen
+
+    async def main():
+        return await asyncio.gather(*(from_queue(order) for order in orders))
+
+    assert asyncio.run(main()) == [online_diverse_selection(order, 10, diversity_constraints) for order in orders]
+
+
+def test_cancellation_closes_source(astronaut_items, astronaut_counts):
+    diversity_constraints = assign_proportion_diversity(10, astronaut_counts)
+    closed = []
+
+    async def source():
+        try:
+            for item in astronaut_items:
+                await asyncio.sleep(0.001)
+                yield item
+        finally:
+            closed.append(True)
+
+    async def main():
+        selector = AsyncDiverseSelector(10, diversity_constraints, astronaut_counts)
+        task = asyncio.create_task(selector.run(source()))
+        await asyncio.sleep(0.02)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+        return selector.total_seen
+
+    seen = asyncio.run(main())
+    assert closed == [True]
+    assert 0 < seen < len(astronaut_items)
@@ -1,11 +1,14 @@
 import itertools
 import math
+import random
 
+import numpy as np
 import pandas as pd
 import pytest
 
-from topk.static import diverse_top_k
-from topk.online import online_diverse_selection
+from topk.static import DiverseTopKIndex, diverse_top_k, diverse_top_k_arrays, diverse_top_k_many, \
+    diverse_top_k_sweep
+from topk.online import OnlineDiverseSelector, online_diverse_selection
 import topk.diversity_metrics as diversity_metrics
 
 K = 10  # Number of astronauts to select
@@ -35,33 +38,20 @@ K = 10  # Number of astronauts to select
         (online_diverse_selection, diversity_metrics.assign_relaxed_proportion_diversity, True),
     ]
 )
-def test_static(algorithm, constraint, has_t):
-    # Load the dataset
-    file_path = "astronauts.csv"  # Update this if needed
-    df = pd.read_csv(file_path)
-
+def test_static(algorithm, constraint, has_t, astronauts, astronaut_counts):
     # Step 1: Process the Data
-    # Count the frequency of each undergraduate major
-    major_counts = df['Undergraduate Major'].value_counts()
-
-    # Select the top 9 most frequent majors
-    top_majors = major_counts.nlargest(9).index.tolist()
-
-    # Create a new category column where less frequent majors are grouped into "Other"
-    df['Major Category'] = df['Undergraduate Major'].apply(lambda x: x if x in top_majors else "Other")
-
-    # Extract relevant columns (Score, Category, ID)
-    df_filtered = df[['Name', 'Space Flight (hr)', 'Major Category']]
+    # Extract relevant columns (Score, Category, ID), less frequent majors are grouped into "Other"
+    df_filtered = astronauts[['Name', 'Space Flight (hr)', 'Major Category']]
 
     # Sort the dataset by space flight hours (score) in descending order
     df_filtered = df_filtered.sort_values(by='Space Flight (hr)', ascending=False)
 
     # Step 2: Define Diversity Constraints (floor = 1, ceil = min(count, 5))
-    counts = {category: len(category_df) for category, category_df in df.groupby('Major Category')}
     if has_t:
-        diversity_constraints = constraint(K, counts, math.floor(K * .3))
+        diversity_constraints = constraint(K, astronaut_counts, math.floor(K * .3))
     else:
-        diversity_constraints = constraint(K, counts)
+        diversity_constraints = constraint(K, astronaut_counts)
+
 
     # Convert data into tuple format (score, category, id)
     items = list(zip(df_filtered['Space Flight (hr)'], df_filtered['Major Category'], df_filtered.index))
@@ -74,3 +64,127 @@ def test_static(algorithm, constraint, has_t):
     print("Selected Astronauts:")
     print(selected_df)
 
+
+@pytest.mark.parametrize(
+    "constraint, has_t",
+    [
+        (diversity_metrics.assign_minimum_diversity, False),
+        (diversity_metrics.assign_average_diversity, False),
+        (diversity_metrics.assign_proportion_diversity, False),
+        (diversity_metrics.assign_relaxed_average_diversity, True),
+        (diversity_metrics.assign_relaxed_proportion_diversity, True),
+    ]
+)
+def test_diverse_top_k_arrays(constraint, has_t, astronauts):
+    codes, categories = pd.factorize(astronauts['Major Category'])
+
+    counts = {code: int((codes == code).sum()) for code in range(len(categories))}
+    if has_t:
+        diversity_constraints = constraint(K, counts, math.floor(K * .3))
+    else:
+        diversity_constraints = constraint(K, counts)
+
+    items = list(zip(astronauts['Space Flight (hr)'], codes, astronauts.index))
+    items.sort(key=lambda x: x[0], reverse=True)
+    expected = diverse_top_k(items, K, diversity_constraints)
+
+    selected = diverse_top_k_arrays(astronauts['Space Flight (hr)'].to_numpy(), codes, K, diversity_constraints)
+
+    assert selected.tolist() == expected
+
+
+def test_online_selector_streaming(astronaut_items, astronaut_counts):
+    diversity_constraints = diversity_metrics.assign_proportion_diversity(K, astronaut_counts)
+
+    random.Random(0).shuffle(astronaut_items)
+    expected_selected, expected_seen = online_diverse_selection(astronaut_items, K, diversity_constraints)
+
+    selector = OnlineDiverseSelector(K, diversity_constraints, astronaut_counts)
+    decisions = [selector.offer(*item) for item in astronaut_items]
+    assert selector.selected == expected_selected
+    assert selector.total_seen == expected_seen
+    assert [item_id for (_, _, item_id), accepted in zip(astronaut_items, decisions) if accepted] == expected_selected
+
+    assert not any(decisions[expected_seen:])
+
+
+@pytest.mark.parametrize("batch_size", [1, 7, 100, 10000])
+def test_online_selector_batch(batch_size):
+    rng = np.random.default_rng(batch_size)
+    scores = rng.integers(0, 30, 3000).astype(float)
+    codes = rng.integers(0, 6, 3000)
+    floors = [2, 0, 1, 3, 0, 1]
+    ceils = [4, 3, 1, 8, 0, 5]
+    counts = np.bincount(codes, minlength=6).tolist()
+
+    expected = OnlineDiverseSelector.from_codes(20, floors, ceils, counts)
+    expected_decisions = [expected.offer_code(score, code, item_id)
+                          for item_id, (score, code) in enumerate(zip(scores.tolist(), codes.tolist()))]
+
+    selector = OnlineDiverseSelector.from_codes(20, floors, ceils, counts)
+    decisions = np.concatenate([selector.offer_batch(scores[start:start + batch_size], codes[start:start + batch_size],
+                                                     np.arange(start, min(start + batch_size, 3000)))
+                                for start in range(0, 3000, batch_size)])
+    assert decisions.tolist() == expected_decisions
+    assert selector.selected == expected.selected
+    assert selector.total_seen == expected.total_seen
+
+
+def test_diverse_top_k_index(astronaut_items, astronaut_counts):
+    index = DiverseTopKIndex(astronaut_items)
+    sorted_items = sorted(astronaut_items, key=lambda x: x[0], reverse=True)
+    for k in (1, 5, 10, 40):
+        for diversity_constraints in (
+                diversity_metrics.assign_minimum_diversity(k, astronaut_counts),
+                diversity_metrics.assign_proportion_diversity(k, astronaut_counts),
+                diversity_metrics.assign_relaxed_average_diversity(k, astronaut_counts, math.floor(k * .3))):
+
+            assert index.query(k, diversity_constraints) == diverse_top_k(sorted_items, k, diversity_constraints)
+
+
+@pytest.mark.parametrize("family", ["minimum", "average", "proportion", "relaxed_average", "relaxed_proportion"])
+def test_diverse_top_k_sweep(family, astronaut_items, astronaut_counts):
+    scores = {item_id: score for score, _, item_id in astronaut_items}
+
+    def t(k):
+        return math.floor(k * .3)
+
+    relaxed = family.startswith("relaxed")
+    Ks, utilities, selections = diverse_top_k_sweep(astronaut_items, 60, family, t if relaxed else None, seed=1,
+                                                   num_items_category=astronaut_counts)
+    assert Ks.tolist() == list(range(1, 61))
+    sorted_items = sorted(astronaut_items, key=lambda x: x[0], reverse=True)
+    assign = getattr(diversity_metrics, f"assign_{family}_diversity")
+    for k, utility, selected in zip(Ks.tolist(), utilities, selections):
+        args = (k, astronaut_counts, t(k)) if relaxed else (k, astronaut_counts)
+        expected = diverse_top_k(sorted_items, k, assign(*args, rng=random.Random(1)))
+        assert selected == expected
+        assert utility == pytest.approx(sum(scores[item_id] for item_id in expected))
+
+
+@pytest.mark.parametrize("family", ["minimum", "average"])
+def test_diverse_top_k_sweep_past_feasible_K(family, astronaut_items, astronaut_counts):
+    Ks, utilities, selections = diverse_top_k_sweep(astronaut_items, 200, family, seed=1,
+                                                   num_items_category=astronaut_counts)
+
+    sorted_items = sorted(astronaut_items, key=lambda x: x[0], reverse=True)
+    assign = getattr(diversity_metrics, f"assign_{family}_diversity")
+    infeasible = np.isnan(utilities)
+    assert infeasible.any() and not infeasible.all()
+    for k, utility, selected in zip(Ks.tolist(), utilities, selections):
+        if np.isnan(utility):
+            assert selected is None
+            with pytest.raises(IndexError):
+                assign(k, astronaut_counts, rng=random.Random(1))
+        else:
+            assert selected == diverse_top_k(sorted_items, k, assign(k, astronaut_counts, rng=random.Random(1)))
+
+
+def test_diverse_top_k_many(astronaut_items, astronaut_counts):
+    astronaut_items.sort(key=lambda x: x[0], reverse=True)
+
+    queries = [(k, diversity_metrics.assign_average_diversity(k, astronaut_counts)) for k in (1, 4, 10, 40)]
+    queries += [(k, diversity_metrics.assign_relaxed_proportion_diversity(k, astronaut_counts, math.floor(k * .3)))
+                for k in (10, 40)]
+    assert diverse_top_k_many(astronaut_items, queries) == [diverse_top_k(astronaut_items, k, dc) for k, dc in queries]
+
@@ -0,0 +1,53 @@
+import numpy as np
+import pytest
+
+import topk.diversity_metrics as diversity_metrics
+from topk.chunked import array_chunks, chunked_diverse_top_k, chunked_diverse_top_k_csv
+from topk.dataset import build_dataset
+from topk.static import diverse_top_k, diverse_top_k_arrays
+
+
+@pytest.mark.parametrize("chunk_size", [1, 17, 100, 10000])
+def test_chunked_csv_matches_diverse_top_k(chunk_size, astronauts, astronauts_csv):
+    dataset = build_dataset(astronauts, "Space Flight (hr)", ["Undergraduate Major"])
+    # Constraints on a subset of the categories, the others are never selected
+    diversity_constraints = diversity_metrics.assign_average_diversity(30, dict(
+        zip(dataset.categories[:12], dataset.counts[:12].tolist())))
+
+    items = sorted(dataset.items(), key=lambda x: x[0], reverse=True)
+    items = [item for item in items if item[1] in diversity_constraints]
+    expected = diverse_top_k(items, 30, diversity_constraints)
+    assert chunked_diverse_top_k_csv(astronauts_csv, "Space Flight (hr)", ["Undergraduate Major"], 30,
+                                     diversity_constraints, chunk_size) == expected
+
+
+@pytest.mark.parametrize("chunk_size", [1, 17, 100, 10000])
+def test_chunked_csv_bins_like_load_dataset(chunk_size, astronauts_csv, astronaut_dataset):
+    diversity_constraints = diversity_metrics.assign_proportion_diversity(20, astronaut_dataset.category_count())
+    expected = astronaut_dataset.ids[diverse_top_k_arrays(astronaut_dataset.scores, astronaut_dataset.codes, 20,
+                                                          diversity_constraints)]
+
+    # Items binned into "Other" are selected like any other category
+    labelled = {astronaut_dataset.categories[code]: bounds for code, bounds in diversity_constraints.items()}
+    assert ("Other",) in labelled
+    assert chunked_diverse_top_k_csv(astronauts_csv, "Space Flight (hr)", ["Undergraduate Major"], 20, labelled,
+                                     chunk_size, n_largest={"Undergraduate Major": 9}) == expected.tolist()
+
+
+@pytest.mark.parametrize("chunk_size", [3, 64, 1000])
+def test_chunked_arrays_with_ties(chunk_size, tmp_path):
+    rng = np.random.default_rng(chunk_size)
+    scores = rng.integers(0, 10, 5000).astype(float)
+    codes = rng.integers(0, 5, 5000)
+    diversity_constraints = {0: (2, 5), 1: (0, 3), 2: (4, 4), 3: (0, 0), 4: (1, 20)}
+    expected = diverse_top_k_arrays(scores, codes, 25, diversity_constraints)
+    selected = chunked_diverse_top_k(array_chunks(scores, codes, chunk_size=chunk_size), 25, diversity_constraints)
+    assert selected.tolist() == expected.tolist()
+
+
+def test_chunked_cached_dataset(astronaut_dataset):
+    diversity_constraints = diversity_metrics.assign_proportion_diversity(20, astronaut_dataset.category_count())
+    selected = chunked_diverse_top_k(array_chunks(astronaut_dataset.scores, astronaut_dataset.codes,
+                                                  astronaut_dataset.ids, chunk_size=50), 20, diversity_constraints)
+    assert selected.tolist() == astronaut_dataset.ids[diverse_top_k_arrays(
+        astronaut_dataset.scores, astronaut_dataset.codes, 20, diversity_constraints)].tolist()
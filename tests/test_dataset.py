@@ -0,0 +1,20 @@
+import numpy as np
+
+from topk.dataset import load_dataset
+
+
+def test_load_dataset_cache(astronauts_csv, astronaut_dataset, astronauts):
+    assert isinstance(astronaut_dataset.scores, np.memmap)
+    assert astronaut_dataset.items() == list(zip(astronauts['Space Flight (hr)'],
+                                                 [(c,) for c in astronauts['Major Category']], astronauts.index))
+    assert dict(zip(astronaut_dataset.categories, astronaut_dataset.counts.tolist())) == {
+        (category,): len(category_df) for category, category_df in astronauts.groupby('Major Category')}
+
+    # A touched but unchanged file reuses the cache, a changed one rebuilds it
+    cache_dir = astronauts_csv.parent / "cache"
+    astronauts_csv.write_bytes(astronauts_csv.read_bytes())
+    assert load_dataset(astronauts_csv, "Space Flight (hr)", ["Undergraduate Major"], {"Undergraduate Major": 9},
+                        cache_dir=cache_dir).items() == astronaut_dataset.items()
+    astronauts.iloc[:10].drop(columns='Major Category').to_csv(astronauts_csv, index=False)
+    assert len(load_dataset(astronauts_csv, "Space Flight (hr)", ["Undergraduate Major"], {"Undergraduate Major": 9},
+                            cache_dir=cache_dir)) == 10
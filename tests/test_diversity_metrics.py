@@ -0,0 +1,73 @@
+import concurrent.futures
+import random
+
+import pytest
+
+import topk.diversity_metrics as diversity_metrics
+from topk.diversity_metrics import FAMILIES, INFEASIBLE, ConstraintPlanner
+
+
+@pytest.mark.parametrize("family", list(FAMILIES))
+def test_planner_matches_assign(family, astronaut_counts):
+    assign = getattr(diversity_metrics, f"assign_{family}_diversity")
+    planner = ConstraintPlanner(astronaut_counts)
+    Ks = range(1, 60)
+    t = 2 if FAMILIES[family] else None
+    floors, ceils = planner.sweep(family, Ks, t, seed=3)
+    for row, K in enumerate(Ks):
+        args = (K, astronaut_counts, t) if FAMILIES[family] else (K, astronaut_counts)
+        expected = assign(*args, rng=random.Random(3))
+        assert dict(zip(planner.categories, zip(floors[row].tolist(), ceils[row].tolist()))) == expected
+        assert planner.constraints(family, K, t, seed=3) == expected
+
+
+def test_planner_memo(astronaut_counts):
+    planner = ConstraintPlanner(astronaut_counts)
+    first = planner.all_families(20, t=3, seed=0)
+    assert ConstraintPlanner(dict(astronaut_counts)).all_families(20, t=3, seed=0) == first
+    assert set(first) == set(FAMILIES)
+
+    # Constraints are fresh dicts, changing one does not change the memo
+    first["average"].clear()
+    assert planner.constraints("average", 20, seed=0)
+
+    with pytest.raises(ValueError):
+        planner.constraints("relaxed_average", 20)
+    with pytest.raises(ValueError):
+        planner.constraints("unknown", 20)
+
+
+@pytest.mark.parametrize("family", ["minimum", "average"])
+def test_planner_infeasible_K(family, astronaut_counts):
+    assign = getattr(diversity_metrics, f"assign_{family}_diversity")
+    planner = ConstraintPlanner(astronaut_counts)
+    Ks = range(1, 201)
+    floors, ceils = planner.sweep(family, Ks, seed=0)
+    infeasible = (floors == INFEASIBLE).any(axis=1)
+    assert infeasible.any() and not infeasible.all()
+    for row, K in enumerate(Ks):
+        if infeasible[row]:
+            assert (floors[row] == INFEASIBLE).all() and (ceils[row] == INFEASIBLE).all()
+            with pytest.raises(IndexError):
+                assign(K, astronaut_counts, rng=random.Random(0))
+            with pytest.raises(ValueError):
+                planner.constraints(family, K, seed=0)
+        else:
+            expected = assign(K, astronaut_counts, rng=random.Random(0))
+            assert dict(zip(planner.categories, zip(floors[row].tolist(), ceils[row].tolist()))) == expected
+
+
+def test_planner_threads(astronaut_counts, monkeypatch):
+    # A small memo keeps the threads evicting each other's plans
+    monkeypatch.setattr(diversity_metrics, "PLAN_CACHE_SIZE", 16)
+    expected = {seed: ConstraintPlanner(astronaut_counts).sweep("proportion", range(1, 40), seed=seed)
+                for seed in range(8)}
+
+    def plan(seed):
+        return ConstraintPlanner(astronaut_counts).sweep("proportion", range(1, 40), seed=seed)
+
+    with concurrent.futures.ThreadPoolExecutor(8) as executor:
+        for seed, (floors, ceils) in zip(list(range(8)) * 8, executor.map(plan, list(range(8)) * 8)):
+            assert floors.tolist() == expected[seed][0].tolist()
+            assert ceils.tolist() == expected[seed][1].tolist()
+    assert len(diversity_metrics._plans) <= 16
@@ -0,0 +1,72 @@
+import random
+
+import pytest
+
+from topk.dynamic import DynamicDiverseTopK, SlidingWindowDiverseTopK
+from topk.static import diverse_top_k
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_dynamic_matches_static(seed):
+    rng = random.Random(seed)
+    diversity_constraints = {category: (rng.randint(0, 2), rng.randint(2, 5)) for category in range(4)}
+    K = 8
+    dynamic = DynamicDiverseTopK(K, diversity_constraints)
+    live = {}
+    selected = set()
+
+    for item_id in range(300):
+        operation = rng.random()
+        if operation < 0.5 or not live:
+            score, category = float(rng.randint(0, 20)), rng.randrange(4)
+            entered, left = dynamic.insert(score, category, item_id)
+            live[item_id] = (score, category, item_id)
+        elif operation < 0.75:
+            removed = rng.choice(list(live))
+            entered, left = dynamic.delete(removed)
+            del live[removed]
+        else:
+            updated = rng.choice(list(live))
+            score = float(rng.randint(0, 20))
+            entered, left = dynamic.update_score(updated, score)
+            live[updated] = (score,) + live[updated][1:]
+
+        # Ties are kept in insertion order, which is the item id order here
+        items = sorted(live.values(), key=lambda item: (-item[0], item[2]))
+        expected = diverse_top_k(items, K, diversity_constraints)
+        assert dynamic.selected == expected
+        assert set(entered) == set(expected) - selected
+        assert set(left) == selected - set(expected)
+        selected = set(expected)
+
+
+@pytest.mark.parametrize("size, duration", [(1, None), (25, None), (None, 10.0), (40, 15.0)])
+def test_sliding_window_matches_static(size, duration):
+    rng = random.Random(size or 0)
+    diversity_constraints = {0: (1, 3), 1: (2, 4), 2: (0, 2), 3: (0, 0)}
+    K = 6
+    window = SlidingWindowDiverseTopK(K, diversity_constraints, size, duration)
+    arrivals = []
+    selected = set()
+    now = 0.0
+
+    for item_id in range(400):
+        now += rng.choice([0.0, 0.1, 0.5, 2.0])
+        if rng.random() < 0.1:
+            entered, left = window.expire(now)
+        else:
+            score, category = float(rng.randint(0, 20)), rng.randrange(5)
+            entered, left = window.push(score, category, item_id, now)
+            arrivals.append((now, (score, category, item_id)))
+
+        live = [item for timestamp, item in arrivals if duration is None or timestamp > now - duration]
+        if size is not None:
+            live = live[-size:]
+        assert len(window) == len(live)
+        # Category 4 has no constraints, its items only take room in the window
+        items = sorted((item for item in live if item[1] in diversity_constraints), key=lambda item: -item[0])
+        expected = diverse_top_k(items, K, diversity_constraints)
+        assert window.selected == expected
+        assert set(entered) == set(expected) - selected
+        assert set(left) == selected - set(expected)
+        selected = set(expected)
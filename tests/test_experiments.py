@@ -0,0 +1,52 @@
+import concurrent.futures
+
+import pytest
+
+from analyze_static import constraint_results, dataset_items
+import topk.diversity_metrics as diversity_metrics
+import topk.experiments as experiments
+from topk.experiments import run_experiments
+
+K = 10
+
+
+def test_run_experiments_reproducible(astronaut_items, astronaut_counts):
+    constraints = {
+        "average": diversity_metrics.assign_average_diversity(K, astronaut_counts),
+        "proportion": diversity_metrics.assign_proportion_diversity(K, astronaut_counts),
+    }
+
+    # Enough tasks to leave the calling process
+    runs = experiments.INLINE_TASKS // 4 + 1
+    single = run_experiments(astronaut_items, K, constraints, [1, 0.25], runs=runs, max_workers=1)
+    pooled = run_experiments(astronaut_items, K, constraints, [1, 0.25], runs=runs, max_workers=3)
+    assert single == pooled
+    for accuracies, walking_distances in single.values():
+        assert len(accuracies) == len(walking_distances)
+        assert all(0 < walking_distance <= len(astronaut_items) for walking_distance in walking_distances)
+
+    # Later calls reuse the pool
+    pool = experiments._executors[3]
+    assert run_experiments(astronaut_items, K, constraints, [1, 0.25], runs=runs, max_workers=3) == single
+    assert experiments._executors[3] is pool
+
+    with concurrent.futures.ThreadPoolExecutor(2) as executor:
+        assert run_experiments(astronaut_items, K, constraints, [1, 0.25], runs=runs, executor=executor) == single
+        # Small experiments run inline unless given an executor
+        assert run_experiments(astronaut_items, K, constraints, runs=5, executor=executor) == \
+            run_experiments(astronaut_items, K, constraints, runs=5)
+
+
+def test_constraint_results_need_shared_items_and_K():
+    items = [(float(i), i % 2, i) for i in range(20)]
+    constraints = {0: (1, 3), 1: (1, 3)}
+    with pytest.raises(ValueError):
+        constraint_results({"a": (items, K, constraints), "b": (items, K + 1, constraints)})
+    with pytest.raises(ValueError):
+        constraint_results({"a": (items, K, constraints), "b": (items[1:], K, constraints)})
+
+
+def test_dataset_items_unwrap_single_column_labels(astronaut_dataset, astronaut_items, astronaut_counts):
+    items, counts = dataset_items(astronaut_dataset)
+    assert items == astronaut_items
+    assert counts == astronaut_counts
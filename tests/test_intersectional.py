@@ -0,0 +1,69 @@
+import itertools
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from topk.dataset import build_dataset
+from topk.intersectional import attribute_counts, attribute_groups, intersectional_diverse_top_k, \
+    intersectional_top_k
+from topk.static import diverse_top_k_arrays
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_single_attribute_matches_diverse_top_k(seed):
+    rng = np.random.default_rng(seed)
+    scores = rng.integers(0, 20, 300).astype(float)
+    categories = rng.integers(0, 5, 300)
+    floors = rng.integers(0, 3, 5)
+    ceils = floors + rng.integers(0, 4, 5)
+    diversity_constraints = {code: (int(f), int(c)) for code, (f, c) in enumerate(zip(floors, ceils))}
+    assert (intersectional_top_k(scores, categories[:, None], 10, [(floors, ceils)]).tolist()
+            == diverse_top_k_arrays(scores, categories, 10, diversity_constraints).tolist())
+
+
+@pytest.mark.parametrize("num_attributes", [2, 3])
+def test_intersectional_top_k_constraints(num_attributes):
+    rng = np.random.default_rng(num_attributes)
+    for _ in range(50):
+        scores = rng.random(9)
+        groups = rng.integers(0, 3, (9, num_attributes))
+        K = int(rng.integers(1, 5))
+        constraints = []
+        for _ in range(num_attributes):
+            floors = rng.integers(0, 2, 3)
+            constraints.append((floors, floors + rng.integers(0, 3, 3)))
+
+        def satisfies(selected, floors_too):
+            for attribute, (floors, ceils) in enumerate(constraints):
+                counts = np.bincount(groups[list(selected), attribute], minlength=3)
+                if (counts > ceils).any() or (floors_too and (counts < floors).any()):
+                    return False
+            return True
+
+        feasible = [selected for selected in itertools.combinations(range(9), K) if satisfies(selected, True)]
+        selected = intersectional_top_k(scores, groups, K, constraints).tolist()
+        assert satisfies(selected, False)
+        assert scores[selected].tolist() == sorted(scores[selected].tolist(), reverse=True)
+        if num_attributes == 2 and feasible:
+            # Exact for two attributes
+            assert satisfies(selected, True) and len(selected) == K
+            assert scores[selected].sum() == pytest.approx(max(scores[list(s)].sum() for s in feasible))
+
+
+def test_intersectional_dataset():
+    df = pd.read_csv("datasets/Netflix TV Shows and Movies Binned.csv")
+    dataset = build_dataset(df, "imdb_score", ["age_certification", "release_decade"])
+    table, labels = attribute_groups(dataset.categories)
+    groups = table[dataset.codes]
+    counts = attribute_counts(groups, [len(attribute_labels) for attribute_labels in labels])
+    assert [sum(attribute_counts.values()) for attribute_counts in counts] == [len(dataset)] * 2
+
+    diversity_constraints = [{label: (2, 6) for label in attribute_labels} for attribute_labels in labels]
+    selected = intersectional_diverse_top_k(dataset.items(), 40, diversity_constraints)
+    assert len(selected) == 40
+    chosen = df.loc[selected]
+    for column, attribute_labels in zip(["age_certification", "release_decade"], labels):
+        group_counts = chosen[column].fillna("Other").value_counts()
+        assert len(group_counts) == len(attribute_labels)
+        assert group_counts.min() >= 2 and group_counts.max() <= 6
@@ -0,0 +1,49 @@
+import random
+
+import pytest
+
+from topk.items import ItemStore
+from topk.online import online_diverse_selection, online_diverse_selection_store
+from topk.static import diverse_top_k, diverse_top_k_store
+
+
+@pytest.mark.parametrize("K", [5, 20, 40])
+def test_store_matches_tuple_api(K, astronauts):
+    items = list(zip(astronauts['Space Flight (hr)'], astronauts['Undergraduate Major'].fillna("Other"),
+                     astronauts.index))
+
+    store = ItemStore.from_items(items)
+    assert store.items() == items
+
+    categories = set(store.categories)
+    diversity_constraints = {category: (1 if i % 3 == 0 else 0, 3) for i, category in enumerate(categories)}
+    floors, ceils = store.compile_constraints(diversity_constraints, by_label=True)
+
+    ordered = sorted(items, key=lambda x: x[0], reverse=True)
+    assert diverse_top_k_store(store, K, floors, ceils).tolist() == diverse_top_k(ordered, K, diversity_constraints)
+
+    random.seed(K)
+    random.shuffle(items)
+    store = ItemStore.from_items(items)
+    floors, ceils = store.compile_constraints(diversity_constraints, by_label=True)
+    assert (online_diverse_selection_store(store, K, floors, ceils)
+            == online_diverse_selection(items, K, diversity_constraints))
+
+
+def test_tuple_api_reads_iterators(astronaut_items, astronaut_counts):
+    diversity_constraints = {category: (1, 4) for category in astronaut_counts}
+    ordered = sorted(astronaut_items, key=lambda x: x[0], reverse=True)
+    assert diverse_top_k(iter(ordered), 20, diversity_constraints) == diverse_top_k(ordered, 20, diversity_constraints)
+
+    random.Random(1).shuffle(astronaut_items)
+    expected = online_diverse_selection(astronaut_items, 20, diversity_constraints)
+    consumed = []
+
+    def arrivals():
+        for item in astronaut_items:
+            consumed.append(item)
+            yield item
+
+    # With the counts given there is no counting pass, and the items after total_seen are never read
+    assert online_diverse_selection(arrivals(), 20, diversity_constraints, category_count=astronaut_counts) == expected
+    assert len(consumed) == expected[1]
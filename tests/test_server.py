@@ -0,0 +1,128 @@
+import concurrent.futures
+import socket
+import threading
+
+import pytest
+
+from topk.diversity_metrics import ConstraintPlanner
+from topk.server import LocalTopKClient, TopKClient, TopKServer, TopKService, connect, main
+from topk.simulation import estimate_online
+from topk.static import diverse_top_k_arrays
+
+
+@pytest.fixture
+def server(tmp_path):
+    with TopKServer(("127.0.0.1", 0), TopKService(data_roots=[tmp_path]), workers=4) as server:
+        thread = threading.Thread(target=server.serve_forever)
+        thread.start()
+        try:
+            yield server
+        finally:
+            server.shutdown()
+            thread.join()
+
+
+def test_queries(server, astronaut_dataset, astronauts_csv):
+    client = TopKClient(server.url)
+    description = client.load("nasa", str(astronauts_csv), "Space Flight (hr)", ["Undergraduate Major"],
+                              {"Undergraduate Major": 9})
+    assert description["N"] == len(astronaut_dataset)
+    assert description["counts"] == astronaut_dataset.counts.tolist()
+    assert list(client.datasets()) == ["nasa"]
+
+    planner = ConstraintPlanner(astronaut_dataset.category_count())
+    for family, t in [("average", None), ("relaxed_proportion", 3)]:
+        floors, ceils = planner.bounds(family, 20, t, 0)
+        assert client.constraints("nasa", 20, family, t) == {"floors": floors.tolist(), "ceils": ceils.tolist()}
+
+        constraints = dict(enumerate(zip(floors.tolist(), ceils.tolist())))
+        selected = diverse_top_k_arrays(astronaut_dataset.scores, astronaut_dataset.codes, 20, constraints)
+        expected = astronaut_dataset.ids[selected]
+        result = client.top_k("nasa", 20, family, t)
+        assert result["ids"] == expected.tolist()
+        assert result["utility"] == pytest.approx(astronaut_dataset.scores[selected].sum())
+
+    floors = [1] * len(astronaut_dataset.categories)
+    ceils = [3] * len(astronaut_dataset.categories)
+    estimate = client.online("nasa", 10, floors=floors, ceils=ceils, warmup_ratio=0.25)
+    assert estimate == estimate_online(astronaut_dataset.scores, astronaut_dataset.codes, 10,
+                                       dict(enumerate(zip(floors, ceils))), 0.25)
+
+
+def test_cache_and_concurrency(server, astronauts_csv):
+    client = TopKClient(server.url)
+    client.load("nasa", str(astronauts_csv), "Space Flight (hr)", ["Undergraduate Major"])
+    first = client.top_k("nasa", 15, "proportion")
+    with concurrent.futures.ThreadPoolExecutor(8) as executor:
+        results = list(executor.map(lambda _: client.top_k("nasa", 15, "proportion"), range(32)))
+    assert all(result == first for result in results)
+    stats = client.stats()
+    assert stats["hits"] >= 32
+
+    # Loading the name again must not serve the old results
+    client.load("nasa", str(astronauts_csv), "Space Flight (hr)", ["Undergraduate Major"],
+                {"Undergraduate Major": 3})
+    assert client.top_k("nasa", 15, "proportion") != first
+
+
+@pytest.mark.parametrize("local", [False, True])
+def test_errors(local, server, astronauts_csv):
+    client = LocalTopKClient() if local else TopKClient(server.url)
+    with pytest.raises(ValueError, match="unknown dataset"):
+        client.top_k("missing", 10, "average")
+    # K with no category able to take the extra slots
+    client.load("nasa", str(astronauts_csv), "Space Flight (hr)", ["Undergraduate Major"],
+                {"Undergraduate Major": 9})
+    with pytest.raises(ValueError, match="no category has enough items"):
+        client.top_k("nasa", 200, "minimum")
+    with pytest.raises(ValueError, match="no route"):
+        client._call("/nothing")
+
+
+def test_local_client_matches_server(server, astronauts_csv):
+    remote = TopKClient(server.url)
+    local = LocalTopKClient()
+    for client in (remote, local):
+        client.load("nasa", str(astronauts_csv), "Space Flight (hr)", ["Undergraduate Major"],
+                    {"Undergraduate Major": 9})
+    assert local.datasets() == remote.datasets()
+    assert local.constraints("nasa", 20, "relaxed_average", 3) == remote.constraints("nasa", 20, "relaxed_average", 3)
+    assert local.top_k("nasa", 20, "proportion") == remote.top_k("nasa", 20, "proportion")
+    assert local.online("nasa", 10, "average", warmup_ratio=0.25) == remote.online("nasa", 10, "average",
+                                                                                   warmup_ratio=0.25)
+
+
+def test_connect_falls_back_to_local(server):
+    client = connect(server.url, timeout=30.0)
+    assert type(client) is TopKClient
+    # The short probe timeout is only used for the check
+    assert client.timeout == 30.0
+
+    # A bound port nobody listens on
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        assert isinstance(connect(f"http://127.0.0.1:{sock.getsockname()[1]}"), LocalTopKClient)
+
+
+def test_loads_only_from_data_roots(server, astronauts_csv, tmp_path_factory):
+    client = TopKClient(server.url)
+    outside = tmp_path_factory.mktemp("outside") / "astronauts.csv"
+    outside.write_bytes(astronauts_csv.read_bytes())
+    with pytest.raises(ValueError, match="PermissionError"):
+        client.load("nasa", str(outside), "Space Flight (hr)", ["Undergraduate Major"])
+    # Relative paths and symlinks are resolved before the check
+    link = astronauts_csv.parent / "link.csv"
+    link.symlink_to(outside)
+    with pytest.raises(ValueError, match="PermissionError"):
+        client.load("nasa", str(link), "Space Flight (hr)", ["Undergraduate Major"])
+    with pytest.raises(ValueError, match="PermissionError"):
+        client.load("nasa", str(astronauts_csv.parent / ".." / outside.parent.name / "astronauts.csv"),
+                    "Space Flight (hr)", ["Undergraduate Major"])
+    assert client.datasets() == {}
+
+
+def test_refuses_remote_hosts():
+    with pytest.raises(ValueError, match="not a loopback host"):
+        TopKServer(("0.0.0.0", 0))
+    with pytest.raises(SystemExit):
+        main(["--host", "0.0.0.0", "--port", "0"])
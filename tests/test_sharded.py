@@ -0,0 +1,22 @@
+import numpy as np
+import pytest
+
+from topk.sharded import merge_summaries, shard_summary, sharded_diverse_top_k
+from topk.static import diverse_top_k_arrays
+
+
+@pytest.mark.parametrize("num_shards", [1, 3, 7])
+def test_sharded_matches_diverse_top_k_arrays(num_shards):
+    rng = np.random.default_rng(num_shards)
+    scores = rng.integers(0, 50, 1000).astype(float)
+    categories = rng.integers(0, 6, 1000)
+    diversity_constraints = {0: (2, 4), 1: (0, 3), 2: (1, 1), 3: (0, 0), 4: (3, 10), 5: (1, 6)}
+    expected = diverse_top_k_arrays(scores, categories, 15, diversity_constraints)
+
+    bounds = np.linspace(0, len(scores), num_shards + 1).astype(int)
+    summaries = [shard_summary(scores[start:end], categories[start:end], diversity_constraints, start)
+                 for start, end in zip(bounds[:-1], bounds[1:])]
+    assert sum(len(summary[0]) for summary in summaries) <= num_shards * 24
+    assert merge_summaries(summaries, 15, diversity_constraints).tolist() == expected.tolist()
+    assert sharded_diverse_top_k(scores, categories, 15, diversity_constraints, num_shards=num_shards,
+                                 max_workers=2).tolist() == expected.tolist()
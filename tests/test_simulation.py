@@ -0,0 +1,116 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import topk.diversity_metrics as diversity_metrics
+from topk.diversity_metrics import ConstraintPlanner
+from topk.online import online_diverse_selection
+from topk.simulation import approximate_online, estimate_online, simulate_online
+
+K = 10
+
+
+@pytest.mark.parametrize("warmup_ratio", [1, 0.25, 1 / 16])
+def test_simulate_online_matches_sequential(warmup_ratio, astronauts):
+    codes, _ = pd.factorize(astronauts['Major Category'])
+    scores = astronauts['Space Flight (hr)'].to_numpy(dtype=float)
+
+    counts = {code: int((codes == code).sum()) for code in np.unique(codes).tolist()}
+    diversity_constraints = diversity_metrics.assign_average_diversity(K, counts)
+
+    rng = np.random.default_rng(0)
+    permutations = np.array([rng.permutation(len(scores)) for _ in range(20)])
+    selections, walking_distances, accuracies = simulate_online(
+        scores, codes, K, diversity_constraints, permutations, warmup_ratio, block_size=7)
+
+    for permutation, selection, walking_distance, accuracy in zip(permutations, selections, walking_distances,
+                                                                  accuracies):
+        items = [(scores[i], codes[i], i) for i in permutation]
+        expected, total_seen = online_diverse_selection(items, K, diversity_constraints, warmup_ratio)
+        assert selection[selection >= 0].tolist() == expected
+        assert walking_distance == total_seen
+        assert np.isnan(accuracy) == (len(expected) < K)
+
+
+def simulated_means(scores, codes, K, diversity_constraints, warmup_ratio, runs=2000):
+    """
+    :return: Tuple (mean accuracy of the complete runs, its standard error, mean walking distance, its standard
+    error, completion rate) of independent simulated arrival orders.
+    """
+    rng = np.random.default_rng(123)
+    permutations = np.array([rng.permutation(len(scores)) for _ in range(runs)])
+    _, walking_distances, accuracies = simulate_online(scores, codes, K, diversity_constraints, permutations,
+                                                       warmup_ratio)
+    complete = accuracies[~np.isnan(accuracies)]
+    if not len(complete):
+        complete = np.array([np.nan])
+    return (complete.mean(), complete.std() / np.sqrt(len(complete)), walking_distances.mean(),
+            walking_distances.std() / np.sqrt(runs), np.isfinite(accuracies).mean())
+
+
+
+@pytest.mark.parametrize("K", [5, 20, 40])
+@pytest.mark.parametrize("family, t", [("minimum", None), ("average", None), ("proportion", None),
+                                       ("relaxed_average", 3), ("relaxed_proportion", 3)])
+@pytest.mark.parametrize("method, warmup_ratio", [("normal", 1), ("normal", 0.25), ("hoeffding", 1 / 16)])
+def test_estimate_online_agrees_with_simulation(method, warmup_ratio, family, t, K, astronauts):
+    codes, _ = pd.factorize(astronauts['Major Category'])
+    scores = astronauts['Space Flight (hr)'].to_numpy(dtype=float)
+    planner = ConstraintPlanner({code: int((codes == code).sum()) for code in np.unique(codes).tolist()})
+    try:
+        diversity_constraints = planner.constraints(family, K, t, seed=0)
+    except ValueError:
+        pytest.skip(f"no {family} constraints for K={K}")
+
+    estimate = estimate_online(scores, codes, K, diversity_constraints, warmup_ratio, tolerance=0.03, method=method)
+    accuracy, accuracy_error, walking_distance, walking_distance_error, completion_rate = simulated_means(
+        scores, codes, K, diversity_constraints, warmup_ratio)
+    if method == "hoeffding":
+        assert estimate["accuracy_error"] <= 0.03 or estimate["completion_rate"] < 1
+        assert estimate["walking_distance_error"] <= 0.03 * len(scores)
+
+    # Within the stated half-widths, up to the error of the independent means
+    if np.isnan(accuracy):
+        assert np.isnan(estimate["accuracy"])
+    else:
+        assert abs(estimate["accuracy"] - accuracy) <= estimate["accuracy_error"] + 3 * accuracy_error
+    assert abs(estimate["walking_distance"] - walking_distance) <= (estimate["walking_distance_error"]
+                                                                     + 3 * walking_distance_error)
+    assert estimate["completion_rate"] == pytest.approx(completion_rate, abs=0.05)
+
+
+@pytest.mark.parametrize("warmup_ratio", [1, 0.25, 1 / 16])
+@pytest.mark.parametrize("family, K", [("minimum", 5), ("minimum", 9), ("average", 9), ("average", 20),
+                                       ("average", 40), ("proportion", 9), ("relaxed_average", 5),
+                                       ("relaxed_proportion", 9)])
+def test_approximate_online_agrees_with_simulation(family, K, warmup_ratio, astronauts):
+    codes, _ = pd.factorize(astronauts['Major Category'])
+    scores = astronauts['Space Flight (hr)'].to_numpy(dtype=float)
+    planner = ConstraintPlanner({code: int((codes == code).sum()) for code in np.unique(codes).tolist()})
+    diversity_constraints = planner.constraints(family, K, 3 if family.startswith("relaxed") else None, seed=0)
+
+    estimate = approximate_online(scores, codes, K, diversity_constraints, warmup_ratio)
+    accuracy, accuracy_error, walking_distance, walking_distance_error, _ = simulated_means(
+        scores, codes, K, diversity_constraints, warmup_ratio, runs=4000)
+    # Within the error approximate_online states, up to the error of the simulated means
+    assert abs(estimate["accuracy"] - accuracy) <= 0.011 + 3 * accuracy_error
+    assert abs(estimate["walking_distance"] - walking_distance) <= 0.009 * len(scores) + 3 * walking_distance_error
+
+
+def test_approximate_online_needs_floors_up_to_K(astronauts):
+    codes, _ = pd.factorize(astronauts['Major Category'])
+    scores = astronauts['Space Flight (hr)'].to_numpy(dtype=float)
+    diversity_constraints = {code: (0, 5) for code in np.unique(codes).tolist()}
+    with pytest.raises(ValueError):
+        approximate_online(scores, codes, 10, diversity_constraints)
+
+
+def test_estimate_online_infeasible(astronauts):
+    codes, _ = pd.factorize(astronauts['Major Category'])
+    scores = astronauts['Space Flight (hr)'].to_numpy(dtype=float)
+    diversity_constraints = {code: (0, 1) for code in np.unique(codes).tolist()}
+
+    estimate = estimate_online(scores, codes, len(diversity_constraints) + 1, diversity_constraints)
+    assert np.isnan(estimate["accuracy"])
+    assert estimate["walking_distance"] == len(scores)
+    assert estimate["completion_rate"] == 0 and estimate["runs"] == 0
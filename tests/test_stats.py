@@ -0,0 +1,80 @@
+import random
+
+import numpy as np
+
+from topk.diversity_metrics import assign_proportion_diversity
+from topk.items import ItemStore
+from topk.online import OnlineDiverseSelector, online_diverse_selection, online_diverse_selection_store
+from topk.static import diverse_top_k, diverse_top_k_arrays
+from topk.stats import BRANCHES, SelectionStats
+
+
+def test_static_stats(astronaut_items, astronaut_counts):
+    diversity_constraints = assign_proportion_diversity(20, astronaut_counts)
+    reports = []
+    stats = SelectionStats(callback=reports.append)
+
+    ordered = sorted(astronaut_items, key=lambda x: x[0], reverse=True)
+    selected = diverse_top_k(ordered, 20, diversity_constraints, stats)
+    assert reports == [stats]
+    assert stats.branches["floor"] + stats.branches["slack"] == len(selected)
+    assert stats.items_seen == stats.branches["floor"] + stats.branches["slack"] + stats.branches["rejected"]
+    assert stats.accepted == {
+        category: sum(item[1] == category and item[2] in selected for item in astronaut_items)
+        for category in stats.accepted}
+    assert set(stats.timings) == {"scan"}
+
+    store = ItemStore.from_items(astronaut_items)
+    array_stats = SelectionStats()
+    diversity_codes = {code: diversity_constraints[category] for code, category in enumerate(store.categories)}
+    diverse_top_k_arrays(store.scores, store.codes, 20, diversity_codes, array_stats)
+    assert {store.categories[code]: count for code, count in array_stats.accepted.items()} == stats.accepted
+    assert array_stats.items_seen == len(astronaut_items)
+    assert set(array_stats.timings) == {"group", "candidates", "merge"}
+
+
+def test_online_stats(astronaut_items, astronaut_counts):
+    random.Random(0).shuffle(astronaut_items)
+    diversity_constraints = assign_proportion_diversity(10, astronaut_counts)
+
+    stats = SelectionStats()
+    selected, seen = online_diverse_selection(astronaut_items, 10, diversity_constraints, stats=stats)
+    assert stats.as_dict()["items_seen"] == seen
+    assert sum(stats.branches[branch] for branch in BRANCHES) == seen
+    assert sum(stats.branches[branch] for branch in ("floor", "slack", "fallback")) == len(selected)
+    assert sum(stats.accepted.values()) == len(selected)
+    assert set(stats.accepted) <= set(diversity_constraints)
+    assert stats.heap_pops <= len(selected)
+    assert stats.heap_pushes >= stats.heap_pops
+
+    # Streaming reports add up, and the batch path counts the same as item by item processing
+    streaming = SelectionStats()
+    selector = OnlineDiverseSelector(10, diversity_constraints, astronaut_counts, stats=streaming)
+    for item in astronaut_items[:100]:
+        selector.offer(*item)
+    selector.report_stats()
+    for item in astronaut_items[100:]:
+        selector.offer(*item)
+    selector.report_stats()
+
+    store = ItemStore.from_items(astronaut_items)
+    floors, ceils = store.compile_constraints(diversity_constraints, by_label=True)
+    batch = SelectionStats()
+    online_diverse_selection_store(store, 10, floors, ceils, batch_size=64, stats=batch)
+    for other in (streaming, batch):
+        assert other.branches == stats.branches
+        assert (other.heap_pushes, other.heap_pops, other.items_seen) == (
+            stats.heap_pushes, stats.heap_pops, stats.items_seen)
+    # Every path counts the accepted items by label
+    assert streaming.accepted == stats.accepted
+    assert batch.accepted == stats.accepted
+    assert streaming.runs == 2 and batch.runs == 1
+
+
+def test_selection_without_stats(astronaut_items, astronaut_counts):
+    diversity_constraints = assign_proportion_diversity(10, astronaut_counts)
+    selector = OnlineDiverseSelector(10, diversity_constraints, astronaut_counts)
+    for item in astronaut_items:
+        selector.offer(*item)
+    assert selector.report_stats() is None
+    assert isinstance(diverse_top_k_arrays(np.arange(5.0), np.zeros(5, dtype=int), 2, {0: (0, 3)}), np.ndarray)
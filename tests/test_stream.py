@@ -0,0 +1,101 @@
+import io
+
+import numpy as np
+import pytest
+
+import topk.diversity_metrics as diversity_metrics
+from topk.dataset import build_dataset
+from topk.online import online_diverse_selection
+from topk.static import diverse_top_k
+from topk.stream import (RECORD_DTYPE, ItemStreamReader, ItemStreamWriter, diverse_top_k_stream,
+                         online_diverse_selection_stream, write_store)
+from topk.synthetic import generate, write_stream
+
+
+@pytest.fixture
+def dataset(astronauts):
+    return build_dataset(astronauts, "Space Flight (hr)", ["Undergraduate Major"])
+
+
+def test_round_trip(dataset, tmp_path):
+    path = tmp_path / "items.topk"
+    write_store(path, dataset)
+    with ItemStreamReader(path) as reader:
+        assert reader.categories == dataset.categories
+        assert reader.counts.tolist() == dataset.counts.tolist()
+        assert len(reader) == len(dataset)
+        store = reader.store()
+        assert store.items() == dataset.items()
+        chunks = list(reader.chunks(100))
+    assert np.concatenate([scores for scores, _, _ in chunks]).tolist() == dataset.scores.tolist()
+    assert np.concatenate([ids for _, _, ids in chunks]).tolist() == dataset.ids.tolist()
+
+
+def test_counts_patched_on_close(tmp_path):
+    path = tmp_path / "items.topk"
+    write_stream(path, 10000, chunk_size=999, d=7, seed=3)
+    scores, codes, ids = generate(10000, d=7, seed=3)
+    with ItemStreamReader(path) as reader:
+        assert reader.categories == list(range(7))
+        assert reader.counts.tolist() == np.bincount(codes, minlength=7).tolist()
+        records = reader.memmap()
+        assert records["score"].tolist() == scores.tolist()
+        assert records["code"].tolist() == codes.tolist()
+
+
+def test_writer_errors(tmp_path):
+    with pytest.raises(ValueError):
+        ItemStreamWriter(tmp_path / "a.topk", ["a", "b"]).write([1.0], [2], [0])
+    with pytest.raises(ValueError):
+        with ItemStreamWriter(tmp_path / "b.topk", ["a", "b"], counts=[1, 1]) as writer:
+            writer.write([1.0], [0], [0])
+    with pytest.raises(ValueError):
+        ItemStreamReader(io.BytesIO(b"not a stream at all, really"))
+    # The error cutting the stream short propagates, not a count mismatch
+    with pytest.raises(KeyError):
+        with ItemStreamWriter(tmp_path / "c.topk", ["a", "b"], counts=[1, 1]) as writer:
+            writer.write([1.0], [0], [0])
+            raise KeyError("b")
+    assert writer.closed
+
+
+def test_records_aligned(tmp_path):
+    assert RECORD_DTYPE.itemsize == 24
+    assert all(RECORD_DTYPE.fields[name][1] % 8 == 0 for name in ("score", "id"))
+    path = tmp_path / "items.topk"
+    write_stream(path, 100, d=3, seed=0)
+    with ItemStreamReader(path) as reader:
+        assert reader.offset % 8 == 0
+        assert reader.store().items() == list(zip(*(array.tolist() for array in generate(100, d=3, seed=0))))
+
+
+@pytest.mark.parametrize("K", [10, 40])
+def test_static_selection(dataset, tmp_path, K):
+    path = tmp_path / "items.topk"
+    write_store(path, dataset)
+    diversity_constraints = diversity_metrics.assign_average_diversity(K, dict(
+        zip(dataset.categories, dataset.counts.tolist())))
+    expected = diverse_top_k(sorted(dataset.items(), key=lambda x: x[0], reverse=True), K, diversity_constraints)
+    assert diverse_top_k_stream(path, K, diversity_constraints, chunk_size=64) == expected
+
+
+@pytest.mark.parametrize("warmup_ratio", [1.0, 0.25])
+def test_online_selection_stops_reading(dataset, warmup_ratio):
+    K = 20
+    # Non seekable streams need the counts up front, BytesIO stands for a pipe here
+    buffer = io.BytesIO()
+    write_store(buffer, dataset)
+    diversity_constraints = diversity_metrics.assign_minimum_diversity(K, dict(
+        zip(dataset.categories, dataset.counts.tolist())))
+    expected = online_diverse_selection(dataset.items(), K, diversity_constraints, warmup_ratio)
+
+    buffer.seek(0)
+    chunk_size = 32
+    selected, total_seen = online_diverse_selection_stream(buffer, K, diversity_constraints, warmup_ratio,
+                                                           chunk_size)
+    assert (selected, total_seen) == expected
+    assert total_seen < len(dataset)
+    with ItemStreamReader(io.BytesIO(buffer.getvalue())) as reader:
+        offset = reader.offset
+    read = (buffer.tell() - offset) // RECORD_DTYPE.itemsize
+    assert read == min(-(-total_seen // chunk_size) * chunk_size, len(dataset))
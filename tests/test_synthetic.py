@@ -0,0 +1,46 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from topk import synthetic
+
+ATTRIBUTES = [(4, 1.0), (7, 0.5)]
+
+
+def test_chunking_does_not_change_items():
+    whole = synthetic.generate(150_000, d=20, skew=1.5, decimals=2, seed=1)
+    chunks = list(synthetic.generate_chunks(150_000, d=20, skew=1.5, decimals=2, seed=1, chunk_size=40_000))
+    assert [len(chunk[0]) for chunk in chunks] == [40_000, 40_000, 40_000, 30_000]
+    for array, chunked in zip(whole, zip(*chunks)):
+        assert np.array_equal(array, np.concatenate(chunked))
+
+    scores, codes, ids = whole
+    assert np.array_equal(ids, np.arange(150_000))
+    assert np.all(np.diff(np.bincount(codes)[:5]) < 0)  # Zipf sizes
+    assert len(np.unique(scores)) <= 101
+
+
+def test_intersectional_categories(tmp_path):
+    scores, codes, _ = synthetic.generate(1000, attributes=ATTRIBUTES, scores="lognormal")
+    groups = synthetic.split_categories(codes, ATTRIBUTES)
+    assert groups[:, 0].max() < 4 and groups[:, 1].max() < 7
+    assert np.array_equal(synthetic.intersect_categories(groups, ATTRIBUTES), codes)
+
+    path = tmp_path / "items.csv"
+    synthetic.write_csv(path, 1000, chunk_size=300, attributes=ATTRIBUTES, scores="lognormal")
+    df = pd.read_csv(path)
+    assert np.array_equal(df["category"], codes)
+    assert np.array_equal(df[["attribute_0", "attribute_1"]].to_numpy(), groups)
+    assert np.allclose(df["score"], scores)
+
+    # Intersections past the int32 codes are refused instead of wrapping around
+    with pytest.raises(ValueError, match="int32"):
+        synthetic.generate(10, attributes=[(1 << 16, 0.0), (1 << 16, 0.0)])
+
+
+def test_arrival_orders():
+    scores, codes, _ = synthetic.generate(500, d=5)
+    for order in synthetic.ARRIVAL_ORDERS:
+        assert sorted(synthetic.arrival_order(scores, codes, order)) == list(range(500))
+    assert np.all(np.diff(scores[synthetic.arrival_order(scores, codes, "ascending")]) >= 0)
+    assert np.all(np.diff(codes[synthetic.arrival_order(scores, codes, "category_blocks")]) >= 0)